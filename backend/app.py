@@ -3,18 +3,93 @@
 エンドポイント:
   GET /       : フロントエンド配信
   GET /sketch.js : p5.jsスクリプト
-  WS  /ws     : ポーズ分類WebSocket（同一オリジン）
+  WS  /ws     : ポーズ分類WebSocket（同一オリジン）。?match=<試合ID>（?room= も可）&player=P1|P2
+                受け取った確定ポーズで game_state.py の試合を進め、game_state / game_event を返す
+                &updates=change で game_state を変化時 + 1秒ごとのハートビートだけにする（既定は毎ティック）
+                どのメッセージにも接続ごとの通し番号 seq が付く（飛んだら取りこぼし）
+                形式はサブプロトコル gafa.json / gafa.msgpack / gafa.packed（または ?codec=）で選ぶ（wire_codec.py）
   WS  /test   : テスト用WebSocket（カメラ不要）
+  GET /rooms  : 部屋の一覧（P1/P2 の埋まり・観戦者数・ティック処理時間・入力から配信までの時間）
+  POST /rooms : 新しい部屋の ID を払い出す（{"round_seconds": 60}、省略可）。/ws?room=<ID> で入る
+  GET /metrics : 処理時間(p50/p95/p99)・メッセージレート・接続数（POSE_METRICS=0 で無効）
+
+試合と接続の対応は matches.py。同じエンドポイントの asyncio 版は app_async.py。
 """
 
-from flask import Flask, render_template_string, send_from_directory
+from flask import Flask, jsonify, render_template_string, request, send_from_directory
 from flask_sock import Sock
+import collections
 import json
+import os
+import sys
+import threading
 import time
 
+# リポジトリのルートから backend.app として読み込まれても（gunicorn backend.app:app）、
+# 同じディレクトリのモジュールをフラットに import できるようにする
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
+
+from game_state import ROUND_SECONDS  # noqa: E402
+from matches import create_room, handle_message, join_match, leave_match, list_rooms, track_client  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from wire_codec import CODEC_JSON, SUBPROTOCOLS, negotiate, with_seq  # noqa: E402
+
 app = Flask(__name__)
+# クライアントが new WebSocket(url, ["gafa.packed", ...]) で希望したコーデックを受ける
+app.config['SOCK_SERVER_OPTIONS'] = {'subprotocols': SUBPROTOCOLS}
 sock = Sock(app)
 
+class ClientChannel:
+    """1接続分の送信キュー。ティックスレッドは put するだけで、送信は接続ごとの送信スレッドが行う。
+    遅いクライアントのキューがあふれたら古いメッセージから捨てる。
+    changes_only なら changed=False のメッセージ（内容の変わらない game_state）は積まない。
+    codec は接続時に選ばれた送信形式（wire_codec.py）。"""
+
+    def __init__(self, ws, maxlen=120, changes_only=False, codec=CODEC_JSON):
+        self.ws = ws
+        self.changes_only = changes_only
+        self.codec = codec
+        self.seq = 0
+        self._queue = collections.deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self.closed = False
+        self._thread = threading.Thread(target=self._sender, daemon=True)
+        self._thread.start()
+
+    def put(self, message, changed=True):
+        if self.changes_only and not changed:
+            return
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                METRICS.inc("dropped_messages")
+            self._queue.append(message)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def _sender(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    return
+                message = self._queue.popleft()
+            # エンコード結果は全接続で共有なので、送る直前に seq だけを差し込む
+            self.seq += 1
+            message = with_seq(message.encode(self.codec), self.seq)
+            try:
+                with METRICS.timer("ws_send"):
+                    self.ws.send(message)
+            except Exception:
+                return
+
+
 @app.route('/')
 def index():
     return send_from_directory('frontend', 'index.html')
@@ -23,10 +98,26 @@ def index():
 def sketch_js():
     return send_from_directory('frontend', 'sketch.js')
 
+@app.route('/metrics')
+def metrics():
+    return jsonify(METRICS.snapshot())
+
+@app.route('/rooms', methods=['GET', 'POST'])
+def rooms():
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            room_id = create_room(int(body.get("round_seconds", ROUND_SECONDS)))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({"room": room_id, "ws": f"/ws?room={room_id}"}), 201
+    return jsonify({"rooms": list_rooms()})
+
 @sock.route('/test')
 def test_websocket(ws):
     """テスト用WebSocket - カメラ不要"""
     print("Test WebSocket connected!")
+    track_client("test", 1)
     
     try:
         ws.send(json.dumps({"pose": "IDLE", "status": "test_connected"}))
@@ -40,20 +131,30 @@ def test_websocket(ws):
                 "status": "test_mode",
                 "count": i
             }
-            ws.send(json.dumps(payload))
+            with METRICS.timer("ws_send"):
+                ws.send(json.dumps(payload))
             print(f"Test message {i}: {pose}")
             time.sleep(2)  # 2秒間隔
             
     except Exception as e:
         print(f"Test WebSocket error: {e}")
+    finally:
+        track_client("test", -1)
 
 @sock.route('/ws')
 def pose_websocket(ws):
     """実際のポーズ検出WebSocket"""
-    print("Pose WebSocket connected!")
-    
+    codec = negotiate(ws.subprotocol, request.args.get("codec"))
+    print(f"Pose WebSocket connected! (codec={codec})")
+    track_client("ws", 1)
+    match_id = request.args.get("room") or request.args.get("match", "default")
+    wanted = {"P1": 0, "P2": 1}.get(request.args.get("player", "").upper())
+    channel = None
+    seat = None
+
     try:
-        ws.send(json.dumps({"pose": "IDLE", "status": "connected"}))
+        channel = ClientChannel(ws, changes_only=request.args.get("updates") == "change", codec=codec)
+        seat = join_match(match_id, channel, wanted)
         
         # メッセージ受信ループ
         while True:
@@ -63,20 +164,19 @@ def pose_websocket(ws):
                 break # 接続が切れたらループを抜ける
 
             # 受信したメッセージを処理
-            data = json.loads(message)
-            if 'pose' in data:
-                # ここでゲームロジックなどを実行できる
-                print(f"Received pose from client: {data['pose']}")
-                
-                # 他のクライアントにブロードキャストするなどの処理も可能
-                # ws.send(...) 
-            
+            handle_message(seat, message)
     except Exception as e:
         print(f"Pose WebSocket error: {e}")
     finally:
+        if channel is not None:
+            channel.close()
+        if seat is not None:
+            leave_match(seat)
+        track_client("ws", -1)
         print("Pose WebSocket disconnected.")
 
 if __name__ == "__main__":
     print("Starting integrated Pose Duel server...")
-    print("Access: http://127.0.0.1:5000")
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    port = int(os.environ.get("PORT", "5000"))
+    print(f"Access: http://127.0.0.1:{port}")
+    app.run(host="127.0.0.1", port=port, debug=True)
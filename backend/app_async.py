@@ -0,0 +1,238 @@
+"""asyncio 版サーバー（aiohttp）。app.py と同じエンドポイントを1スレッドのイベントループで扱う
+
+app.py（flask_sock）は接続ごとに OS スレッドを1本使い、送信が詰まるとそのスレッドが止まる。
+こちらは接続をコルーチンで持つので、待機中・低速の接続が数千あっても1プロセスで扱える。
+
+エンドポイント（app.py と同じ）:
+  GET /          : フロントエンド配信
+  GET /sketch.js : p5.jsスクリプト
+  GET /metrics   : 処理時間(p50/p95/p99)・メッセージレート・接続数
+  WS  /ws        : ?match=<試合ID>&player=P1|P2&updates=change（matches.py / game_state.py）
+                   形式はサブプロトコル gafa.json / gafa.msgpack / gafa.packed（または ?codec=）で選ぶ
+  WS  /test      : テスト用WebSocket（カメラ不要）
+  GET/POST /rooms: 部屋の一覧 / 新しい部屋の ID の払い出し（matches.py）
+
+送信の流れ:
+- 試合のティックスレッドは AsyncChannel.put でキューに積むだけ（ブロックしない）。
+  イベントループを起こすのはキューが空から埋まったときの1回だけで、まとめて送る。
+- 接続ごとの送信タスクが await で送る。カーネルの送信バッファと aiohttp の書き込みバッファ
+  （WRITE_BUFFER_LIMIT バイト）が埋まったら、その接続の送信だけが待つ。待っている間も
+  キューは QUEUE_MAXLEN 件で古いものから捨てるので、遅いクライアントのメモリは増え続けない。
+- まとめて取り出した分の送信が SEND_TIMEOUT 秒を超えたら、その接続は閉じる（/metrics の slow_client_disconnects）。
+  期限はまとめ送り全体に1つだけ付ける（asyncio.wait_for はメッセージごとに Task を作り、負荷時にループが詰まる）。
+
+起動:
+    python app_async.py                                    # PORT（既定 5000）で待ち受け
+    gunicorn "app_async:create_app()" --bind 0.0.0.0:8000 --worker-class aiohttp.GunicornWebWorker
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+from aiohttp import WSMsgType, web
+
+# リポジトリのルートから backend.app_async として読み込まれても、同じディレクトリのモジュールを import できるようにする
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path:
+    sys.path.insert(0, _HERE)
+
+from game_state import ROUND_SECONDS  # noqa: E402
+from matches import create_room, handle_message, join_match, leave_match, list_rooms, track_client  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from wire_codec import CODEC_JSON, SUBPROTOCOLS, negotiate, with_seq  # noqa: E402
+
+# 接続ごとの書き込みバッファの上限（バイト）。超えたらクライアントが読むまで送信を待つ
+WRITE_BUFFER_LIMIT = 64 * 1024
+# 接続ごとの未送信キューの長さ（app.py の ClientChannel と同じ）
+QUEUE_MAXLEN = 120
+# まとめ送り1回分がこれより長く詰まったら接続を閉じる（秒）
+SEND_TIMEOUT = 5.0
+
+FRONTEND_DIR = "frontend"
+
+
+class AsyncChannel:
+    """1接続分の送信キュー（asyncio 版の ClientChannel）。
+
+    put はどのスレッドからでも呼べる。送信は run() のタスクが行い、
+    changes_only なら changed=False のメッセージ（内容の変わらない game_state）は積まない。
+    codec は接続時に選ばれた送信形式（wire_codec.py）。
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, loop: asyncio.AbstractEventLoop,
+                 maxlen: int = QUEUE_MAXLEN, changes_only: bool = False, codec: str = CODEC_JSON):
+        self.ws = ws
+        self.loop = loop
+        self.changes_only = changes_only
+        self.codec = codec
+        self.seq = 0
+        self.closed = False
+        self._queue: collections.deque = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._scheduled = False
+
+    def put(self, message, changed=True):
+        if self.changes_only and not changed:
+            return
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                METRICS.inc("dropped_messages")
+            self._queue.append(message)
+            # 送信タスクが既に起こされていれば、ループへの通知は省く
+            wake = not self._scheduled
+            self._scheduled = True
+        if wake:
+            try:
+                self.loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # ループ終了後
+
+    def close(self):
+        self.closed = True
+        try:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass
+
+    async def run(self):
+        """キューに積まれた分をまとめて取り出し、順に送る。"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.closed:
+                return
+            with self._lock:
+                batch = list(self._queue)
+                self._queue.clear()
+                self._scheduled = False
+            try:
+                async with asyncio.timeout(SEND_TIMEOUT):
+                    for message in batch:
+                        # エンコード結果は全接続で共有なので、送る直前に seq だけを差し込む
+                        self.seq += 1
+                        message = with_seq(message.encode(self.codec), self.seq)
+                        send = self.ws.send_str if isinstance(message, str) else self.ws.send_bytes
+                        started = time.perf_counter()
+                        await send(message)
+                        METRICS.observe("ws_send", time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                METRICS.inc("slow_client_disconnects")
+                await self.ws.close()
+                return
+            except (ConnectionError, RuntimeError):
+                return
+
+
+def _websocket() -> web.WebSocketResponse:
+    # 同じメッセージを全接続に送るので、接続ごとの圧縮（permessage-deflate）はしない
+    # protocols はクライアントが希望できるコーデックのサブプロトコル（wire_codec.py）
+    return web.WebSocketResponse(writer_limit=WRITE_BUFFER_LIMIT, compress=False, heartbeat=30.0,
+                                 protocols=SUBPROTOCOLS)
+
+
+async def index(request):
+    return web.FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
+
+
+async def sketch_js(request):
+    return web.FileResponse(os.path.join(FRONTEND_DIR, "sketch.js"))
+
+
+async def metrics(request):
+    return web.json_response(METRICS.snapshot())
+
+
+async def rooms(request):
+    return web.json_response({"rooms": list_rooms()})
+
+
+async def create_room_handler(request):
+    try:
+        body = await request.json() if request.can_read_body else {}
+        room_id = create_room(int(body.get("round_seconds", ROUND_SECONDS)))
+    except (TypeError, ValueError, AttributeError) as e:
+        return web.json_response({"error": str(e)}, status=400)
+    return web.json_response({"room": room_id, "ws": f"/ws?room={room_id}"}, status=201)
+
+
+async def test_websocket(request):
+    """テスト用WebSocket - カメラ不要"""
+    ws = _websocket()
+    await ws.prepare(request)
+    print("Test WebSocket connected!")
+    track_client("test", 1)
+    try:
+        await ws.send_str(json.dumps({"pose": "IDLE", "status": "test_connected"}))
+        poses = ["IDLE", "PUNCH", "KICK", "GUARD"]
+        for i in range(20):  # 20回送信
+            payload = {"pose": poses[i % len(poses)], "ts": time.time(), "status": "test_mode", "count": i}
+            with METRICS.timer("ws_send"):
+                async with asyncio.timeout(SEND_TIMEOUT):
+                    await ws.send_str(json.dumps(payload))
+            await asyncio.sleep(2)  # 2秒間隔
+    except Exception as e:
+        print(f"Test WebSocket error: {e}")
+    finally:
+        track_client("test", -1)
+    await ws.close()
+    return ws
+
+
+async def pose_websocket(request):
+    """実際のポーズ検出WebSocket"""
+    ws = _websocket()
+    await ws.prepare(request)
+    codec = negotiate(ws.ws_protocol, request.query.get("codec"))
+    print(f"Pose WebSocket connected! (codec={codec})")
+    track_client("ws", 1)
+    match_id = request.query.get("room") or request.query.get("match", "default")
+    wanted = {"P1": 0, "P2": 1}.get(request.query.get("player", "").upper())
+    channel = AsyncChannel(ws, asyncio.get_running_loop(), changes_only=request.query.get("updates") == "change",
+                           codec=codec)
+    sender = asyncio.create_task(channel.run())
+    seat = None
+    try:
+        seat = join_match(match_id, channel, wanted)
+        async for message in ws:
+            if message.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                handle_message(seat, message.data)
+            elif message.type == WSMsgType.ERROR:
+                break
+    except Exception as e:
+        print(f"Pose WebSocket error: {e}")
+    finally:
+        channel.close()
+        if seat is not None:
+            leave_match(seat)
+        track_client("ws", -1)
+        await sender
+        print("Pose WebSocket disconnected.")
+    return ws
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.add_routes([
+        web.get("/", index),
+        web.get("/sketch.js", sketch_js),
+        web.get("/metrics", metrics),
+        web.get("/rooms", rooms),
+        web.post("/rooms", create_room_handler),
+        web.get("/test", test_websocket),
+        web.get("/ws", pose_websocket),
+    ])
+    return app
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", "5000"))
+    print(f"Starting asyncio Pose Duel server... http://127.0.0.1:{port}")
+    web.run_app(create_app(), host="0.0.0.0", port=port)
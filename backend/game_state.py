@@ -0,0 +1,513 @@
+"""
+サーバー側のゲーム進行（固定 60Hz ティック）
+
+確定ポーズ（pose_logic の判定 + スムージング後）を入力として、api_specification.md の
+ダメージ・攻守相性・移動キャンセル・タイマーのルールでサーバーが試合を進める。
+クライアントは結果の game_state / game_event を描画するだけになる。
+
+使い方例:
+    engine = GameEngine(on_message=lambda match, message, changed: broadcast(match.match_id, message.encode()))
+    match = engine.create_match("room1")
+    engine.start()                      # 60Hz のティックスレッドを起動
+    match.set_pose(0, "PUNCH")          # P1 の確定ポーズ（WebSocket から受け取るたびに呼ぶ）
+
+    # テスト・ベンチマーク用にスレッド無しで1ティックずつ進めることもできる
+    engine.step()
+
+[ルール]（api_specification.md 2章・4.6・5章）
+- HP 100、ラウンド 60 秒。HP 0 で KO、時間切れは残り HP で判定。
+- 攻撃は 240ms（14 ティック）。前半が発生、後半が判定のある持続部分。攻撃ポーズに切り替わった
+  瞬間に1回だけ出る（同じポーズを続けても連打にはならない）。
+- GUARD は上段 (PUNCH/KICK) を 100% 軽減、下段 (CROUCH_*) は食らう。
+  CROUCH_GUARD は下段を 100% 軽減、上段は 50% 軽減。
+- FORWARD 2px/frame、BACKWARD 1.5px/frame（相手に向かう方向が前）。
+- 移動開始から 1.5 秒以内の攻撃は移動キャンセル（発生 10% 短縮、movement_canceled イベント）。
+  しゃがみ中は CROUCH_PUNCH / CROUCH_KICK のみキャンセル可。攻撃中・ガード中・被ダメージ中は不可。
+
+[実装メモ]
+- プレイヤーの状態は __slots__ のクラスに数値で持ち、ポーズは pose_logic.POSE_CODES の整数で扱う。
+- 攻撃判定の矩形は (技, 向き) ごとに起動時に計算済み（HITBOXES）。ティック中は足し算と比較だけ。
+- ティックは固定間隔。処理が遅れたら最大 max_catchup ティックまで追いつき、それ以上は捨てて
+  game_ticks_dropped に数える。1ティックの処理時間は /metrics の game_tick で見られる。
+- 全試合を1本のティックスレッドで進める（試合ごとのスレッドは無い）。state_every > 1 のときは試合を
+  state_every 個のスロットに振り分け、game_state を送るティックを試合ごとにずらす（タイマーホイール）。
+  全試合の送信が同じティックに集中しない。
+- 試合ごとに1ティックの処理時間（tick_time）と、ポーズが変わってからそれを反映した game_state を
+  送るまでの時間（input_latency）を持つ（Match.stats()、app.py の /rooms）。
+- game_state は毎ティック作るが、on_message の changed は「タイマー以外の内容が前回から変わった」か
+  「heartbeat 秒ぶり」のときだけ True。変化だけ欲しい接続は changed=False を捨てればよい
+  （タイマーは heartbeat 間をクライアントが補間する）。
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import METRICS, Histogram
+from pose_logic import POSE_CODES
+from wire_codec import Outgoing
+
+# --- ゲームパラメータ（api_specification.md 2.1 / 2.2）---
+TICK_HZ = 60
+ROUND_SECONDS = 60
+MAX_HEALTH = 100
+STAGE_WIDTH = 1024
+GROUND_Y = 300
+
+BODY_WIDTH = 50        # fighting-game-pose の Fighter と同じ大きさ
+BODY_HEIGHT = 150
+CROUCH_HEIGHT = 90
+
+FORWARD_SPEED = 2.0
+BACKWARD_SPEED = 1.5
+
+ATTACK_TICKS = round(0.240 * TICK_HZ)                  # 攻撃持続 240ms
+ATTACK_STARTUP = 6                                       # 発生（この後から判定が出る）
+CANCEL_STARTUP = round(ATTACK_STARTUP * 0.9)             # キャンセル攻撃は 10% 速く発生
+ATTACK_COOLDOWN = 6                                      # 攻撃後のクールダウン（仕様は未定のため 100ms）
+HITSTUN_TICKS = 12                                       # 被ダメージ硬直 200ms
+CANCEL_WINDOW = round(1.5 * TICK_HZ)                     # 移動開始から 1.5 秒
+
+_P = POSE_CODES
+PUNCH, KICK, CROUCH_PUNCH, CROUCH_KICK = _P["PUNCH"], _P["KICK"], _P["CROUCH_PUNCH"], _P["CROUCH_KICK"]
+GUARD, CROUCH_GUARD = _P["GUARD"], _P["CROUCH_GUARD"]
+FORWARD, BACKWARD, CROUCH = _P["FORWARD"], _P["BACKWARD"], _P["CROUCH"]
+IDLE = _P["IDLE"]
+
+DAMAGE = {PUNCH: 20, KICK: 25, CROUCH_PUNCH: 15, CROUCH_KICK: 18}
+LOW_ATTACKS = frozenset((CROUCH_PUNCH, CROUCH_KICK))
+ATTACK_NAMES = {PUNCH: "punch", KICK: "kick", CROUCH_PUNCH: "crouch_punch", CROUCH_KICK: "crouch_kick"}
+
+# 攻撃判定: 体の前端からの距離 (near, far) と、足元からの高さ (low, high)
+_ATTACK_SHAPES = {
+    PUNCH: (0, 150, 50, 100),
+    KICK: (0, 180, 30, 90),
+    CROUCH_PUNCH: (0, 130, 0, 50),
+    CROUCH_KICK: (0, 170, 0, 35),
+}
+
+
+def _build_hitboxes() -> Dict[Tuple[int, int], Tuple[float, float, float, float]]:
+    """(技, 向き) -> 体の左端・足元 (x, y) からの相対矩形 (x0, y0, x1, y1)。y は下が+。"""
+    table = {}
+    for attack, (near, far, low, high) in _ATTACK_SHAPES.items():
+        # 右向き: 前端は x + BODY_WIDTH
+        table[(attack, 1)] = (BODY_WIDTH + near, -high, BODY_WIDTH + far, -low)
+        # 左向き: 前端は x
+        table[(attack, -1)] = (-far, -high, -near, -low)
+    return table
+
+
+HITBOXES = _build_hitboxes()
+
+# プレイヤーの行動
+ACT_IDLE, ACT_FORWARD, ACT_BACKWARD, ACT_CROUCH, ACT_GUARD, ACT_CROUCH_GUARD, ACT_ATTACK, ACT_STUN = range(8)
+
+_STATUS = {
+    ACT_IDLE: "idle",
+    ACT_FORWARD: "moving_forward",
+    ACT_BACKWARD: "moving_backward",
+    ACT_CROUCH: "crouching",
+    ACT_GUARD: "defending",
+    ACT_CROUCH_GUARD: "crouch_defending",
+    ACT_STUN: "damaged",
+}
+_POSE_NAMES = {code: name for name, code in POSE_CODES.items()}
+
+
+class Player:
+    """1プレイヤー分の状態。数値だけを持つ。"""
+
+    __slots__ = (
+        "side", "facing", "x", "health", "pose", "action", "crouching",
+        "move_started", "attack", "attack_started", "attack_active", "attack_end",
+        "attack_hit", "canceled", "consumed", "cooldown_until", "stun_until",
+    )
+
+    def __init__(self, side: int, x: float):
+        self.side = side                    # 0 = P1, 1 = P2
+        self.facing = 1 if side == 0 else -1
+        self.x = x                          # 体の左端
+        self.health = MAX_HEALTH
+        self.pose = IDLE                    # 最新の入力ポーズ（コード）
+        self.action = ACT_IDLE
+        self.crouching = False
+        self.move_started = 0
+        self.attack = -1
+        self.attack_started = 0
+        self.attack_active = 0              # この tick から判定が出る
+        self.attack_end = 0
+        self.attack_hit = False
+        self.canceled = False
+        self.consumed = -1                  # 出し終えた攻撃ポーズ（別のポーズになるまで再発動しない）
+        self.cooldown_until = 0
+        self.stun_until = 0
+
+    @property
+    def name(self) -> str:
+        return "P1" if self.side == 0 else "P2"
+
+    def status(self, tick: int) -> str:
+        if self.action == ACT_ATTACK:
+            if self.canceled and tick < self.attack_active:
+                return "attack_canceling"
+            return "crouch_attacking" if self.attack in LOW_ATTACKS else "attacking"
+        return _STATUS[self.action]
+
+    def hurtbox(self) -> Tuple[float, float, float, float]:
+        height = CROUCH_HEIGHT if self.crouching else BODY_HEIGHT
+        return (self.x, GROUND_Y - height, self.x + BODY_WIDTH, GROUND_Y)
+
+
+class Match:
+    """1試合（1ラウンド）。入力は set_pose、進行は step（GameEngine から呼ばれる）。"""
+
+    __slots__ = ("match_id", "players", "tick", "ticks_left", "round_number", "status", "_events", "_now_ms",
+                 "_state_key", "_state_tick", "slot", "tick_time", "input_latency", "_input_at")
+
+    def __init__(self, match_id: str, round_seconds: int = ROUND_SECONDS, slot: int = 0):
+        self.match_id = match_id
+        self.players = (Player(0, 200.0), Player(1, 400.0))
+        self.tick = 0
+        self.ticks_left = round_seconds * TICK_HZ
+        self.round_number = 1
+        self.status = "playing"
+        self._events: List[dict] = []
+        self._now_ms = 0
+        # 直前に changed=True で出した game_state の内容とティック（GameEngine が使う）
+        self._state_key = None
+        self._state_tick = 0
+        # GameEngine のタイマーホイールのスロット（game_state を送るティックの位相）
+        self.slot = slot
+        # 試合ごとの計測: 1ティックの処理時間と、ポーズの変化が game_state で送られるまでの時間
+        self.tick_time = Histogram(window=256)
+        self.input_latency = Histogram(window=256)
+        self._input_at: Optional[float] = None
+
+    def set_pose(self, side: int, pose: str) -> None:
+        """確定ポーズを入力する。未知のポーズ名は無視する。"""
+        code = POSE_CODES.get(pose)
+        if code is not None:
+            player = self.players[side]
+            if code != player.pose and self._input_at is None:
+                self._input_at = time.perf_counter()
+            player.pose = code
+
+    def stats(self) -> dict:
+        """試合の状況と計測値（/rooms 用）。"""
+        return {
+            "status": self.status,
+            "tick": self.tick,
+            "game_timer": round(max(self.ticks_left, 0) / TICK_HZ, 1),
+            "tick_time": self.tick_time.snapshot(),
+            "input_latency": self.input_latency.snapshot(),
+        }
+
+    @property
+    def finished(self) -> bool:
+        return self.status == "finished"
+
+    # --- 進行 ---
+    def step(self, now_ms: int) -> List[dict]:
+        """1ティック進め、このティックで起きたイベントを返す。"""
+        self._events = events = []
+        self._now_ms = now_ms
+        if self.status != "playing":
+            return events
+        if self.tick == 0:
+            self._event("round_start")
+        tick = self.tick
+        p1, p2 = self.players
+        self._update_player(p1, tick)
+        self._update_player(p2, tick)
+        self._separate(p1, p2)
+        # 相打ちもあるので、両者の攻撃を解決してから KO を判定する
+        self._resolve_attack(p1, p2, tick)
+        self._resolve_attack(p2, p1, tick)
+
+        self.tick = tick + 1
+        self.ticks_left -= 1
+        if p1.health <= 0 or p2.health <= 0:
+            self._finish(p1 if p1.health > 0 else (p2 if p2.health > 0 else None))
+        elif self.ticks_left <= 0:
+            self._finish(None)
+        return events
+
+    def _update_player(self, p: Player, tick: int) -> None:
+        pose = p.pose
+        if p.consumed != pose:
+            p.consumed = -1
+
+        if p.action == ACT_STUN:
+            if tick < p.stun_until:
+                return
+            p.action = ACT_IDLE
+        if p.action == ACT_ATTACK:
+            if tick < p.attack_end:
+                return
+            p.action = ACT_IDLE
+            p.cooldown_until = tick + ATTACK_COOLDOWN
+
+        if pose in DAMAGE:
+            if p.consumed != pose and tick >= p.cooldown_until:
+                self._start_attack(p, pose, tick)
+                return
+            pose = IDLE  # 出し終えた攻撃ポーズのままなら立ち（しゃがみ攻撃ならしゃがみ）扱い
+            if p.consumed in LOW_ATTACKS:
+                pose = CROUCH
+
+        was_crouching = p.crouching
+        if pose == GUARD:
+            p.action, p.crouching = ACT_GUARD, False
+        elif pose == CROUCH_GUARD:
+            p.action, p.crouching = ACT_CROUCH_GUARD, True
+        elif pose == FORWARD or pose == BACKWARD:
+            action = ACT_FORWARD if pose == FORWARD else ACT_BACKWARD
+            if p.action != action:
+                p.move_started = tick
+                self._event("player_moved", player=p.name, movement="forward" if pose == FORWARD else "backward")
+            p.action, p.crouching = action, False
+            step = FORWARD_SPEED if pose == FORWARD else -BACKWARD_SPEED
+            p.x = min(max(p.x + step * p.facing, 0.0), STAGE_WIDTH - BODY_WIDTH)
+        elif pose == CROUCH:
+            p.action, p.crouching = ACT_CROUCH, True
+        else:
+            p.action, p.crouching = ACT_IDLE, False
+        if p.crouching != was_crouching:
+            self._event("stance_changed", player=p.name, movement="crouch" if p.crouching else "stand")
+
+    def _start_attack(self, p: Player, attack: int, tick: int) -> None:
+        action = p.action
+        canceled = (
+            (action in (ACT_FORWARD, ACT_BACKWARD) and tick - p.move_started <= CANCEL_WINDOW)
+            or (action == ACT_CROUCH and attack in LOW_ATTACKS)
+        )
+        startup = CANCEL_STARTUP if canceled else ATTACK_STARTUP
+        p.action = ACT_ATTACK
+        p.crouching = attack in LOW_ATTACKS
+        p.attack = attack
+        p.attack_started = tick
+        p.attack_active = tick + startup
+        p.attack_end = tick + ATTACK_TICKS - (ATTACK_STARTUP - startup)
+        p.attack_hit = False
+        p.canceled = canceled
+        p.consumed = attack
+        if canceled:
+            self._event("movement_canceled", attacker=p.name, attack_type=ATTACK_NAMES[attack],
+                        movement="crouch" if action == ACT_CROUCH else ("forward" if action == ACT_FORWARD else "backward"))
+
+    @staticmethod
+    def _separate(p1: Player, p2: Player) -> None:
+        # P1 は常に左側。体が重なったら半分ずつ押し戻す
+        overlap = p1.x + BODY_WIDTH - p2.x
+        if overlap > 0:
+            p1.x = max(0.0, p1.x - overlap / 2)
+            p2.x = min(STAGE_WIDTH - BODY_WIDTH, p1.x + BODY_WIDTH)
+            p1.x = p2.x - BODY_WIDTH  # 右端の壁に押し付けられている場合
+
+    def _resolve_attack(self, attacker: Player, target: Player, tick: int) -> None:
+        if attacker.action != ACT_ATTACK or attacker.attack_hit or tick < attacker.attack_active:
+            return
+        hx0, hy0, hx1, hy1 = HITBOXES[(attacker.attack, attacker.facing)]
+        tx0, ty0, tx1, ty1 = target.hurtbox()
+        ax, ay = attacker.x, GROUND_Y
+        if ax + hx1 < tx0 or ax + hx0 > tx1 or ay + hy1 < ty0 or ay + hy0 > ty1:
+            return
+        attacker.attack_hit = True
+
+        attack = attacker.attack
+        damage = DAMAGE[attack]
+        low = attack in LOW_ATTACKS
+        effect = "cancel_combo" if attacker.canceled else "normal"
+        if target.action == ACT_GUARD:
+            if not low:
+                self._event("block", attacker=attacker.name, target=target.name, damage=0,
+                            effect="blocked", attack_type=ATTACK_NAMES[attack])
+                return
+            effect = "crouch_hit"
+        elif target.action == ACT_CROUCH_GUARD:
+            if low:
+                self._event("block", attacker=attacker.name, target=target.name, damage=0,
+                            effect="crouch_blocked", attack_type=ATTACK_NAMES[attack])
+                return
+            damage //= 2
+            effect = "crouch_blocked"
+
+        target.health = max(0, target.health - damage)
+        target.action = ACT_STUN
+        target.stun_until = tick + HITSTUN_TICKS
+        self._event("hit", attacker=attacker.name, target=target.name, damage=damage,
+                    effect=effect, attack_type=ATTACK_NAMES[attack])
+        if target.health <= 0:
+            self._event("ko", attacker=attacker.name, target=target.name)
+
+    def _finish(self, winner: Optional[Player]) -> None:
+        p1, p2 = self.players
+        if winner is None and p1.health != p2.health and (p1.health > 0 or p2.health > 0):
+            # 時間切れは残り HP の多い方の勝ち（両者 KO は引き分け）
+            winner = p1 if p1.health > p2.health else p2
+        self.status = "finished"
+        self._event("round_end", winner=winner.name if winner is not None else "DRAW")
+
+    def _event(self, event: str, **fields) -> None:
+        self._events.append({"type": "game_event", "event": event, **fields, "timestamp": self._now_ms})
+
+    # --- 送信メッセージ ---
+    def state_message(self) -> dict:
+        """api_specification.md 1.2 の game_state。tick は試合内の通し番号、timestamp は直近の step の時刻。"""
+        tick = self.tick
+        p1, p2 = self.players
+        return {
+            "type": "game_state",
+            "player1": self._player_state(p1, tick),
+            "player2": self._player_state(p2, tick),
+            "game_timer": round(max(self.ticks_left, 0) / TICK_HZ, 1),
+            "round_number": self.round_number,
+            "game_status": self.status,
+            "tick": tick,
+            "timestamp": self._now_ms,
+        }
+
+    def state_changed(self, state: dict, heartbeat_ticks: int) -> bool:
+        """state がタイマー以外で前回から変わったか、前回から heartbeat_ticks 経ったか。"""
+        key = (state["player1"], state["player2"], state["round_number"], state["game_status"])
+        if key == self._state_key and self.tick - self._state_tick < heartbeat_ticks:
+            return False
+        self._state_key = key
+        self._state_tick = self.tick
+        return True
+
+    @staticmethod
+    def _player_state(p: Player, tick: int) -> dict:
+        return {
+            "health": p.health,
+            "pose": _POSE_NAMES[p.pose],
+            "position": {"x": round(p.x, 1), "y": GROUND_Y},
+            "status": p.status(tick),
+        }
+
+
+# 試合ごとの tick_time を測る間隔（ティック数）
+TICK_SAMPLE = 4
+
+
+class GameEngine:
+    """複数の試合を1本のスレッドで固定間隔に進める。
+
+    on_message(match, message, changed) には wire_codec.Outgoing（game_event はイベントごと、game_state は
+    state_every ティックごと）が渡される。送る形式の文字列・バイト列は message.encode(codec) で作る
+    （コーデックごとに最初の1回だけ作り、同じ試合の接続で使い回す）。changed はイベントなら常に True、game_state なら
+    内容が変わったか heartbeat 秒ぶりのときだけ True。呼び出しはティックスレッド上なので、送信は
+    ブロックしない方法（キューに積むなど）で行うこと。
+    before_step はティックの最初（試合を進める前）にティックスレッドで呼ばれる。溜めた入力を
+    まとめて処理するのに使う（landmark_ingest.LandmarkIngest.flush など）。
+    """
+
+    def __init__(self, tick_hz: int = TICK_HZ, state_every: int = 1, max_catchup: int = 5,
+                 heartbeat: float = 1.0,
+                 on_message: Optional[Callable[[Match, Outgoing, bool], None]] = None,
+                 before_step: Optional[Callable[[], object]] = None):
+        self.tick_hz = tick_hz
+        self.state_every = state_every
+        self.heartbeat_ticks = max(1, int(heartbeat * tick_hz))
+        self.max_catchup = max_catchup
+        self.on_message = on_message
+        self.before_step = before_step
+        self._matches: Dict[str, Match] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._slots = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.ticks = 0
+        METRICS.gauge("matches", lambda: len(self._matches))
+
+    # --- 試合の管理 ---
+    def create_match(self, match_id: Optional[str] = None, round_seconds: int = ROUND_SECONDS) -> Match:
+        with self._lock:
+            if match_id is None:
+                match_id = f"m{next(self._ids)}"
+            match = self._matches.get(match_id)
+            if match is None:
+                slot = next(self._slots) % self.state_every
+                match = self._matches[match_id] = Match(match_id, round_seconds, slot)
+            return match
+
+    def get(self, match_id: str) -> Optional[Match]:
+        return self._matches.get(match_id)
+
+    def remove_match(self, match_id: str) -> None:
+        with self._lock:
+            self._matches.pop(match_id, None)
+
+    def __len__(self) -> int:
+        return len(self._matches)
+
+    # --- 進行 ---
+    def step(self) -> None:
+        """全試合を1ティック進め、イベントと状態を on_message に渡す。"""
+        now_ms = int(time.time() * 1000)
+        # このティックで game_state を送るスロット（state_every=1 なら毎ティック全試合）
+        phase = self.ticks % self.state_every
+        on_message = self.on_message
+        if self.before_step is not None:
+            self.before_step()
+        with self._lock:
+            matches = list(self._matches.values())
+        perf = time.perf_counter
+        # 試合ごとの処理時間は TICK_SAMPLE ティックに1回だけ測る（計測自体のコストを抑える）
+        timed = self.ticks % TICK_SAMPLE == 0
+        for match in matches:
+            if match.finished:
+                continue
+            if timed:
+                started = perf()
+            events = match.step(now_ms)
+            if on_message is not None:
+                for event in events:
+                    on_message(match, Outgoing(event), True)
+                if match.slot == phase or match.finished:
+                    state = match.state_message()
+                    on_message(match, Outgoing(state), match.state_changed(state, self.heartbeat_ticks))
+                    if match._input_at is not None:
+                        match.input_latency.observe(perf() - match._input_at)
+                        match._input_at = None
+            if timed:
+                match.tick_time.observe(perf() - started)
+        self.ticks += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="game-engine", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        interval = 1.0 / self.tick_hz
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if now < next_tick:
+                time.sleep(next_tick - now)
+                continue
+            # 遅れていれば追いつくまで続けて進める（上限を超えた分は捨てる）
+            behind = int((now - next_tick) / interval) + 1
+            if behind > self.max_catchup:
+                METRICS.inc("game_ticks_dropped", behind - self.max_catchup)
+                next_tick += (behind - self.max_catchup) * interval
+                behind = self.max_catchup
+            for _ in range(behind):
+                started = time.perf_counter()
+                self.step()
+                METRICS.observe("game_tick", time.perf_counter() - started)
+                next_tick += interval
@@ -0,0 +1,41 @@
+"""
+gunicorn の設定（Dockerfile は作業ディレクトリから自動で、Procfile は -c で読む）
+
+ワーカー数は --workers か WEB_CONCURRENCY（gunicorn の標準。既定 1）。2 以上のときは部屋を
+ワーカー間で共有するため、起動時にルームホスト（room_host.py）を別プロセスで立て、ワーカーには
+ROOM_BUS（既定は Unix ドメインソケット）を渡す（room_bus.py / matches.py の RoomRelay）。
+ROOM_BUS を自分で指定したときは、ワーカー数に関わらずそのトランスポートを使う。
+"""
+
+import os
+import subprocess
+import sys
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def on_starting(server):
+    url = os.environ.get("ROOM_BUS")
+    if not url and server.cfg.workers < 2:
+        return
+    if not url:
+        url = os.environ["ROOM_BUS"] = f"unix:/tmp/gafa-rooms-{os.getpid()}.sock"
+    # ルームホスト自身は ROOM_BUS を見ずに試合を持つ（URL は引数で渡す）
+    env = {k: v for k, v in os.environ.items() if k != "ROOM_BUS"}
+    server.room_host = subprocess.Popen([sys.executable, os.path.join(_HERE, "room_host.py"), url],
+                                        cwd=_HERE, env=env)
+    server.log.info("Room host started (pid %s, %s)", server.room_host.pid, url)
+
+
+def on_exit(server):
+    room_host = getattr(server, "room_host", None)
+    if room_host is None:
+        return
+    room_host.terminate()
+    try:
+        room_host.wait(5)
+    except subprocess.TimeoutExpired:
+        room_host.kill()
+    url = os.environ.get("ROOM_BUS", "")
+    if url.startswith("unix:") and os.path.exists(url[5:]):
+        os.unlink(url[5:])
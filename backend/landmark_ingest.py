@@ -0,0 +1,93 @@
+"""
+ブラウザから届いたランドマークを試合の入力にする（ティックごとの一括分類）
+
+WebSocket の受信スレッド / タスクは submit で最新のランドマークを置くだけにし、
+試合のティックスレッドが flush で全接続分を (N, 33, 4) にまとめて classify_pose_codes に1回で通す。
+1人ずつ分類するより NumPy の呼び出しが N 分の1になり、1コアで多くのプレイヤーを捌ける。
+
+- 1ティックの間に同じプレイヤーから複数届いたら最新だけを使う（/metrics の landmark_frames_superseded）。
+- 分類後は stabilizer.PoseStabilizer（受信時刻で時間ベースのデバウンス）を通してから match.set_pose する。
+- しきい値は P1 / P2 のプロファイル（pose_logic.PROFILES）。同じプロファイルの分はまとめて分類する。
+
+使い方例:
+    ingest = LandmarkIngest()
+    engine = GameEngine(on_message=..., before_step=ingest.flush)
+    ingest.submit(match, 0, decode_landmarks(data))   # WebSocket で受け取るたび
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from game_state import Match
+from metrics import METRICS
+from pose_logic import POSE_LABELS, PROFILES, classify_pose_codes
+from stabilizer import PoseStabilizer, StabilizerConfig
+
+_PROFILES = ("P1", "P2")
+
+
+class LandmarkIngest:
+    """プレイヤーごとの最新ランドマークを溜め、flush でまとめて分類して試合に入力する。"""
+
+    def __init__(self, config: Optional[StabilizerConfig] = None):
+        self.config = config or StabilizerConfig()
+        self._lock = threading.Lock()
+        # (match_id, side) -> (match, landmarks or None, 受信時刻)
+        self._pending: Dict[Tuple[str, int], Tuple[Match, Optional[np.ndarray], float]] = {}
+        self._stabilizers: Dict[Tuple[str, int], PoseStabilizer] = {}
+
+    def submit(self, match: Match, side: int, landmarks: Optional[np.ndarray]) -> None:
+        """(33, 4) 配列（人物なしは None）を次のティックの入力として置く。どのスレッドからでもよい。"""
+        key = (match.match_id, side)
+        with self._lock:
+            superseded = key in self._pending
+            self._pending[key] = (match, landmarks, time.perf_counter())
+        METRICS.inc("landmark_frames")
+        if superseded:
+            METRICS.inc("landmark_frames_superseded")
+
+    def forget(self, match_id: str, side: int) -> None:
+        """プレイヤーが抜けたら、そのスムージング状態を捨てる。"""
+        with self._lock:
+            self._pending.pop((match_id, side), None)
+            self._stabilizers.pop((match_id, side), None)
+
+    def flush(self) -> int:
+        """溜まった分をプロファイルごとに一括分類し、確定ポーズを試合に入れる。処理した人数を返す。"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+        started = time.perf_counter()
+        for side, profile in enumerate(_PROFILES):
+            players = []
+            arrays = []
+            for key, (match, landmarks, t) in pending.items():
+                if key[1] != side:
+                    continue
+                stabilizer = self._stabilizer(key)
+                if landmarks is None:
+                    stabilizer.filter.reset()
+                    match.set_pose(side, stabilizer.update("IDLE", t))
+                    continue
+                players.append((match, stabilizer, t))
+                arrays.append(stabilizer.filter(landmarks, t))
+            if not arrays:
+                continue
+            codes = classify_pose_codes(np.stack(arrays), PROFILES.get(profile))
+            for (match, stabilizer, t), code in zip(players, codes.tolist()):
+                match.set_pose(side, stabilizer.update(POSE_LABELS[code], t))
+        METRICS.observe("landmark_classify_batch", time.perf_counter() - started)
+        return len(pending)
+
+    def _stabilizer(self, key: Tuple[str, int]) -> PoseStabilizer:
+        with self._lock:
+            stabilizer = self._stabilizers.get(key)
+            if stabilizer is None:
+                stabilizer = self._stabilizers[key] = PoseStabilizer(self.config, profile=_PROFILES[key[1]])
+            return stabilizer
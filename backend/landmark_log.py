@@ -0,0 +1,189 @@
+"""
+ランドマーク記録フォーマットと高速リプレイ
+
+実セッションのランドマークをファイルに残し、カメラ無しで pose_logic を何度でも回すための道具。
+
+[ファイル形式] (.plog)
+  ヘッダ 16byte: magic b"PLOG" / version (uint16) / ランドマーク数 (uint16) / 予約 8byte
+  以降は固定長レコードの連続（リトルエンディアン）:
+      t   float64          キャプチャ時刻（単調増加の秒。差分だけを使う）
+      lm  float32[33][4]   x, y, z, visibility（人物が検出されなかったフレームは NaN）
+  1フレーム 536byte。np.memmap でそのまま (N, 33, 4) 配列として読める。
+
+使い方例:
+    # 記録（ライブループを止めないよう、書き込みは別スレッド）
+    rec = LandmarkRecorder("session.plog")
+    rec.record(time.perf_counter(), landmarks_to_array(results.pose_landmarks.landmark))
+    rec.record(time.perf_counter(), None)   # 人物なし
+    rec.close()
+
+    # リプレイ（CPU の許す限り速く / 元のペースで）
+    for t, raw, stable in replay("session.plog"):
+        ...
+    python landmark_log.py session.plog             # 最高速で判定して集計を表示
+    python landmark_log.py session.plog --realtime  # 記録時と同じペースで流す
+
+backend/ と fighting-game-pose/ に同じ内容で置いている（pose_logic.py と同様）。
+"""
+
+from __future__ import annotations
+
+import collections
+import queue
+import struct
+import threading
+import time
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from pose_logic import classify_pose_codes, POSE_LABELS
+from stabilizer import LandmarkFilter, PoseStabilizer, StabilizerConfig
+
+MAGIC = b"PLOG"
+VERSION = 1
+NUM_LANDMARKS = 33
+_HEADER = struct.Struct("<4sHH8x")
+HEADER_SIZE = _HEADER.size  # 16
+
+RECORD_DTYPE = np.dtype([("t", "<f8"), ("lm", "<f4", (NUM_LANDMARKS, 4))])
+
+_NO_PERSON = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+_STOP = object()  # 書き込みスレッドへの終了合図
+
+
+class LandmarkRecorder:
+    """ランドマークを .plog に追記する。書き込みは専用スレッドで行い、
+    キューが満杯なら（ディスクが詰まっていれば）そのフレームは捨てて dropped に数える。"""
+
+    def __init__(self, path: str, max_pending: int = 1024, batch: int = 64):
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self._batch = batch
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, NUM_LANDMARKS))
+        self._thread = threading.Thread(target=self._writer, name="landmark-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, timestamp: float, landmarks: Optional[np.ndarray]) -> None:
+        """1フレーム分を記録キューに入れる（ブロックしない）。landmarks=None は人物なし。"""
+        rec = np.empty((), dtype=RECORD_DTYPE)
+        rec["t"] = timestamp
+        rec["lm"] = _NO_PERSON if landmarks is None else landmarks
+        try:
+            self._queue.put_nowait(rec)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+
+    def __enter__(self) -> "LandmarkRecorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _writer(self) -> None:
+        buf = np.empty(self._batch, dtype=RECORD_DTYPE)
+        done = False
+        while not done:
+            # 1件は待ち、残りは溜まっている分だけまとめて書く
+            items = [self._queue.get()]
+            while len(items) < self._batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if items[-1] is _STOP:
+                done = True
+                items.pop()
+            for i, it in enumerate(items):
+                buf[i] = it
+            if items:
+                self._file.write(buf[:len(items)].tobytes())
+                self.written += len(items)
+        self._file.flush()
+
+
+def open_recording(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(timestamps (N,), landmarks (N, 33, 4)) を memmap で返す（コピーしない）。"""
+    with open(path, "rb") as f:
+        magic, version, num = _HEADER.unpack(f.read(HEADER_SIZE))
+    if magic != MAGIC or version != VERSION or num != NUM_LANDMARKS:
+        raise ValueError(f"{path}: not a PLOG v{VERSION} file")
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE)
+    return records["t"], records["lm"]
+
+
+def replay(path: str, realtime: bool = False, speed: float = 1.0, config: Optional[StabilizerConfig] = None,
+           chunk: int = 4096) -> Iterator[Tuple[float, str, str]]:
+    """記録を分類器と安定化 (stabilizer.PoseStabilizer) に流し、(時刻, 生ポーズ, 確定ポーズ) を順に返す。
+
+    realtime=False なら CPU の許す限り速く（チャンク単位のバッチ判定）、
+    True なら記録時の間隔 / speed で待ちながら流す。確定の判定は記録時刻で行うので、
+    どちらでも結果は同じ。
+    """
+    timestamps, landmarks = open_recording(path)
+    stabilizer = PoseStabilizer(config)
+    t0 = timestamps[0] if len(timestamps) else 0.0
+    wall0 = time.perf_counter()
+    for t, raw in zip(timestamps.tolist(), _iter_codes(timestamps, landmarks, chunk, stabilizer.filter)):
+        if realtime:
+            delay = (t - t0) / speed - (time.perf_counter() - wall0)
+            if delay > 0:
+                time.sleep(delay)
+        pose = POSE_LABELS[raw]
+        yield t, pose, stabilizer.update(pose, t)
+
+
+def _iter_codes(timestamps: np.ndarray, landmarks: np.ndarray, chunk: int,
+                landmark_filter: LandmarkFilter) -> Iterator[int]:
+    for start in range(0, len(landmarks), chunk):
+        batch = landmarks[start:start + chunk]
+        if landmark_filter.config.filter != "none":
+            # フィルタは時間方向に逐次。分類はチャンクごとにまとめて行う
+            batch = np.stack([landmark_filter(lm, t) for t, lm in
+                              zip(timestamps[start:start + chunk].tolist(), batch)])
+        yield from classify_pose_codes(batch).tolist()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PLOG ファイルを pose_logic でリプレイする")
+    parser.add_argument("path")
+    parser.add_argument("--realtime", action="store_true", help="記録時と同じペースで流す")
+    parser.add_argument("--speed", type=float, default=1.0, help="--realtime 時の再生速度倍率")
+    parser.add_argument("--hold-ms", type=float, help="確定までの時間（構え・移動、既定 60）")
+    parser.add_argument("--attack-hold-ms", type=float, help="確定までの時間（攻撃、既定 30）")
+    parser.add_argument("--filter", choices=("none", "ema", "one_euro"), default="none", help="分類前のランドマークフィルタ")
+    parser.add_argument("--print", dest="verbose", action="store_true", help="確定ポーズの変化を表示")
+    args = parser.parse_args()
+
+    counts: collections.Counter = collections.Counter()
+    transitions = 0
+    last = None
+    n = 0
+    started = time.perf_counter()
+    config = StabilizerConfig.from_env({
+        "POSE_HOLD_MS": "" if args.hold_ms is None else str(args.hold_ms),
+        "POSE_ATTACK_HOLD_MS": "" if args.attack_hold_ms is None else str(args.attack_hold_ms),
+        "POSE_FILTER": args.filter,
+    })
+    for t, raw, stable in replay(args.path, args.realtime, args.speed, config):
+        n += 1
+        counts[stable] += 1
+        if stable != last:
+            transitions += 1
+            if args.verbose:
+                print(f"{t:10.3f}  {stable}")
+            last = stable
+    elapsed = time.perf_counter() - started
+    print(f"frames={n} elapsed={elapsed:.3f}s ({n / elapsed if elapsed else 0:.0f} frames/s) transitions={transitions}")
+    for name, c in counts.most_common():
+        print(f"  {name:13s} {c}")
@@ -0,0 +1,344 @@
+"""
+試合と接続の対応（app.py / app_async.py 共通）
+
+WebSocket の実装（flask_sock のスレッド / asyncio）に依らない部分をここにまとめる。
+接続は put(message, changed=True) を持つチャンネルとして登録し、game_state.GameEngine の
+ティックスレッドからは put を呼ぶだけにする（送信はチャンネル側が別スレッド / 別タスクで行う）。
+put はブロックせず、どのスレッドから呼ばれてもよいこと。message は wire_codec.Outgoing で、
+チャンネルは接続時に選ばれたコーデック（json / msgpack / packed）で message.encode(codec) して送る。
+
+試合（部屋）は /ws?match=<ID> で入ったときに無ければ作られる。POST /rooms（create_room）で
+先に ID を払い出しておくこともでき、その部屋は最初の接続が来てからタイマーが動き出す
+（ROOM_IDLE_TIMEOUT 秒だれも来なければ消える）。GET /rooms（list_rooms）で部屋ごとの
+参加状況と計測値（1ティックの処理時間・入力から配信までの時間）が見られる。
+
+クライアントはポーズ名の JSON の代わりに、ブラウザで推論したランドマークを量子化バイナリ
+（landmark_codec.py）で送ってもよい。その場合はサーバーが分類する（landmark_ingest.py）。
+
+環境変数 ROOM_BUS（unix:/tmp/gafa-rooms.sock など）があれば、このプロセスでは試合を持たない
+（gunicorn --workers 2 以上のワーカー）。試合はルームホスト（room_host.py）が進め、ここは RoomRelay が
+入力をホストへ送り、ホストから届く部屋のメッセージを自分の接続に配る（room_bus.py）。
+gunicorn.conf.py がワーカー数 2 以上のときに ROOM_BUS を設定し、ルームホストを起動する。
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from game_state import ROUND_SECONDS, GameEngine, Match
+from landmark_codec import MAGIC, decode_landmarks
+from landmark_ingest import LandmarkIngest
+from metrics import METRICS
+from room_bus import open_bus
+from stabilizer import StabilizerConfig
+from wire_codec import Outgoing, decode
+
+# 接続中の WebSocket 数（/metrics 用）
+_clients = {"ws": 0, "test": 0}
+_clients_lock = threading.Lock()
+METRICS.gauge("clients", lambda: dict(_clients))
+
+
+def track_client(kind: str, delta: int) -> None:
+    with _clients_lock:
+        _clients[kind] += delta
+
+
+# --- サーバー側の試合進行（game_state.py）---
+# 試合ごとの接続: match_id -> {チャンネル: 0(P1) / 1(P2) / None(観戦)}
+_match_clients: Dict[str, Dict[Any, Optional[int]]] = {}
+_match_lock = threading.Lock()
+# POST /rooms で作ってまだ誰も来ていない部屋: match_id -> (作成時刻, ラウンド秒数)
+_reserved: Dict[str, Tuple[float, int]] = {}
+# 予約した部屋に誰も来なければ、この秒数で消す
+ROOM_IDLE_TIMEOUT = 60.0
+MAX_ROUND_SECONDS = 600
+
+
+def _deliver(match, message, changed):
+    with _match_lock:
+        channels = list(_match_clients.get(match.match_id, ()))
+    for channel in channels:
+        channel.put(message, changed)
+
+
+# ランドマークで送ってくる接続の分は、ティックの最初に全員分をまとめて分類する
+# 確定ポーズの安定化は POSE_HOLD_MS / POSE_ATTACK_HOLD_MS / POSE_FILTER で調整する（stabilizer.py）
+ingest = LandmarkIngest(StabilizerConfig.from_env())
+engine = GameEngine(on_message=_deliver, before_step=ingest.flush)
+
+
+class Seat:
+    """join_match の戻り値。接続がどの試合のどちら側（0=P1 / 1=P2 / None=観戦）にいるか。
+
+    RoomRelay 経由（ROOM_BUS あり）では試合はルームホストにあるので、match と side は None のまま。
+    """
+
+    __slots__ = ("match_id", "channel", "side", "match", "conn_id")
+
+    def __init__(self, match_id: str, channel, side: Optional[int] = None,
+                 match: Optional[Match] = None, conn_id: Optional[str] = None):
+        self.match_id = match_id
+        self.channel = channel
+        self.side = side
+        self.match = match
+        self.conn_id = conn_id
+
+
+def create_room(round_seconds: int = ROUND_SECONDS) -> str:
+    """新しい部屋の ID を払い出す。試合は最初の接続が来たときに始まる。"""
+    if not 1 <= round_seconds <= MAX_ROUND_SECONDS:
+        raise ValueError(f"round_seconds must be 1..{MAX_ROUND_SECONDS}")
+    if RELAY is not None:
+        room_id = secrets.token_hex(3)
+        RELAY.reserve(room_id, round_seconds)
+    else:
+        _expire_reserved()
+        with _match_lock:
+            while True:
+                room_id = secrets.token_hex(3)
+                if room_id not in _match_clients and room_id not in _reserved and engine.get(room_id) is None:
+                    break
+        reserve_room(room_id, round_seconds)
+    METRICS.inc("rooms_created")
+    return room_id
+
+
+def reserve_room(room_id: str, round_seconds: int) -> None:
+    """room_id の部屋を予約する（既にあれば何もしない）。ルームホストは RoomRelay の予約をこれで受ける。"""
+    with _match_lock:
+        if room_id not in _match_clients and engine.get(room_id) is None:
+            _reserved.setdefault(room_id, (time.perf_counter(), round_seconds))
+
+
+def _expire_reserved() -> None:
+    deadline = time.perf_counter() - ROOM_IDLE_TIMEOUT
+    with _match_lock:
+        for room_id in [r for r, (created, _) in _reserved.items() if created < deadline]:
+            del _reserved[room_id]
+
+
+def list_rooms() -> List[Dict[str, Any]]:
+    """部屋ごとの参加状況（P1 / P2 が埋まっているか、観戦者数）と Match.stats()。"""
+    if RELAY is not None:
+        return RELAY.rooms
+    _expire_reserved()
+    with _match_lock:
+        rooms = [(room_id, list(clients.values())) for room_id, clients in _match_clients.items()]
+        waiting = list(_reserved)
+    out = []
+    for room_id, sides in rooms:
+        match = engine.get(room_id)
+        out.append({"room": room_id, "P1": 0 in sides, "P2": 1 in sides, "spectators": sides.count(None),
+                    **(match.stats() if match is not None else {})})
+    for room_id in waiting:
+        out.append({"room": room_id, "P1": False, "P2": False, "spectators": 0, "status": "waiting"})
+    return out
+
+
+def _rooms_summary() -> Dict[str, Any]:
+    """/metrics 用の要約。部屋数と、入力から配信までの p99 が大きい部屋（上位 5）。"""
+    if RELAY is not None:
+        return RELAY.summary
+    with _match_lock:
+        room_ids = list(_match_clients)
+        waiting = len(_reserved)
+    latencies = []
+    for room_id in room_ids:
+        match = engine.get(room_id)
+        if match is not None:
+            latencies.append((match.input_latency.snapshot()["p99_ms"], room_id))
+    latencies.sort(reverse=True)
+    return {
+        "active": len(room_ids),
+        "waiting": waiting,
+        "slowest_input_latency_p99_ms": {room_id: p99 for p99, room_id in latencies[:5]},
+    }
+
+
+METRICS.gauge("rooms", _rooms_summary)
+
+
+def join_match(match_id: str, channel, wanted: Optional[int]) -> Seat:
+    """接続を試合に登録する。担当するプレイヤー (0 / 1 / None=観戦) は戻り値の side。"""
+    if RELAY is not None:
+        return RELAY.join(match_id, channel, wanted)
+    with _match_lock:
+        reserved = _reserved.pop(match_id, None)
+        clients = _match_clients.setdefault(match_id, {})
+        taken = set(clients.values())
+        if wanted in (0, 1) and wanted not in taken:
+            side = wanted
+        else:
+            side = next((i for i in (0, 1) if i not in taken), None)
+        # 接続通知は試合のメッセージより先に届くよう、登録前にキューへ入れる
+        channel.put(Outgoing({"pose": "IDLE", "status": "connected", "match": match_id,
+                              "player": "P1" if side == 0 else ("P2" if side == 1 else None)}))
+        clients[channel] = side
+        # 試合もロックの中で作る（外だと、同時に抜けた最後の接続の remove_match と入れ違いになり、
+        # 登録済みなのに試合が無い・誰もいない試合が残る、が起こる）
+        match = engine.create_match(match_id, reserved[1] if reserved else ROUND_SECONDS)
+    engine.start()
+    return Seat(match_id, channel, side, match)
+
+
+def leave_match(seat: Seat) -> None:
+    if RELAY is not None:
+        RELAY.leave(seat)
+        return
+    match_id = seat.match_id
+    with _match_lock:
+        clients = _match_clients.get(match_id, {})
+        side = clients.pop(seat.channel, None)
+        if not clients:
+            _match_clients.pop(match_id, None)
+            # 誰もいなくなった試合は消す（次に来たときは新しい試合になる）。join_match と同じロックの中で
+            engine.remove_match(match_id)
+    if side is not None:
+        ingest.forget(match_id, side)
+
+
+def handle_message(seat: Seat, message) -> None:
+    """クライアントから受け取った1メッセージを処理する。
+
+    テキストは {"pose": ...}（確定ポーズ。1.4 の pose_detected も可）、バイナリは量子化ランドマーク
+    （次のティックでまとめて分類）か、msgpack / packed の確定ポーズ（wire_codec.py）。
+    """
+    METRICS.tick("messages_received")
+    with METRICS.timer("ws_handle"):
+        if isinstance(message, (bytes, bytearray)):
+            if message[:1] == bytes((MAGIC,)):
+                landmarks = decode_landmarks(message)
+                if RELAY is not None:
+                    RELAY.forward(seat, bytes(message))
+                elif seat.side is not None and seat.match is not None:
+                    ingest.submit(seat.match, seat.side, landmarks)
+                return
+            data = decode(bytes(message))
+        else:
+            data = json.loads(message)
+        if 'pose' in data:
+            print(f"Received pose from client: {data['pose']}")
+            if RELAY is not None:
+                # ホストへはテキストで渡す（ホストは受け取った形式を知らなくてよい）
+                RELAY.forward(seat, message if isinstance(message, str) else json.dumps(data))
+            # 担当プレイヤーの入力として試合に渡す（観戦者のポーズは使わない）
+            elif seat.side is not None and seat.match is not None:
+                seat.match.set_pose(seat.side, data['pose'])
+
+
+# --- ワーカー間の中継（ROOM_BUS あり）---
+# ルームホストとの間のペイロードは先頭1バイトが種類、残りが中身:
+#   ワーカー → "host" : J(入室 JSON) / L(退室 conn_id) / T・B(入力 conn_id + NUL + テキスト・バイナリ) / R(予約 JSON)
+#                        A(ワーカー ID、ALIVE_INTERVAL 秒ごとの生存通知)
+#   ホスト → "w.<ID>"  : J(conn_id + NUL + 接続通知の JSON)
+#   ホスト → "room.<ID>": 1・0(changed の真偽) + メッセージの JSON
+#   （ホスト → ワーカーは JSON のまま渡し、接続ごとのコーデックへの変換は各ワーカーが1回ずつ行う）
+OP_JOIN = b"J"
+OP_LEAVE = b"L"
+OP_TEXT = b"T"
+OP_BINARY = b"B"
+OP_RESERVE = b"R"
+OP_ALIVE = b"A"
+ALIVE_INTERVAL = 1.0
+
+
+class RoomRelay:
+    """ワーカー側の中継。接続を conn_id で登録し、入力はホストへ、部屋のメッセージは自分の接続へ渡す。"""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.worker = f"w.{os.getpid()}.{secrets.token_hex(2)}"
+        self.rooms: List[Dict[str, Any]] = []
+        self.summary: Dict[str, Any] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # conn_id -> Seat（入室の応答待ちも含む）
+        self._seats: Dict[str, Seat] = {}
+        # 部屋ごとの、入室の応答を受け取った接続（部屋のメッセージを配る相手）
+        self._members: Dict[str, Dict[Any, str]] = {}
+        # 部屋ごとの、このワーカーの接続数（0 になったら購読をやめる）
+        self._refs: Dict[str, int] = {}
+        self.host_metrics: Dict[str, Any] = {}
+        METRICS.gauge("room_host", lambda: self.host_metrics)
+        bus.start(self._on_message)
+        bus.subscribe(self.worker)
+        bus.subscribe("rooms")
+        threading.Thread(target=self._keepalive, name="room-relay-alive", daemon=True).start()
+
+    def _keepalive(self) -> None:
+        while True:
+            self.bus.publish("host", OP_ALIVE + self.worker.encode())
+            time.sleep(ALIVE_INTERVAL)
+
+    def join(self, match_id: str, channel, wanted: Optional[int]) -> Seat:
+        seat = Seat(match_id, channel, conn_id=f"{self.worker}.{next(self._ids)}")
+        with self._lock:
+            self._seats[seat.conn_id] = seat
+            self._refs[match_id] = self._refs.get(match_id, 0) + 1
+            first = self._refs[match_id] == 1
+        if first:
+            # 入室より先に購読しておく（ホストが入室を受けた後の部屋のメッセージを取りこぼさない）
+            self.bus.subscribe(f"room.{match_id}")
+        self.bus.publish("host", OP_JOIN + json.dumps(
+            {"conn": seat.conn_id, "room": match_id, "wanted": wanted, "reply": self.worker}).encode())
+        return seat
+
+    def leave(self, seat: Seat) -> None:
+        with self._lock:
+            self._seats.pop(seat.conn_id, None)
+            members = self._members.get(seat.match_id)
+            if members is not None:
+                members.pop(seat.channel, None)
+                if not members:
+                    del self._members[seat.match_id]
+            self._refs[seat.match_id] -= 1
+            last = self._refs[seat.match_id] == 0
+            if last:
+                del self._refs[seat.match_id]
+        self.bus.publish("host", OP_LEAVE + seat.conn_id.encode())
+        if last:
+            self.bus.unsubscribe(f"room.{seat.match_id}")
+
+    def forward(self, seat: Seat, message) -> None:
+        if isinstance(message, bytes):
+            self.bus.publish("host", OP_BINARY + seat.conn_id.encode() + b"\0" + message)
+        else:
+            self.bus.publish("host", OP_TEXT + seat.conn_id.encode() + b"\0" + message.encode())
+
+    def reserve(self, room_id: str, round_seconds: int) -> None:
+        self.bus.publish("host", OP_RESERVE + json.dumps({"room": room_id, "round_seconds": round_seconds}).encode())
+
+    def _on_message(self, topic: str, data: bytes) -> None:
+        if topic.startswith("room."):
+            room_id = topic[5:]
+            message = Outgoing(text=data[1:].decode())
+            changed = data[:1] == b"1"
+            with self._lock:
+                channels = list(self._members.get(room_id, ()))
+            for channel in channels:
+                channel.put(message, changed)
+        elif topic == self.worker:
+            conn_id, _, message = data[1:].partition(b"\0")
+            with self._lock:
+                seat = self._seats.get(conn_id.decode())
+                if seat is None:
+                    return  # 応答より先に切断した
+                seat.side = {"P1": 0, "P2": 1}.get(json.loads(message).get("player"))
+                # 接続通知を部屋のメッセージより先に積む（同じ順で届いている）
+                seat.channel.put(Outgoing(text=message.decode()))
+                self._members.setdefault(seat.match_id, {})[seat.channel] = conn_id
+        elif topic == "rooms":
+            snapshot = json.loads(data)
+            self.rooms = snapshot["rooms"]
+            self.summary = snapshot["summary"]
+            self.host_metrics = snapshot["host"]
+
+
+RELAY: Optional[RoomRelay] = RoomRelay(open_bus(os.environ["ROOM_BUS"])) if os.environ.get("ROOM_BUS") else None
@@ -0,0 +1,182 @@
+"""
+軽量メトリクス（ステージ別レイテンシ・FPS・ドロップ数・接続数）
+
+使い方例:
+    from metrics import METRICS
+
+    with METRICS.timer("pose.process"):
+        results = pose.process(rgb)
+    METRICS.tick("frames")               # FPS 計測用
+    METRICS.inc("dropped_frames")        # カウンタ
+    METRICS.gauge("clients", lambda: n)  # 値を返す関数を登録（/metrics 取得時に評価）
+
+    METRICS.snapshot()  # -> dict（/metrics ルートでそのまま JSON にして返す）
+
+- タイマーは直近 window 件の処理時間をリングバッファに持ち、取得時に p50/p95/p99 を計算する。
+  記録側は deque への append だけなので、フレームループに入れても負荷は小さい。
+- 環境変数 POSE_METRICS=0 で無効化できる。無効時の timer() は共有のダミーを返すだけで、
+  計測も記録も行わない（関数呼び出し1回分のコストのみ）。
+
+backend/ と fighting-game-pose/ に同じ内容で置いている（pose_logic.py と同様）。
+"""
+
+from __future__ import annotations
+
+import collections
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[i]
+
+
+class Histogram:
+    """直近 window 件の値（秒）を保持するローリングヒストグラム。"""
+
+    def __init__(self, window: int = 1024):
+        self._values: collections.deque = collections.deque(maxlen=window)
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self._values.append(seconds)
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        values = sorted(self._values.copy())
+        return {
+            "count": self.count,
+            "p50_ms": round(_percentile(values, 0.50) * 1000.0, 3),
+            "p95_ms": round(_percentile(values, 0.95) * 1000.0, 3),
+            "p99_ms": round(_percentile(values, 0.99) * 1000.0, 3),
+            "max_ms": round(values[-1] * 1000.0, 3) if values else 0.0,
+        }
+
+
+class Meter:
+    """直近 window 件のイベント時刻から発生レート（FPS など）を出す。"""
+
+    def __init__(self, window: int = 120):
+        self._times: collections.deque = collections.deque(maxlen=window)
+        self.count = 0
+
+    def tick(self, now: Optional[float] = None) -> None:
+        self._times.append(time.perf_counter() if now is None else now)
+        self.count += 1
+
+    def rate(self) -> float:
+        times = self._times.copy()
+        if len(times) < 2:
+            return 0.0
+        # 最後のイベントから時間が空いていれば、そのぶんレートを下げて見せる
+        span = max(times[-1], time.perf_counter()) - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+
+class _Timer:
+    __slots__ = ("_hist", "_start")
+
+    def __init__(self, hist: Histogram):
+        self._hist = hist
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._hist.observe(time.perf_counter() - self._start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Registry:
+    """メトリクスの入れ物。名前で Histogram / Meter / カウンタ / ゲージを引く。"""
+
+    def __init__(self, enabled: bool = True, window: int = 1024):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._meters: Dict[str, Meter] = {}
+        self._counters: Dict[str, int] = collections.defaultdict(int)
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self.started_at = time.time()
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self._histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(name, Histogram(self.window))
+        return hist
+
+    def meter(self, name: str) -> Meter:
+        meter = self._meters.get(name)
+        if meter is None:
+            with self._lock:
+                meter = self._meters.setdefault(name, Meter())
+        return meter
+
+    def timer(self, name: str):
+        """with 文で処理時間を計測する。無効時は何もしないダミーを返す。"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(name))
+
+    def observe(self, name: str, seconds: float) -> None:
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def tick(self, name: str) -> None:
+        if self.enabled:
+            self.meter(name).tick()
+
+    def inc(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self._counters[name] += n
+
+    def gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        """取得時に評価される値を登録する（接続数など）。"""
+        self._gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            histograms = dict(self._histograms)
+            meters = dict(self._meters)
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        gauge_values = {}
+        for name, fn in gauges.items():
+            try:
+                gauge_values[name] = fn()
+            except Exception as e:  # 計測のせいで /metrics が落ちないようにする
+                gauge_values[name] = f"error: {e}"
+        return {
+            "enabled": True,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "latency": {name: h.snapshot() for name, h in sorted(histograms.items())},
+            "rates": {name: round(m.rate(), 2) for name, m in sorted(meters.items())},
+            "counters": counters,
+            "gauges": gauge_values,
+        }
+
+
+METRICS = Registry(enabled=os.environ.get("POSE_METRICS", "1") != "0")
@@ -16,8 +16,15 @@ MediaPipe Pose のランドマーク配列(33個)から、
     from pose_logic import classify_pose_from_results
     pose = classify_pose_from_results(results)
 
+    # NumPy 配列 (33, 4) / バッチ (N, 33, 4) で:
+    from pose_logic import classify_pose_from_array, classify_pose_batch
+    pose = classify_pose_from_array(arr)
+    poses = classify_pose_batch(batch)   # N 個のポーズ名
+
 ヒューリスティックベースで、スケールは肩幅で正規化しています。
 必要ランドマークが欠ける場合は "IDLE" を返します。
+判定条件と優先順位はルール表（FEATURES / PREDICATES / RULES）に書き、1フレーム用・バッチ用の
+どちらの判定もそこから作ります。ポーズを足すときは表に1行足すだけです。
 
 [微調整ガイド]
 - 座標系: MediaPipe の2D座標は x: 右が+、y: 下が+（上に行くほど y は小さくなる）。0〜1に正規化。
@@ -27,32 +34,46 @@ MediaPipe Pose のランドマーク配列(33個)から、
   1) 誤検出を減らしたい → 角度の最小/最大を厳しく、距離比を大きめに、min_visibility を少し上げる。
   2) 反応を良くしたい → 角度の閾値を緩める、距離比を小さく、スムージング（pose_test側）を弱める。
   3) 体格差対応 → すべて比率ベースなので基本は不要。肩や腰が隠れやすい衣服の場合は min_visibility を調整。
+- 再起動せずに調整: しきい値は PROFILES（ThresholdProfiles）から引くので、JSON ファイル
+  （server.py / pose_test.py は POSE_THRESHOLDS=thresholds.json を監視）や server.py の /thresholds で
+  差し替えると次のフレームから反映される。P1 / P2 の名前でプレイヤー別の値も持てる。
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Sequence, Optional
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Sequence, Optional, Tuple, Union
+import dataclasses
+import functools
+import json
 import math
+import operator
+import os
+import threading
+import time
+
+import numpy as np
+
 
-try:
-    # 型安全かつ定数参照のために import（未インストールでも動くように例外は無視）
-    from mediapipe.python.solutions.pose import PoseLandmark as PL
-except Exception:  # pragma: no cover - 実行環境に mediapipe が無い場合のフォールバック
-    class PL:  # type: ignore
-        NOSE = 0
-        LEFT_SHOULDER = 11
-        RIGHT_SHOULDER = 12
-        LEFT_ELBOW = 13
-        RIGHT_ELBOW = 14
-        LEFT_WRIST = 15
-        RIGHT_WRIST = 16
-        LEFT_HIP = 23
-        RIGHT_HIP = 24
-        LEFT_KNEE = 25
-        RIGHT_KNEE = 26
-        LEFT_ANKLE = 27
-        RIGHT_ANKLE = 28
+class PL:
+    """MediaPipe の PoseLandmark と同じ番号。
+
+    以前は mediapipe から import していたが、それだけで mediapipe と cv2 が読み込まれ、
+    カメラを使わない app.py（/test・試合進行）の起動が重くなるので定数だけここに持つ。
+    """
+    NOSE = 0
+    LEFT_SHOULDER = 11
+    RIGHT_SHOULDER = 12
+    LEFT_ELBOW = 13
+    RIGHT_ELBOW = 14
+    LEFT_WRIST = 15
+    RIGHT_WRIST = 16
+    LEFT_HIP = 23
+    RIGHT_HIP = 24
+    LEFT_KNEE = 25
+    RIGHT_KNEE = 26
+    LEFT_ANKLE = 27
+    RIGHT_ANKLE = 28
 
 
 # しきい値のまとめ。各値は「肩幅=1.0」の比率で扱う（角度は度）。
@@ -111,6 +132,122 @@ class Thresholds:
 TH = Thresholds()
 
 
+def thresholds_from(base: Thresholds, values: Mapping[str, Any]) -> Thresholds:
+    """base の一部の値を置き換えた Thresholds を返す。知らない名前・数値でない値は ValueError。"""
+    known = {f.name for f in dataclasses.fields(Thresholds)}
+    unknown = set(values) - known
+    if unknown:
+        raise ValueError(f"unknown threshold(s): {', '.join(sorted(unknown))}")
+    try:
+        return dataclasses.replace(base, **{k: float(v) for k, v in values.items()})
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid threshold value: {e}") from None
+
+
+class ThresholdProfiles:
+    """名前付きの Thresholds（プロファイル）。サーバーを止めずにしきい値を差し替えるための入れ物。
+
+    各プロファイルは "default" からの差分（"default" 自身は Thresholds() からの差分）として持つ。
+    P1 / P2 のようにプレイヤーごとに名前を分ければ、同じ試合で別々の調整を使える。無い名前を
+    get すると "default" が返る。
+
+    差し替えは新しい辞書を作ってから参照ごと入れ替えるだけなので、判定側（get）はロック不要で、
+    1フレームの判定の途中で値が変わることもない。書き込み（set / load）同士だけロックで直列化する。
+
+    ファイル形式 (JSON): {"default": {"punch_elbow_angle_min": 150}, "P2": {"guard_elbow_angle_max": 110}}
+    """
+
+    def __init__(self, base: Thresholds = TH):
+        self._base = base
+        self._overrides: Dict[str, Dict[str, float]] = {"default": {}}
+        self._profiles: Dict[str, Thresholds] = {"default": base}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.path: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._watcher: Optional[threading.Thread] = None
+
+    def get(self, name: Optional[str] = None) -> Thresholds:
+        profiles = self._profiles
+        if name:
+            th = profiles.get(name)
+            if th is not None:
+                return th
+        return profiles["default"]
+
+    def snapshot(self) -> dict:
+        """{"version", "path", "profiles": {名前: 差分}} （/thresholds の応答用）。"""
+        return {"version": self.version, "path": self.path,
+                "profiles": {name: dict(values) for name, values in self._overrides.items()}}
+
+    def set(self, name: str, values: Mapping[str, Any], replace: bool = False) -> Thresholds:
+        """プロファイル name の差分を更新する（replace=True なら差分を丸ごと置き換える）。"""
+        with self._lock:
+            overrides = {k: dict(v) for k, v in self._overrides.items()}
+            current = {} if replace else overrides.get(name, {})
+            overrides[name] = {**current, **values}
+            self._swap(overrides)
+        return self.get(name)
+
+    def load(self, path: str) -> None:
+        """JSON ファイルから全プロファイルを読み込む。1つでも不正なら何も変えずに ValueError。"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not all(isinstance(v, dict) for v in data.values()):
+            raise ValueError(f"{path}: expected {{profile: {{threshold: value}}}}")
+        with self._lock:
+            self._swap({"default": {}, **data})
+            self.path = path
+            self._mtime = os.path.getmtime(path)
+
+    def reload_if_changed(self) -> bool:
+        """読み込んだファイルが更新されていれば読み直す。読み直したら True。"""
+        if self.path is None:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime  # 壊れたファイルを毎回読み直さないよう、失敗しても記録する
+        self.load(self.path)
+        return True
+
+    def watch(self, path: str, interval: float = 1.0) -> None:
+        """path を読み込み、以後は interval 秒ごとに更新を確認して読み直す（デーモンスレッド）。"""
+        self.load(path)
+        if self._watcher is not None:
+            return
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.reload_if_changed():
+                        print(f"Thresholds reloaded: {self.path} (version {self.version})")
+                except (OSError, ValueError) as e:
+                    print(f"Thresholds reload failed (keeping version {self.version}): {e}")
+
+        self._watcher = threading.Thread(target=run, name="thresholds-watch", daemon=True)
+        self._watcher.start()
+
+    def _swap(self, overrides: Dict[str, Dict[str, float]]) -> None:
+        # 全部作って検証してから入れ替える（途中で失敗したら今の値のまま）
+        default = thresholds_from(self._base, overrides.get("default", {}))
+        profiles = {name: default if name == "default" else thresholds_from(default, values)
+                    for name, values in overrides.items()}
+        for th in profiles.values():
+            compile_rules(th)  # 評価器を先に作り、差し替え直後のフレームで待たせない
+        self._overrides = {name: {k: float(v) for k, v in values.items()} for name, values in overrides.items()}
+        self._profiles = profiles
+        self.version += 1
+
+
+# 実行中の判定が使うしきい値。server.py は POSE_THRESHOLDS のファイルと /thresholds で差し替える
+PROFILES = ThresholdProfiles()
+
+
 class LandmarkLike:
     """MediaPipe の NormalizedLandmark ライクなオブジェクト用の Protocol ライク定義。
     x, y, z, visibility を持っていることを想定。
@@ -146,19 +283,20 @@ def _is_visible(lm: LandmarkLike, min_vis: float) -> bool:
         return True
 
 
-def _get_scale(lm: Sequence[LandmarkLike]) -> Optional[float]:
+def _get_scale(lm: Sequence[LandmarkLike], th: Optional[Thresholds] = None) -> Optional[float]:
     # スケール推定: 可能なら肩幅、不可なら腰幅。戻り値は0より大の実数。
     # 注意: カメラのアングルで肩幅が小さく写ると、相対比が大きめに出て検出が甘くなる傾向。
     # 対策: 環境で誤検出が多いときは各しきい値をやや大きめに。
+    min_vis = (th or PROFILES.get()).min_visibility
     try:
         ls, rs = lm[PL.LEFT_SHOULDER], lm[PL.RIGHT_SHOULDER]
-        if _is_visible(ls, TH.min_visibility) and _is_visible(rs, TH.min_visibility):
+        if _is_visible(ls, min_vis) and _is_visible(rs, min_vis):
             d = _dist(ls, rs)
             if d > 0:
                 return d
         # 肩幅が無理なら腰幅
         lh, rh = lm[PL.LEFT_HIP], lm[PL.RIGHT_HIP]
-        if _is_visible(lh, TH.min_visibility) and _is_visible(rh, TH.min_visibility):
+        if _is_visible(lh, min_vis) and _is_visible(rh, min_vis):
             d = _dist(lh, rh)
             if d > 0:
                 return d
@@ -167,197 +305,492 @@ def _get_scale(lm: Sequence[LandmarkLike]) -> Optional[float]:
     return None
 
 
-def classify_pose_from_landmarks(landmarks: Sequence[LandmarkLike]) -> str:
-    """MediaPipeの landmarks (list of 33) を受け取り、ポーズ名を返す."""
-    if not landmarks or len(landmarks) < 29:
-        return "IDLE"
-
-    scale = _get_scale(landmarks)
-    if not scale:
-        return "IDLE"
-
-    def has(*idx: int) -> bool:
-        return all(0 <= i < len(landmarks) and _is_visible(landmarks[i], TH.min_visibility) for i in idx)
-
-    # --- GUARD 検出 ---
+# ---------------------------------------------------------------------------
+# 判定ルール表
+#
+# ポーズの条件は「特徴量 (FEATURES)」「名前付きの条件 (PREDICATES)」「優先順位つきのルール (RULES)」
+# の表で書き、compile_rules() で評価器にする。同じ表から2つの評価器を作る:
+#   - 1フレーム用 (classify_pose_from_landmarks): 上のルールから順に評価し、成立した時点で終わる。
+#     特徴量・名前付き条件はそのフレームで最初に必要になったときに1回だけ計算し、All/Any は
+#     結果が決まった時点で残りを評価しない（しゃがみでなければ CROUCH_* のパンチ判定は計算しない、など）。
+#   - バッチ用 (classify_pose_codes): 参照される特徴量を NumPy で全フレーム分1回ずつ計算する。
+#
+# 新しいポーズは RULES に (名前, 条件) を1行足し、必要なら FEATURES / PREDICATES を足すだけでよい
+# （POSE_LABELS にも名前を足す）。All の中は安い条件（可視性など）を先に書くと早く打ち切れる。
+# ---------------------------------------------------------------------------
+
+class Angle(NamedTuple):
+    """b を頂点とする ∠abc [deg]（x, y のみ）。"""
+    a: int
+    b: int
+    c: int
+
+
+class Dist(NamedTuple):
+    """a-b 間の距離（x, y のみ）。"""
+    a: int
+    b: int
+
+
+class Delta(NamedTuple):
+    """a.<axis> - b.<axis>。a / b にタプルを渡すとその平均。absolute=True なら絶対値。"""
+    axis: str
+    a: Union[int, Tuple[int, ...]]
+    b: Union[int, Tuple[int, ...]]
+    absolute: bool = False
+
+
+class Visible(NamedTuple):
+    """指定のランドマークがすべて min_visibility 以上。"""
+    idx: Tuple[int, ...]
+
+
+class Cmp(NamedTuple):
+    """特徴量 <= / >= しきい値（Thresholds の属性名）。scaled=True ならしきい値に肩幅を掛ける。
+    trace を付けると1フレーム用の評価で値を print する（調整用）。"""
+    feature: Any
+    op: str
+    threshold: str
+    scaled: bool = False
+    trace: Optional[str] = None
+
+
+class All(NamedTuple):
+    terms: Tuple[Any, ...]
+
+
+class AnyOf(NamedTuple):
+    terms: Tuple[Any, ...]
+
+
+def _all(*terms) -> All:
+    return All(terms)
+
+
+def _any(*terms) -> AnyOf:
+    return AnyOf(terms)
+
+
+# 特徴量: 名前 -> 計算式
+FEATURES = {
+    "l_elbow": Angle(PL.LEFT_SHOULDER, PL.LEFT_ELBOW, PL.LEFT_WRIST),
+    "r_elbow": Angle(PL.RIGHT_SHOULDER, PL.RIGHT_ELBOW, PL.RIGHT_WRIST),
+    "l_knee": Angle(PL.LEFT_HIP, PL.LEFT_KNEE, PL.LEFT_ANKLE),
+    "r_knee": Angle(PL.RIGHT_HIP, PL.RIGHT_KNEE, PL.RIGHT_ANKLE),
+    "l_wrist_shoulder": Dist(PL.LEFT_WRIST, PL.LEFT_SHOULDER),
+    "r_wrist_shoulder": Dist(PL.RIGHT_WRIST, PL.RIGHT_SHOULDER),
+    "l_wrist_nose": Dist(PL.LEFT_WRIST, PL.NOSE),
+    "r_wrist_nose": Dist(PL.RIGHT_WRIST, PL.NOSE),
+    # 手首が肩高さからどれだけ上下にずれているか
+    "l_wrist_y_off": Delta("y", PL.LEFT_WRIST, PL.LEFT_SHOULDER, absolute=True),
+    "r_wrist_y_off": Delta("y", PL.RIGHT_WRIST, PL.RIGHT_SHOULDER, absolute=True),
+    # 手首が肩より前に出ている量 (shoulder.z - wrist.z が正なら前)
+    "l_wrist_forward": Delta("z", PL.LEFT_SHOULDER, PL.LEFT_WRIST),
+    "r_wrist_forward": Delta("z", PL.RIGHT_SHOULDER, PL.RIGHT_WRIST),
+    # 足首が股関節から x 方向に離れている量 / 膝より上にある量 / 股関節より前に出ている量
+    "l_ankle_x_off": Delta("x", PL.LEFT_ANKLE, PL.LEFT_HIP, absolute=True),
+    "r_ankle_x_off": Delta("x", PL.RIGHT_ANKLE, PL.RIGHT_HIP, absolute=True),
+    "l_ankle_above_knee": Delta("y", PL.LEFT_KNEE, PL.LEFT_ANKLE),
+    "r_ankle_above_knee": Delta("y", PL.RIGHT_KNEE, PL.RIGHT_ANKLE),
+    "l_ankle_forward": Delta("z", PL.LEFT_HIP, PL.LEFT_ANKLE),
+    "r_ankle_forward": Delta("z", PL.RIGHT_HIP, PL.RIGHT_ANKLE),
+    # 腰と足首の垂直距離（しゃがむほど小さい）
+    "l_hip_ankle_y": Delta("y", PL.LEFT_HIP, PL.LEFT_ANKLE, absolute=True),
+    "r_hip_ankle_y": Delta("y", PL.RIGHT_HIP, PL.RIGHT_ANKLE, absolute=True),
+    # 両肩・両腰・両足首の平均 Z の差（前傾 / 後傾）
+    "forward_lean": Delta("z", (PL.LEFT_HIP, PL.RIGHT_HIP), (PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER)),
+    "backward_lean": Delta("z", (PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER), (PL.LEFT_ANKLE, PL.RIGHT_ANKLE)),
+}
+
+# 名前付きの条件（複数のルールで共有するものは1フレームに1回だけ評価される）
+PREDICATES = {
+    "l_arm": Visible((PL.LEFT_SHOULDER, PL.LEFT_ELBOW, PL.LEFT_WRIST)),
+    "r_arm": Visible((PL.RIGHT_SHOULDER, PL.RIGHT_ELBOW, PL.RIGHT_WRIST)),
+    "l_leg": Visible((PL.LEFT_HIP, PL.LEFT_KNEE, PL.LEFT_ANKLE)),
+    "r_leg": Visible((PL.RIGHT_HIP, PL.RIGHT_KNEE, PL.RIGHT_ANKLE)),
+
+    # --- GUARD ---
     # 目的: 顔の前で両腕を構える姿勢。パンチやキックの途中で誤検出しないよう、両側の条件を満たす必要あり。
     # 調整ポイント:
     # - 近さ判定: guard_wrist_to_face_scale / guard_wrist_to_shoulder_scale
     # - 曲がり判定: guard_elbow_angle_max（小さくすると「より曲げている」必要）
-    guard_cond = False
-    if has(PL.NOSE, PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER, PL.LEFT_ELBOW, PL.RIGHT_ELBOW, PL.LEFT_WRIST, PL.RIGHT_WRIST):
-        nose = landmarks[PL.NOSE]
-        l_sh, r_sh = landmarks[PL.LEFT_SHOULDER], landmarks[PL.RIGHT_SHOULDER]
-        l_el, r_el = landmarks[PL.LEFT_ELBOW], landmarks[PL.RIGHT_ELBOW]
-        l_wr, r_wr = landmarks[PL.LEFT_WRIST], landmarks[PL.RIGHT_WRIST]
-
-        l_close = (_dist(l_wr, nose) <= TH.guard_wrist_to_face_scale * scale) or (
-            _dist(l_wr, l_sh) <= TH.guard_wrist_to_shoulder_scale * scale
-        )
-        r_close = (_dist(r_wr, nose) <= TH.guard_wrist_to_face_scale * scale) or (
-            _dist(r_wr, r_sh) <= TH.guard_wrist_to_shoulder_scale * scale
-        )
-        l_elbow_bent = _angle_deg(l_sh, l_el, l_wr) <= TH.guard_elbow_angle_max
-        r_elbow_bent = _angle_deg(r_sh, r_el, r_wr) <= TH.guard_elbow_angle_max
-        guard_cond = l_close and r_close and l_elbow_bent and r_elbow_bent
-
-    # --- PUNCH 検出（左右どちらか） ---
+    "guard": _all(
+        Visible((PL.NOSE,)), "l_arm", "r_arm",
+        _any(Cmp("l_wrist_nose", "<=", "guard_wrist_to_face_scale", scaled=True),
+             Cmp("l_wrist_shoulder", "<=", "guard_wrist_to_shoulder_scale", scaled=True)),
+        _any(Cmp("r_wrist_nose", "<=", "guard_wrist_to_face_scale", scaled=True),
+             Cmp("r_wrist_shoulder", "<=", "guard_wrist_to_shoulder_scale", scaled=True)),
+        Cmp("l_elbow", "<=", "guard_elbow_angle_max"),
+        Cmp("r_elbow", "<=", "guard_elbow_angle_max"),
+    ),
+
+    # --- PUNCH（左右どちらか） ---
     # 目的: 腕を伸ばして肩より前に突き出す動き。肩高さと大きくズレる（上下にブレる）場合は除外。
     # 調整ポイント:
     # - 伸び判定: punch_elbow_angle_min（高いほど完全伸展のみ）
-    # - 前方距離: punch_wrist_to_shoulder_scale
+    # - 前方距離: punch_wrist_to_shoulder_scale、または Z 方向の punch_wrist_z_diff_min（どちらかでOK）
     # - 高さ整合: punch_wrist_y_align_scale（小さいほど厳格）
-    punch_left = False
-    punch_right = False
-    if has(PL.LEFT_SHOULDER, PL.LEFT_ELBOW, PL.LEFT_WRIST):
-        l_sh, l_el, l_wr = landmarks[PL.LEFT_SHOULDER], landmarks[PL.LEFT_ELBOW], landmarks[PL.LEFT_WRIST]
-        l_elbow_angle = _angle_deg(l_sh, l_el, l_wr)
-        l_wrist_far = _dist(l_wr, l_sh) >= TH.punch_wrist_to_shoulder_scale * scale
-        l_wrist_y_align = abs(l_wr.y - l_sh.y) <= TH.punch_wrist_y_align_scale * scale
-         # ▼▼▼ Z軸の条件を追加 ▼▼▼
-    # 手首が肩より前に出ているか (shoulder.z - wrist.z が正の値になる)
-        l_wrist_pushed_forward = (l_sh.z - l_wr.z) >= TH.punch_wrist_z_diff_min
-
-        # ↓ 横(XY)か前(Z)のどちらかを満たせばOK、という形に修正
-        punch_left = (l_elbow_angle >= TH.punch_elbow_angle_min) and l_wrist_y_align and (l_wrist_far or l_wrist_pushed_forward)
-
-    if has(PL.RIGHT_SHOULDER, PL.RIGHT_ELBOW, PL.RIGHT_WRIST):
-        r_sh, r_el, r_wr = landmarks[PL.RIGHT_SHOULDER], landmarks[PL.RIGHT_ELBOW], landmarks[PL.RIGHT_WRIST]
-        r_elbow_angle = _angle_deg(r_sh, r_el, r_wr)
-        r_wrist_far = _dist(r_wr, r_sh) >= TH.punch_wrist_to_shoulder_scale * scale
-        r_wrist_y_align = abs(r_wr.y - r_sh.y) <= TH.punch_wrist_y_align_scale * scale
-         # ▼▼▼ Z軸の条件を追加 ▼▼▼
-    # 手首が肩より前に出ているか (shoulder.z - wrist.z が正の値になる)
-        r_wrist_pushed_forward = (r_sh.z - r_wr.z) >= TH.punch_wrist_z_diff_min
-
-        punch_right = (r_elbow_angle >= TH.punch_elbow_angle_min) and r_wrist_y_align and (r_wrist_far or r_wrist_pushed_forward)
-
-    punch_cond = punch_left or punch_right
-
-    # --- KICK 検出（左右どちらか） ---
-    # 目的: 脚を前に伸ばし上げる動き。直立での誤検出を避けるため、x方向の前方移動量または足首が膝より上を要求。
+    "l_punch": _all(
+        "l_arm",
+        Cmp("l_elbow", ">=", "punch_elbow_angle_min"),
+        Cmp("l_wrist_y_off", "<=", "punch_wrist_y_align_scale", scaled=True),
+        _any(Cmp("l_wrist_shoulder", ">=", "punch_wrist_to_shoulder_scale", scaled=True),
+             Cmp("l_wrist_forward", ">=", "punch_wrist_z_diff_min")),
+    ),
+    "r_punch": _all(
+        "r_arm",
+        Cmp("r_elbow", ">=", "punch_elbow_angle_min"),
+        Cmp("r_wrist_y_off", "<=", "punch_wrist_y_align_scale", scaled=True),
+        _any(Cmp("r_wrist_shoulder", ">=", "punch_wrist_to_shoulder_scale", scaled=True),
+             Cmp("r_wrist_forward", ">=", "punch_wrist_z_diff_min")),
+    ),
+    "punch": _any("l_punch", "r_punch"),
+
+    # --- KICK（左右どちらか） ---
+    # 目的: 脚を前に伸ばし上げる動き。直立での誤検出を避けるため、x方向の前方移動量・足首が膝より上・
+    # Z 方向の前方移動のいずれかを要求。
     # 調整ポイント:
     # - 伸び判定: kick_knee_angle_min
     # - 前方距離: kick_ankle_x_to_hip_scale（大きく→厳しい）
     # - 上昇量: kick_ankle_above_knee_scale（大きく→検出しやすい）
-    kick_left = False
-    kick_right = False
-    if has(PL.LEFT_HIP, PL.LEFT_KNEE, PL.LEFT_ANKLE):
-        l_hip, l_kn, l_an = landmarks[PL.LEFT_HIP], landmarks[PL.LEFT_KNEE], landmarks[PL.LEFT_ANKLE]
-        l_knee_angle = _angle_deg(l_hip, l_kn, l_an)
-        # 誤検出抑止: x方向の前方移動量 or 足首が膝より高い
-        l_ankle_far_x = abs(l_an.x - l_hip.x) >= TH.kick_ankle_x_to_hip_scale * scale
-        l_ankle_above_knee = (l_an.y + TH.kick_ankle_above_knee_scale * scale) <= l_kn.y
-
-        # ▼▼▼ Z軸の条件を追加 ▼▼▼
-        l_ankle_pushed_forward = (l_hip.z - l_an.z) >= TH.kick_ankle_z_diff_min
-        kick_left = (l_knee_angle >= TH.kick_knee_angle_min) and (l_ankle_far_x or l_ankle_above_knee or l_ankle_pushed_forward)
-
-    if has(PL.RIGHT_HIP, PL.RIGHT_KNEE, PL.RIGHT_ANKLE):
-        r_hip, r_kn, r_an = landmarks[PL.RIGHT_HIP], landmarks[PL.RIGHT_KNEE], landmarks[PL.RIGHT_ANKLE]
-        r_knee_angle = _angle_deg(r_hip, r_kn, r_an)
-        r_ankle_far_x = abs(r_an.x - r_hip.x) >= TH.kick_ankle_x_to_hip_scale * scale
-        r_ankle_above_knee = (r_an.y + TH.kick_ankle_above_knee_scale * scale) <= r_kn.y
-
-        # ▼▼▼ Z軸の条件を追加 ▼▼▼
-        r_ankle_pushed_forward = (r_hip.z - r_an.z) >= TH.kick_ankle_z_diff_min
-        kick_right = (r_knee_angle >= TH.kick_knee_angle_min) and (r_ankle_far_x or r_ankle_above_knee or r_ankle_pushed_forward)
-
-    kick_cond = kick_left or kick_right
-
-     # --- FORWARD 検出（前傾姿勢） ---
-    forward_cond = False
-    if has(PL.LEFT_SHOULDER, PL.LEFT_HIP, PL.RIGHT_SHOULDER, PL.RIGHT_HIP):
-        l_sh, l_hip = landmarks[PL.LEFT_SHOULDER], landmarks[PL.LEFT_HIP]
-        r_sh, r_hip = landmarks[PL.RIGHT_SHOULDER], landmarks[PL.RIGHT_HIP]
-
-        # 両肩と両腰の平均座標を計算
-        avg_sh_z = (l_sh.z + r_sh.z) / 2
-        avg_hip_z = (l_hip.z + r_hip.z) / 2
-
-        # 平均座標を使って、上半身全体が前に傾いているか判定
-        forward_cond = (avg_hip_z - avg_sh_z) >= TH.forward_lean_z_diff_min
-
-    # --- BACKWARD 検出（後傾姿勢） ---
-    backward_cond = False
-    if has(PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER, PL.LEFT_ANKLE, PL.RIGHT_ANKLE):
-        l_sh, r_sh = landmarks[PL.LEFT_SHOULDER], landmarks[PL.RIGHT_SHOULDER]
-        l_an, r_an = landmarks[PL.LEFT_ANKLE], landmarks[PL.RIGHT_ANKLE]
-
-        # 両肩と両足首の平均Z座標を計算
-        avg_sh_z = (l_sh.z + r_sh.z) / 2
-        avg_an_z = (l_an.z + r_an.z) / 2
-
-        # 肩が足首より後ろにあるかで判定
-        lean_value = avg_sh_z - avg_an_z
-        print(f"Backward Lean (Shoulder-Ankle Z): {lean_value:.2f} / Req: {TH.backward_lean_shoulders_ankles_z_diff}")
-
-        backward_cond = lean_value >= TH.backward_lean_shoulders_ankles_z_diff
-      # --- CROUCH 検出（左右どちらか） ---
-    crouch_left = False
-    crouch_right = False
-    if has(PL.LEFT_HIP, PL.LEFT_KNEE, PL.LEFT_ANKLE):
-        l_hip, l_kn, l_an = landmarks[PL.LEFT_HIP], landmarks[PL.LEFT_KNEE], landmarks[PL.LEFT_ANKLE]
-        l_knee_angle = _angle_deg(l_hip, l_kn, l_an)
-
-        # ▼▼▼ 新しい判定ロジック ▼▼▼
-        # 腰と足首のY座標（垂直方向）の距離を計算
-        l_hip_ankle_dist_y = abs(l_hip.y - l_an.y)
-        # 距離がしきい値以下かチェック
-        l_hip_low_enough = l_hip_ankle_dist_y <= (TH.crouch_hip_ankle_dist_max * scale)
-
-        crouch_left = (l_knee_angle <= TH.crouch_knee_angle_max) and l_hip_low_enough
-
-    if has(PL.RIGHT_HIP, PL.RIGHT_KNEE, PL.RIGHT_ANKLE):
-        r_hip, r_kn, r_an = landmarks[PL.RIGHT_HIP], landmarks[PL.RIGHT_KNEE], landmarks[PL.RIGHT_ANKLE]
-        r_knee_angle = _angle_deg(r_hip, r_kn, r_an)
-
-        # ▼▼▼ 新しい判定ロジック ▼▼▼
-        r_hip_ankle_dist_y = abs(r_hip.y - r_an.y)
-        r_hip_low_enough = r_hip_ankle_dist_y <= (TH.crouch_hip_ankle_dist_max * scale)
-
-        crouch_right = (r_knee_angle <= TH.crouch_knee_angle_max) and r_hip_low_enough
-
-    crouch_cond = crouch_left or crouch_right
-
-    # --- CROUCH_PUNCH 検出（しゃがみ＋片腕伸展） ---
-    crouch_punch_cond = False
-    crouch_punch_cond = (crouch_left or crouch_right) and (punch_left or punch_right)
-
-    # --- CROUCH_KICK 検出（しゃがみ＋片脚前方伸展） ---
-    crouch_kick_cond = False
-    crouch_kick_cond = (crouch_left or crouch_right) and (kick_left or kick_right)
-
-    # --- CROUCH_GUARD 検出（しゃがみ＋両手ガード） ---
-    crouch_guard_cond = crouch_cond and guard_cond
-
-    # --- 優先順位で判定 ---
-    if crouch_punch_cond:
-        return "CROUCH_PUNCH"
-    if crouch_kick_cond:
-        return "CROUCH_KICK"
-    if punch_cond:
-        return "PUNCH"
-    if kick_cond:
-        return "KICK"
-    if crouch_guard_cond:
-        return "CROUCH_GUARD"
-    if guard_cond:
-        return "GUARD"
-    if crouch_cond:
-        return "CROUCH"
-    if forward_cond:
-        return "FORWARD"
-    if backward_cond:
-        return "BACKWARD"
-    return "STAND"
-
-
-def classify_pose_from_results(results) -> str:
+    "l_kick": _all(
+        "l_leg",
+        Cmp("l_knee", ">=", "kick_knee_angle_min"),
+        _any(Cmp("l_ankle_x_off", ">=", "kick_ankle_x_to_hip_scale", scaled=True),
+             Cmp("l_ankle_above_knee", ">=", "kick_ankle_above_knee_scale", scaled=True),
+             Cmp("l_ankle_forward", ">=", "kick_ankle_z_diff_min")),
+    ),
+    "r_kick": _all(
+        "r_leg",
+        Cmp("r_knee", ">=", "kick_knee_angle_min"),
+        _any(Cmp("r_ankle_x_off", ">=", "kick_ankle_x_to_hip_scale", scaled=True),
+             Cmp("r_ankle_above_knee", ">=", "kick_ankle_above_knee_scale", scaled=True),
+             Cmp("r_ankle_forward", ">=", "kick_ankle_z_diff_min")),
+    ),
+    "kick": _any("l_kick", "r_kick"),
+
+    # --- CROUCH（左右どちらか）: 膝が曲がっていて、腰が足首に十分近い ---
+    "l_crouch": _all(
+        "l_leg",
+        Cmp("l_knee", "<=", "crouch_knee_angle_max"),
+        Cmp("l_hip_ankle_y", "<=", "crouch_hip_ankle_dist_max", scaled=True),
+    ),
+    "r_crouch": _all(
+        "r_leg",
+        Cmp("r_knee", "<=", "crouch_knee_angle_max"),
+        Cmp("r_hip_ankle_y", "<=", "crouch_hip_ankle_dist_max", scaled=True),
+    ),
+    "crouch": _any("l_crouch", "r_crouch"),
+
+    # --- FORWARD（前傾: 肩が腰より前）/ BACKWARD（後傾: 肩が足首より後ろ） ---
+    "forward": _all(
+        Visible((PL.LEFT_SHOULDER, PL.LEFT_HIP, PL.RIGHT_SHOULDER, PL.RIGHT_HIP)),
+        Cmp("forward_lean", ">=", "forward_lean_z_diff_min"),
+    ),
+    "backward": _all(
+        Visible((PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER, PL.LEFT_ANKLE, PL.RIGHT_ANKLE)),
+        Cmp("backward_lean", ">=", "backward_lean_shoulders_ankles_z_diff",
+            trace="Backward Lean (Shoulder-Ankle Z)"),
+    ),
+}
+
+# 優先順位（上から順に評価し、最初に成立したものを返す）。どれも成立しなければ DEFAULT_POSE
+RULES = (
+    ("CROUCH_PUNCH", _all("crouch", "punch")),
+    ("CROUCH_KICK", _all("crouch", "kick")),
+    ("PUNCH", "punch"),
+    ("KICK", "kick"),
+    ("CROUCH_GUARD", _all("crouch", "guard")),
+    ("GUARD", "guard"),
+    ("CROUCH", "crouch"),
+    ("FORWARD", "forward"),
+    ("BACKWARD", "backward"),
+)
+DEFAULT_POSE = "STAND"
+
+_OPS = {"<=": operator.le, ">=": operator.ge}
+
+
+class CompiledRules:
+    """ルール表を1つの Thresholds で評価器にしたもの（compile_rules で作る）。
+
+    1フレーム用の評価では、特徴量・名前付き条件の値をフレームごとのリスト（slots）に入れて使い回す。
+    """
+
+    def __init__(self, th: Thresholds, features=None, predicates=None, rules=None, default: str = DEFAULT_POSE):
+        self.th = th
+        self.features = FEATURES if features is None else features
+        self.predicates = PREDICATES if predicates is None else predicates
+        self.rules = RULES if rules is None else rules
+        self.default = default
+        for _, _, threshold, _, _ in self._cmps(self.predicates.values(), *(p for _, p in self.rules)):
+            getattr(th, threshold)  # 表の書き間違いはここで分かるようにする
+        self._slots: Dict[str, int] = {}
+        self._scalar_cache: Dict[str, Callable] = {}
+        self._rules = [(name, self._scalar(pred)) for name, pred in self.rules]
+        self._batch_features = [key[2:] for key in self._slots if key.startswith("f:")]
+
+    def _cmps(self, *nodes):
+        for node in nodes:
+            if isinstance(node, Cmp):
+                yield node
+            elif isinstance(node, (All, AnyOf)):
+                yield from self._cmps(*node.terms)
+
+    # --- 1フレーム用（遅延評価） ---
+    def classify(self, landmarks: Sequence[LandmarkLike]) -> str:
+        if not landmarks or len(landmarks) < 29:
+            return "IDLE"
+        scale = _get_scale(landmarks, self.th)
+        if not scale:
+            return "IDLE"
+        slots = [None] * len(self._slots)
+        for name, pred in self._rules:
+            if pred(slots, landmarks, scale):
+                return name
+        return self.default
+
+    def _cached(self, name: str, compute: Callable) -> Callable:
+        # 名前付きの特徴量・条件はフレーム内で1回だけ計算する
+        i = self._slots.setdefault(name, len(self._slots))
+
+        def cached(slots, lm, scale):
+            value = slots[i]
+            if value is None:
+                value = slots[i] = compute(slots, lm, scale)
+            return value
+        return cached
+
+    def _scalar_feature(self, feature) -> Callable:
+        if isinstance(feature, str):
+            key = "f:" + feature
+            if key not in self._scalar_cache:
+                self._scalar_cache[key] = self._cached(key, self._scalar_feature(self.features[feature]))
+            return self._scalar_cache[key]
+        if isinstance(feature, Angle):
+            a, b, c = feature
+            return lambda slots, lm, scale: _angle_deg(lm[a], lm[b], lm[c])
+        if isinstance(feature, Dist):
+            a, b = feature
+            return lambda slots, lm, scale: _dist(lm[a], lm[b])
+        if isinstance(feature, Delta):
+            axis, a, b, absolute = feature
+            a = a if isinstance(a, tuple) else (a,)
+            b = b if isinstance(b, tuple) else (b,)
+
+            def delta(slots, lm, scale):
+                d = (sum(getattr(lm[i], axis) for i in a) / len(a)
+                     - sum(getattr(lm[i], axis) for i in b) / len(b))
+                return abs(d) if absolute else d
+            return delta
+        raise TypeError(f"unknown feature: {feature!r}")
+
+    def _scalar(self, pred) -> Callable:
+        if isinstance(pred, str):
+            key = "p:" + pred
+            if key not in self._scalar_cache:
+                self._scalar_cache[key] = self._cached(key, self._scalar(self.predicates[pred]))
+            return self._scalar_cache[key]
+        if isinstance(pred, Visible):
+            idx, min_vis = pred.idx, self.th.min_visibility
+            return lambda slots, lm, scale: all(_is_visible(lm[i], min_vis) for i in idx)
+        if isinstance(pred, Cmp):
+            get = self._scalar_feature(pred.feature)
+            op, limit = _OPS[pred.op], getattr(self.th, pred.threshold)
+            if pred.trace:
+                trace = pred.trace
+
+                def traced(slots, lm, scale):
+                    value = get(slots, lm, scale)
+                    print(f"{trace}: {value:.2f} / Req: {limit}")
+                    return op(value, limit * scale if pred.scaled else limit)
+                return traced
+            if pred.scaled:
+                return lambda slots, lm, scale: op(get(slots, lm, scale), limit * scale)
+            return lambda slots, lm, scale: op(get(slots, lm, scale), limit)
+        if isinstance(pred, All):
+            terms = [self._scalar(t) for t in pred.terms]
+
+            def all_of(slots, lm, scale):
+                for term in terms:
+                    if not term(slots, lm, scale):
+                        return False
+                return True
+            return all_of
+        if isinstance(pred, AnyOf):
+            terms = [self._scalar(t) for t in pred.terms]
+
+            def any_of(slots, lm, scale):
+                for term in terms:
+                    if term(slots, lm, scale):
+                        return True
+                return False
+            return any_of
+        raise TypeError(f"unknown predicate: {pred!r}")
+
+    # --- バッチ用（NumPy。参照される特徴量・条件を全フレーム分1回ずつ計算する） ---
+    def codes(self, batch: np.ndarray) -> np.ndarray:
+        th = self.th
+        a = np.asarray(batch, dtype=np.float64)
+        if a.ndim != 3 or a.shape[-1] != 4:
+            raise ValueError(f"expected (N, 33, 4) landmarks, got shape {a.shape}")
+        n = a.shape[0]
+        if a.shape[1] < 29:
+            return np.zeros(n, dtype=np.uint8)
+
+        cols = {"x": a[:, :, 0], "y": a[:, :, 1], "z": a[:, :, 2]}
+        x, y = cols["x"], cols["y"]
+        vis = a[:, :, 3] >= th.min_visibility
+
+        def dist(i: int, j: int) -> np.ndarray:
+            return np.hypot(x[:, i] - x[:, j], y[:, i] - y[:, j])
+
+        # スケール: 肩幅、無理なら腰幅（_get_scale と同じ）
+        sh_w = dist(PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER)
+        hip_w = dist(PL.LEFT_HIP, PL.RIGHT_HIP)
+        sh_ok = vis[:, PL.LEFT_SHOULDER] & vis[:, PL.RIGHT_SHOULDER] & (sh_w > 0)
+        hip_ok = vis[:, PL.LEFT_HIP] & vis[:, PL.RIGHT_HIP] & (hip_w > 0)
+        valid = sh_ok | hip_ok
+        scale = np.where(sh_ok, sh_w, hip_w)
+
+        cache: Dict[str, np.ndarray] = {}
+
+        def mean(axis: str, idx) -> np.ndarray:
+            if isinstance(idx, tuple):
+                return functools.reduce(operator.add, [cols[axis][:, i] for i in idx]) / len(idx)
+            return cols[axis][:, idx]
+
+        def feature(f) -> np.ndarray:
+            if isinstance(f, str):
+                key = "f:" + f
+                if key not in cache:
+                    cache[key] = feature(self.features[f])
+                return cache[key]
+            if isinstance(f, Angle):
+                return _batch_angle_deg(x, y, *f)
+            if isinstance(f, Dist):
+                return dist(*f)
+            if isinstance(f, Delta):
+                d = mean(f.axis, f.a) - mean(f.axis, f.b)
+                return np.abs(d) if f.absolute else d
+            raise TypeError(f"unknown feature: {f!r}")
+
+        def pred(p) -> np.ndarray:
+            if isinstance(p, str):
+                key = "p:" + p
+                if key not in cache:
+                    cache[key] = pred(self.predicates[p])
+                return cache[key]
+            if isinstance(p, Visible):
+                return functools.reduce(operator.and_, [vis[:, i] for i in p.idx])
+            if isinstance(p, Cmp):
+                limit = getattr(th, p.threshold)
+                return _OPS[p.op](feature(p.feature), limit * scale if p.scaled else limit)
+            if isinstance(p, All):
+                return functools.reduce(operator.and_, [pred(t) for t in p.terms])
+            if isinstance(p, AnyOf):
+                return functools.reduce(operator.or_, [pred(t) for t in p.terms])
+            raise TypeError(f"unknown predicate: {p!r}")
+
+        # 特徴量を先にまとめて計算しておく（条件の評価と交互に確保するより一時配列の扱いが速い）
+        for name in self._batch_features:
+            feature(name)
+        codes = np.select(
+            [pred(p) for _, p in self.rules],
+            [POSE_CODES[name] for name, _ in self.rules],
+            default=POSE_CODES[self.default],
+        ).astype(np.uint8)
+        codes[~valid] = POSE_CODES["IDLE"]
+        return codes
+
+
+@functools.lru_cache(maxsize=8)
+def _compile_rules(th: Thresholds) -> CompiledRules:
+    return CompiledRules(th)
+
+
+_compiled_by_id: Dict[int, CompiledRules] = {}
+
+
+def compile_rules(th: Thresholds) -> CompiledRules:
+    """ルール表を th のしきい値で評価器にする（同じ Thresholds なら使い回す）。"""
+    # 毎フレーム呼ばれるので、同じオブジェクトならハッシュ計算も省く（P1/P2 で別プロファイルでも）
+    compiled = _compiled_by_id.get(id(th))
+    if compiled is None or compiled.th is not th:
+        compiled = _compile_rules(th)
+        if len(_compiled_by_id) >= 16:
+            _compiled_by_id.clear()
+        _compiled_by_id[id(th)] = compiled
+    return compiled
+
+
+def classify_pose_from_landmarks(landmarks: Sequence[LandmarkLike], th: Optional[Thresholds] = None) -> str:
+    """MediaPipeの landmarks (list of 33) を受け取り、ポーズ名を返す（判定条件は RULES）."""
+    return compile_rules(th or PROFILES.get()).classify(landmarks)
+
+
+def classify_pose_from_results(results, th: Optional[Thresholds] = None) -> str:
     """MediaPipe の results から直接判定。pose_landmarks が無ければ "IDLE"。"""
     if not getattr(results, "pose_landmarks", None):
         return "IDLE"
-    return classify_pose_from_landmarks(results.pose_landmarks.landmark)
+    return classify_pose_from_landmarks(results.pose_landmarks.landmark, th)
+
+
+# ---------------------------------------------------------------------------
+# 配列版（NumPy ベクトル化）
+#
+# ランドマークを (33, 4) = [x, y, z, visibility] の float 配列で受け取り、
+# 角度・距離を全フレーム分まとめて1回ずつ計算する。判定条件・優先順位は classify_pose_from_landmarks と
+# 同じルール表 (RULES) から作る（オフライン評価・リプレイ・大量フレームの一括判定用）。
+#
+#   arr = landmarks_to_array(results.pose_landmarks.landmark)   # (33, 4) float32
+#   classify_pose_from_array(arr)          # -> "PUNCH" など
+#   classify_pose_batch(arr_batch)         # (N, 33, 4) -> N 個のポーズ名
+# ---------------------------------------------------------------------------
+
+# ポーズ名とコード（uint8）の対応。0 は IDLE（判定不能）。
+POSE_LABELS = (
+    "IDLE", "PUNCH", "KICK", "GUARD", "FORWARD", "BACKWARD",
+    "STAND", "CROUCH", "CROUCH_PUNCH", "CROUCH_KICK", "CROUCH_GUARD",
+)
+POSE_CODES = {name: code for code, name in enumerate(POSE_LABELS)}
+_LABELS_ARRAY = np.array(POSE_LABELS, dtype=object)
+
+
+def landmarks_to_array(landmarks: Sequence[LandmarkLike]) -> np.ndarray:
+    """landmark オブジェクト列を (len, 4) float32 配列 [x, y, z, visibility] に変換する。"""
+    return np.array(
+        [(lm.x, lm.y, lm.z, getattr(lm, "visibility", 1.0)) for lm in landmarks],
+        dtype=np.float32,
+    ).reshape(-1, 4)
+
+
+def _batch_angle_deg(x: np.ndarray, y: np.ndarray, a: int, b: int, c: int) -> np.ndarray:
+    """_angle_deg の配列版。b を頂点とする ∠abc [deg]。ベクトル長 0 のときは 0.0。"""
+    v1x, v1y = x[:, a] - x[:, b], y[:, a] - y[:, b]
+    v2x, v2y = x[:, c] - x[:, b], y[:, c] - y[:, b]
+    n1 = np.hypot(v1x, v1y)
+    n2 = np.hypot(v2x, v2y)
+    degenerate = (n1 == 0) | (n2 == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosang = np.clip((v1x * v2x + v1y * v2y) / (n1 * n2), -1.0, 1.0)
+    return np.where(degenerate, 0.0, np.degrees(np.arccos(cosang)))
+
+
+def classify_pose_codes(batch: np.ndarray, th: Optional[Thresholds] = None) -> np.ndarray:
+    """(N, 33, 4) 配列を受け取り、ポーズコード (uint8, POSE_LABELS の添字) を N 個返す（判定条件は RULES）。"""
+    return compile_rules(th or PROFILES.get()).codes(batch)
+
+
+def classify_pose_batch(batch: np.ndarray, th: Optional[Thresholds] = None) -> List[str]:
+    """(N, 33, 4) 配列を受け取り、N 個のポーズ名を返す。"""
+    return _LABELS_ARRAY[classify_pose_codes(batch, th)].tolist()
+
+
+def classify_pose_from_array(landmarks: np.ndarray, th: Optional[Thresholds] = None) -> str:
+    """(33, 4) 配列 [x, y, z, visibility] を受け取り、ポーズ名を返す。"""
+    arr = np.asarray(landmarks)
+    return POSE_LABELS[int(classify_pose_codes(arr.reshape(1, *arr.shape), th)[0])]
 
 
 # 簡易動作テスト（任意）: カメラから読み取り、現在のポーズ名を標準出力
@@ -371,10 +804,11 @@ if __name__ == "__main__":  # pragma: no cover
 
     mp_pose = mp.solutions.pose
 
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    if not cap.isOpened():
+    from video_source import source_from_env
+
+    # POSE_SOURCE=file:<path> / synthetic でカメラ以外からも流せる（video_source.py）
+    cap = source_from_env(width=640, height=480)
+    if not cap.is_opened():
         print("Error: Camera not found.")
         raise SystemExit(1)
 
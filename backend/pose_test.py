@@ -3,22 +3,32 @@ Task 1.2: Webカメラを起動し、MediaPipeで骨格ランドマークを取
 必要: pip install opencv-python mediapipe
 終了: 'q'キー
 """
+import os
+import time
+
 import cv2
 import mediapipe as mp
 
 # 追加: 2.1 のポーズ判定ロジック
-from pose_logic import classify_pose_from_results
+from pose_logic import PROFILES
+from stabilizer import PoseStabilizer, StabilizerConfig
+from video_source import source_from_env
 
 mp_pose = mp.solutions.pose
 mp_drawing = mp.solutions.drawing_utils
 
-# フレーム間スムージング設定: 同じポーズがこのフレーム数続いたら確定
-SMOOTHING_STREAK = 3
+# スムージング設定: 同じポーズが一定時間続いたら確定（POSE_HOLD_MS / POSE_ATTACK_HOLD_MS / POSE_FILTER、stabilizer.py）
+STABILIZER = StabilizerConfig.from_env()
 
 
 def main():
-    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)  # CAP_DSHOWはWindowsでのカメラ遅延回避用
-    if not cap.isOpened():
+    # 映像ソースは POSE_SOURCE で切り替え可能（既定 camera:0。file:<path> / synthetic）
+    # CAP_DSHOWはWindowsでのカメラ遅延回避用
+    cap = source_from_env(api=cv2.CAP_DSHOW if os.name == "nt" else None)
+    # POSE_THRESHOLDS=thresholds.json を指定すると、ファイルを保存するたびにしきい値が反映される
+    if os.environ.get("POSE_THRESHOLDS"):
+        PROFILES.watch(os.environ["POSE_THRESHOLDS"])
+    if not cap.is_opened():
         print("Error: Camera not found.")
         return
 
@@ -36,9 +46,8 @@ def main():
 
     with mp_pose.Pose(model_complexity=1, enable_segmentation=False) as pose:
         # スムージング用状態
+        stabilizer = PoseStabilizer(STABILIZER)
         stable_pose_name = "IDLE"
-        candidate_pose = None
-        candidate_count = 0
         while True:
             ret, frame = cap.read()
             if not ret:
@@ -48,24 +57,11 @@ def main():
             rgb.flags.writeable = False
             results = pose.process(rgb)
 
-            # 現在フレームの生ポーズ推定
-            pose_raw = classify_pose_from_results(results)
-
-            # ヒステリシス: 一定フレーム同じなら確定
-            if pose_raw == stable_pose_name:
-                candidate_pose = None
-                candidate_count = 0
-            else:
-                if pose_raw == candidate_pose:
-                    candidate_count += 1
-                else:
-                    candidate_pose = pose_raw
-                    candidate_count = 1
-                if candidate_count >= SMOOTHING_STREAK:
-                    stable_pose_name = candidate_pose
-                    print("POSE:", stable_pose_name)
-                    candidate_pose = None
-                    candidate_count = 0
+            # 現在フレームのポーズ推定 + ヒステリシス（一定時間同じなら確定）
+            pose = stabilizer.update_results(results, time.perf_counter())
+            if pose != stable_pose_name:
+                stable_pose_name = pose
+                print(f"POSE: {stable_pose_name} (+{stabilizer.last_delay * 1000:.0f}ms)")
 
             # ビジュアライズ（確定ポーズを表示）
             vis = frame.copy()
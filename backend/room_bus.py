@@ -0,0 +1,308 @@
+"""
+ワーカー間で部屋を共有するためのメッセージバス（gunicorn --workers 2 以上用）
+
+WebSocket の状態（試合・接続）はプロセスのメモリにあるので、これまでは gunicorn を --workers 1 で
+動かすしかなかった。ワーカーを増やすときは試合の進行を1つのルームホスト（room_host.py）にまとめ、
+各ワーカーは接続を持って入力をホストへ送り、ホストから届く部屋のメッセージを自分の接続に配るだけに
+する（matches.py の RoomRelay）。送受信と JSON の受け渡しはワーカー数ぶんのコアに分かれる。
+
+バスはトピックに publish / subscribe するだけの pub/sub:
+    "host"           ワーカー → ホスト（入室・退室・入力・部屋の予約）
+    "w.<ワーカーID>"   ホスト → ワーカー個別（入室の応答）
+    "room.<部屋ID>"   ホスト → その部屋に接続を持つワーカー（game_state / game_event）
+    "rooms"          ホスト → 全ワーカー（部屋の一覧と計測値、1秒ごと）
+1つの送り手から1つのトピックへの publish は、送った順に届く（ブローカーは届いた順に転送する）。
+部屋のメッセージを送るのはホストだけなので、部屋ごとの順序はそのまま保たれる。
+
+トランスポートは URL で選ぶ（環境変数 ROOM_BUS）:
+    unix:<path>    Unix ドメインソケット（既定。UnixSocketBroker が中継する）
+外部のブローカー（Redis など）は register_transport("redis", factory) で足す。factory は URL を受け取り、
+start(on_message) / subscribe(topic) / unsubscribe(topic) / publish(topic, data) / close() を持つ
+オブジェクトを返すこと（publish はブロックせず、同じトピックへは送った順に届けること）。
+
+RoomBus はペイロードの先頭に送信時刻（time.time()）を付け、受け取ったときの差を /metrics の
+bus_hop に記録する（ワーカー → ホスト、ホスト → ワーカーの1ホップずつの遅れ）。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+from metrics import METRICS
+
+# Unix ドメインソケットのフレーム: [長さ uint32][種別 uint8][トピック長 uint8][トピック][データ]
+_LENGTH = struct.Struct(">I")
+_KIND = struct.Struct(">BB")
+KIND_PUB = 1
+KIND_SUB = 2
+KIND_UNSUB = 3
+_SENT_AT = struct.Struct(">d")
+
+# ブローカーが1つの購読者に溜めてよい未送信バイト数。超えた購読者は切る（つなぎ直させる）
+BROKER_MAX_BUFFER = 8 * 1024 * 1024
+# 切断中に publish された分を溜めておく件数（つながったら送る）
+PENDING_MAX = 10000
+
+
+def _frame(kind: int, topic: str, data: bytes = b"") -> bytes:
+    name = topic.encode()
+    body = _KIND.pack(kind, len(name)) + name + data
+    return _LENGTH.pack(len(body)) + body
+
+
+class UnixSocketBroker:
+    """Unix ドメインソケットの中継。PUB をそのトピックを購読している全接続へ、届いた順にそのまま転送する。"""
+
+    def __init__(self, path: str, max_buffer: int = BROKER_MAX_BUFFER):
+        self.path = path
+        self.max_buffer = max_buffer
+        self._subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def start(self) -> "UnixSocketBroker":
+        """裏のスレッドで待ち受けを始める（待ち受けが始まってから戻る）。"""
+        threading.Thread(target=self._run, name="room-bus-broker", daemon=True).start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self) -> None:
+        asyncio.run(self._serve())
+
+    async def _serve(self) -> None:
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            server = await asyncio.start_unix_server(self._handle, self.path)
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        topics: Set[str] = set()
+        try:
+            while True:
+                header = await reader.readexactly(_LENGTH.size)
+                body = await reader.readexactly(_LENGTH.unpack(header)[0])
+                kind, length = _KIND.unpack_from(body)
+                topic = body[_KIND.size:_KIND.size + length].decode()
+                if kind == KIND_PUB:
+                    frame = header + body
+                    for subscriber in tuple(self._subscribers.get(topic, ())):
+                        if subscriber.transport.get_write_buffer_size() > self.max_buffer:
+                            METRICS.inc("bus_slow_subscriber_disconnects")
+                            subscriber.transport.abort()
+                            continue
+                        subscriber.write(frame)
+                elif kind == KIND_SUB:
+                    self._subscribers.setdefault(topic, set()).add(writer)
+                    topics.add(topic)
+                elif kind == KIND_UNSUB:
+                    self._unsubscribe(topic, writer)
+                    topics.discard(topic)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for topic in topics:
+                self._unsubscribe(topic, writer)
+            writer.close()
+
+    def _unsubscribe(self, topic: str, writer: asyncio.StreamWriter) -> None:
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(writer)
+            if not subscribers:
+                del self._subscribers[topic]
+
+
+class UnixSocketTransport:
+    """UnixSocketBroker につなぐクライアント。切れたらつなぎ直し、購読し直す。
+
+    publish はキューに積むだけで、送信スレッドが溜まった分をまとめて書き込む。
+    on_message(topic, data) は受信スレッドから呼ばれる（届いた順に1つずつ）。
+    """
+
+    def __init__(self, path: str, pending_max: int = PENDING_MAX, retry: float = 0.2):
+        self.path = path
+        self.retry = retry
+        self._topics: Set[str] = set()
+        self._pending: collections.deque = collections.deque()
+        self._pending_max = pending_max
+        self._cond = threading.Condition()
+        self._sock: Optional[socket.socket] = None
+        self._closed = False
+        self._on_message: Optional[Callable[[str, bytes], None]] = None
+        self.connects = 0
+        self.dropped = 0
+
+    def start(self, on_message: Callable[[str, bytes], None]) -> None:
+        self._on_message = on_message
+        threading.Thread(target=self._reader, name="room-bus-reader", daemon=True).start()
+        threading.Thread(target=self._writer, name="room-bus-writer", daemon=True).start()
+
+    def subscribe(self, topic: str) -> None:
+        with self._cond:
+            self._topics.add(topic)
+            self._enqueue(_frame(KIND_SUB, topic))
+
+    def unsubscribe(self, topic: str) -> None:
+        with self._cond:
+            self._topics.discard(topic)
+            self._enqueue(_frame(KIND_UNSUB, topic))
+
+    def publish(self, topic: str, data: bytes) -> None:
+        with self._cond:
+            self._enqueue(_frame(KIND_PUB, topic, data))
+
+    def _enqueue(self, frame: bytes) -> None:
+        if len(self._pending) >= self._pending_max:
+            self._pending.popleft()
+            self.dropped += 1
+            METRICS.inc("bus_dropped")
+        self._pending.append(frame)
+        self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            sock, self._sock = self._sock, None
+            self._cond.notify_all()
+        if sock is not None:
+            sock.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {"connected": self._sock is not None, "connects": self.connects,
+                "pending": len(self._pending), "dropped": self.dropped}
+
+    def _connect(self) -> socket.socket:
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                return sock
+            except OSError:
+                sock.close()
+                if self._closed:
+                    raise
+                time.sleep(self.retry)
+
+    def _reader(self) -> None:
+        while not self._closed:
+            try:
+                sock = self._connect()
+            except OSError:
+                return
+            with self._cond:
+                # 購読をつなぎ直した接続の先頭で送り直す（切断中に溜まった publish より先に）
+                self._pending.extendleft(reversed([_frame(KIND_SUB, t) for t in self._topics]))
+                self._sock = sock
+                self.connects += 1
+                self._cond.notify_all()
+            try:
+                stream = sock.makefile("rb")
+                while True:
+                    header = stream.read(_LENGTH.size)
+                    if len(header) < _LENGTH.size:
+                        break
+                    body = stream.read(_LENGTH.unpack(header)[0])
+                    _, length = _KIND.unpack_from(body)
+                    topic = body[_KIND.size:_KIND.size + length].decode()
+                    try:
+                        self._on_message(topic, body[_KIND.size + length:])
+                    except Exception as e:
+                        print(f"Room bus handler error: {e}")
+            except (OSError, ValueError):
+                pass
+            with self._cond:
+                if self._sock is sock:
+                    self._sock = None
+            sock.close()
+            if not self._closed:
+                print(f"Room bus disconnected from {self.path}, reconnecting...")
+                time.sleep(self.retry)
+
+    def _writer(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and (self._sock is None or not self._pending):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                sock = self._sock
+                batch = b"".join(self._pending)
+                self._pending.clear()
+            try:
+                sock.sendall(batch)
+            except OSError:
+                # 受信スレッドが切断に気づいてつなぎ直す。書けなかった分は捨てる
+                METRICS.inc("bus_dropped")
+                with self._cond:
+                    if self._sock is sock:
+                        self._sock = None
+                sock.close()
+
+
+def _unix_transport(url: str) -> UnixSocketTransport:
+    return UnixSocketTransport(url.partition(":")[2])
+
+
+TRANSPORTS: Dict[str, Callable[[str], object]] = {"unix": _unix_transport}
+
+
+def register_transport(scheme: str, factory: Callable[[str], object]) -> None:
+    """外部ブローカー用のトランスポートを足す（例: register_transport("redis", RedisTransport)）。"""
+    TRANSPORTS[scheme] = factory
+
+
+class RoomBus:
+    """トランスポートの上に送信時刻を載せ、1ホップの遅れを bus_hop に記録する。"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._on_message: Optional[Callable[[str, bytes], None]] = None
+
+    def start(self, on_message: Callable[[str, bytes], None]) -> "RoomBus":
+        self._on_message = on_message
+        self.transport.start(self._receive)
+        if hasattr(self.transport, "stats"):
+            METRICS.gauge("room_bus", self.transport.stats)
+        return self
+
+    def subscribe(self, topic: str) -> None:
+        self.transport.subscribe(topic)
+
+    def unsubscribe(self, topic: str) -> None:
+        self.transport.unsubscribe(topic)
+
+    def publish(self, topic: str, data: bytes) -> None:
+        self.transport.publish(topic, _SENT_AT.pack(time.time()) + data)
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def _receive(self, topic: str, data: bytes) -> None:
+        (sent_at,) = _SENT_AT.unpack_from(data)
+        METRICS.observe("bus_hop", max(time.time() - sent_at, 0.0))
+        self._on_message(topic, data[_SENT_AT.size:])
+
+
+def open_bus(url: str) -> RoomBus:
+    """ROOM_BUS の URL（unix:/tmp/gafa-rooms.sock など）から RoomBus を作る（start はまだ呼ばない）。"""
+    scheme = url.partition(":")[0].lower()
+    factory = TRANSPORTS.get(scheme)
+    if factory is None:
+        raise ValueError(f"unknown room bus transport: {url!r} (known: {', '.join(sorted(TRANSPORTS))})")
+    return RoomBus(factory(url))
@@ -0,0 +1,147 @@
+"""
+ルームホスト: ワーカー間で共有する部屋の試合を1プロセスで進める（room_bus.py 参照）
+
+gunicorn のワーカー数が 2 以上のとき gunicorn.conf.py が起動する。手で動かすときは:
+    python room_host.py unix:/tmp/gafa-rooms.sock          # unix: ならブローカーもここで立てる
+    ROOM_BUS=unix:/tmp/gafa-rooms.sock gunicorn app:app --workers 4 --worker-class gevent
+
+- 試合の進行・入室（P1 / P2 の割り当て）・ランドマークの一括分類は、このプロセスの matches.py が
+  これまでどおり行う。違うのは送り先で、試合のメッセージは部屋ごとに1回だけ "room.<ID>" に publish し、
+  その部屋に接続を持つ各ワーカーが自分の接続へ配る。
+- 部屋の一覧・要約・ホストの計測値（bus_hop・game_tick）は1秒ごとに "rooms" に publish する
+  （ワーカーの GET /rooms と /metrics の gauges.rooms / gauges.room_host はこれを返す）。
+- ワーカーは1秒ごとに生存を知らせる。WORKER_TIMEOUT 秒届かなければ（ワーカーが落ちた・再起動した）
+  そのワーカーの接続は退室させる。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict
+
+# このプロセスの matches は試合を自分で持つ（ROOM_BUS はワーカー用）
+ROOM_BUS = os.environ.pop("ROOM_BUS", None)
+
+import matches  # noqa: E402
+from matches import OP_ALIVE, OP_BINARY, OP_JOIN, OP_LEAVE, OP_RESERVE, OP_TEXT, Seat  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from room_bus import UnixSocketBroker, open_bus  # noqa: E402
+from wire_codec import Outgoing  # noqa: E402
+
+# ワーカーからの生存通知がこの秒数途切れたら、そのワーカーの接続を退室させる
+WORKER_TIMEOUT = 5.0
+PUBLISH_INTERVAL = 1.0
+
+
+class _ReplyChannel:
+    """ホスト側で join_match に渡すチャンネル。put されるのは入室時の接続通知だけで、それを接続元のワーカーへ返す。"""
+
+    __slots__ = ("bus", "reply", "conn_id")
+
+    def __init__(self, bus, reply: str, conn_id: str):
+        self.bus = bus
+        self.reply = reply
+        self.conn_id = conn_id
+
+    def put(self, message, changed=True):
+        self.bus.publish(self.reply, OP_JOIN + self.conn_id.encode() + b"\0" + message.encode().encode())
+
+
+class RoomHost:
+    """バスで届いた入室・入力を matches に渡し、試合のメッセージを部屋ごとに publish する。"""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._seats: Dict[str, Seat] = {}
+        self._workers: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        matches.engine.on_message = self._publish_room
+        METRICS.gauge("room_host", lambda: {"seats": len(self._seats), "workers": len(self._workers)})
+
+    def start(self) -> "RoomHost":
+        self.bus.start(self._on_message)
+        self.bus.subscribe("host")
+        threading.Thread(target=self._publish_rooms, name="room-host-rooms", daemon=True).start()
+        return self
+
+    def _publish_room(self, match, message: Outgoing, changed: bool) -> None:
+        self.bus.publish(f"room.{match.match_id}", (b"1" if changed else b"0") + message.encode().encode())
+
+    def _on_message(self, topic: str, data: bytes) -> None:
+        op, body = data[:1], data[1:]
+        try:
+            if op == OP_TEXT or op == OP_BINARY:
+                conn_id, _, message = body.partition(b"\0")
+                seat = self._seats.get(conn_id.decode())
+                if seat is not None:
+                    matches.handle_message(seat, message.decode() if op == OP_TEXT else message)
+            elif op == OP_JOIN:
+                join = json.loads(body)
+                channel = _ReplyChannel(self.bus, join["reply"], join["conn"])
+                seat = matches.join_match(join["room"], channel, join["wanted"])
+                with self._lock:
+                    self._seats[join["conn"]] = seat
+                    self._workers.setdefault(join["reply"], time.monotonic())
+            elif op == OP_LEAVE:
+                self._leave(body.decode())
+            elif op == OP_ALIVE:
+                with self._lock:
+                    self._workers[body.decode()] = time.monotonic()
+            elif op == OP_RESERVE:
+                reserve = json.loads(body)
+                matches.reserve_room(reserve["room"], int(reserve["round_seconds"]))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Room host: bad message {op!r}: {e}")
+
+    def _leave(self, conn_id: str) -> None:
+        with self._lock:
+            seat = self._seats.pop(conn_id, None)
+        if seat is not None:
+            matches.leave_match(seat)
+
+    def _expire_workers(self) -> None:
+        deadline = time.monotonic() - WORKER_TIMEOUT
+        with self._lock:
+            gone = [w for w, seen in self._workers.items() if seen < deadline]
+            for worker in gone:
+                del self._workers[worker]
+            stale = [c for c, seat in self._seats.items() if seat.channel.reply in gone]
+        for conn_id in stale:
+            self._leave(conn_id)
+        if gone:
+            print(f"Room host: workers gone {gone}, released {len(stale)} connections")
+
+    def _publish_rooms(self) -> None:
+        while True:
+            time.sleep(PUBLISH_INTERVAL)
+            self._expire_workers()
+            snapshot = {
+                "rooms": matches.list_rooms(),
+                "summary": matches._rooms_summary(),
+                "host": {
+                    "bus_hop": METRICS.histogram("bus_hop").snapshot(),
+                    "game_tick": METRICS.histogram("game_tick").snapshot(),
+                    "seats": len(self._seats),
+                    "workers": len(self._workers),
+                },
+            }
+            self.bus.publish("rooms", json.dumps(snapshot).encode())
+
+
+def main() -> None:
+    url = sys.argv[1] if len(sys.argv) > 1 else ROOM_BUS
+    if not url:
+        sys.exit("usage: python room_host.py unix:/tmp/gafa-rooms.sock")
+    if url.startswith("unix:"):
+        UnixSocketBroker(url.partition(":")[2]).start()
+    RoomHost(open_bus(url)).start()
+    print(f"Room host running on {url}")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
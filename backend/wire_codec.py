@@ -0,0 +1,368 @@
+"""
+WebSocket のメッセージ形式（コーデック）。接続時にクライアントが選ぶ
+
+- "json"（既定・従来互換）: テキストフレームの JSON。
+- "msgpack"（任意）: MessagePack のバイナリフレーム。中身は JSON と同じ dict（画像は Base64 にせず bin のまま）。
+  msgpack パッケージが入っていないサーバーでは選べない（json になる）。
+- "packed": 固定幅のバイナリフレーム。ポーズ名・状態名などの列挙は 1 バイト、frame_id / tick / timestamp は
+  固定幅の整数。api_specification.md のメッセージ種別とタグ（先頭 1 バイト）が1つずつ対応する。
+
+選び方（どちらも接続時に1回）:
+- WebSocket のサブプロトコル: new WebSocket(url, ["gafa.packed", "gafa.json"]) のように希望順に並べると、
+  サーバーが扱えるもののうち最初の1つを選んで返す（ブラウザでは socket.protocol で分かる）。
+- クエリ ?codec=packed|msgpack|json（サブプロトコルを付けられないクライアント用）。
+どちらも無ければ json。テキストフレームは常に JSON で、バイナリフレームは先頭バイトで見分けられる:
+    0x00: server.py ?mode=binary（[ヘッダ長][ヘッダ JSON][JPEG]）  0x01-0x0F: packed
+    0x4C: 量子化ランドマーク（landmark_codec.py）                  0x80-0x8F / 0xDE / 0xDF: msgpack
+decode() はこの見分けも含めて、どの形式からでも同じ dict を返す。
+
+packed（リトルエンディアン）。どのメッセージも [タグ uint8][seq uint32（0 は無し）] で始まる:
+    TAG_FRAME (0x02, type 無し) / TAG_POSE_UPDATE (0x03, 1.1) / TAG_HEARTBEAT (0x04)  … server.py のフレーム
+        + pose uint8 + p2_pose uint8（0xFF は1人モード）+ frame_id uint32 + timestamp int64（-1 は無し）
+        + image_size uint32 + [JPEG]
+    TAG_SKELETON (0x09, type 無し) / TAG_SKELETON_UPDATE (0x0A, pose_update)  … server.py の ?stream=skeleton
+        + 上と同じヘッダ（image_size の位置はランドマークのバイト数）+ [量子化ランドマーク（landmark_codec.py）] x 人数
+    TAG_GAME_STATE (0x05, 1.2)
+        + tick uint32 + timestamp int64 + game_timer uint16（0.1 秒単位）+ round_number uint8 + game_status uint8
+        + [health int16 + pose uint8 + x int16（0.1px 単位）+ y int16 + status uint8] x 2
+    TAG_GAME_EVENT (0x06, 1.3)
+        + event uint8 + present uint8（以下のフィールドの有無のビット）+ player / attacker / target / winner uint8
+        + damage int16 + effect / attack_type / movement uint8 + timestamp int64
+    TAG_POSE_DETECTED (0x07, 1.4。クライアント → サーバー) + pose uint8 + timestamp int64（-1 は無し）
+    TAG_ERROR (0x08, 3) + type 以外のフィールドの JSON
+    TAG_JSON (0x01) 上のどれにも当てはまらないメッセージ（接続通知など）+ JSON
+列挙に無い値・知らないフィールド・範囲外の数値を含むメッセージも TAG_JSON で送る（受け取る側の dict は同じ）。
+
+backend/ と fighting-game-pose/ に同じ内容で置いている（pose_logic.py と同様）。
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import struct
+from typing import Any, Dict, Optional, Union
+
+from landmark_codec import FLAG_PRESENT, FRAME_SIZE, HEADER_SIZE
+from pose_logic import POSE_LABELS
+
+try:  # 任意の依存（無ければ msgpack は選べない）
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+CODEC_JSON = "json"
+CODEC_MSGPACK = "msgpack"
+CODEC_PACKED = "packed"
+# このサーバーで選べるコーデック
+CODECS = (CODEC_PACKED, CODEC_MSGPACK, CODEC_JSON) if msgpack is not None else (CODEC_PACKED, CODEC_JSON)
+# WebSocket のサブプロトコル名（サーバーの希望順ではなく、クライアントが並べた順で選ばれる）
+SUBPROTOCOL_PREFIX = "gafa."
+SUBPROTOCOLS = [SUBPROTOCOL_PREFIX + codec for codec in CODECS]
+
+TAG_JSON = 0x01
+TAG_FRAME = 0x02
+TAG_POSE_UPDATE = 0x03
+TAG_HEARTBEAT = 0x04
+TAG_GAME_STATE = 0x05
+TAG_GAME_EVENT = 0x06
+TAG_POSE_DETECTED = 0x07
+TAG_ERROR = 0x08
+TAG_SKELETON = 0x09
+TAG_SKELETON_UPDATE = 0x0A
+_TAG_MAX = 0x0F
+
+# 列挙（順番がそのままコード。足すときは末尾に。frontend/pose_logic.js の decodeMessage と揃える）
+PLAYERS = ("P1", "P2", "DRAW")
+PLAYER_STATUSES = ("attacking", "defending", "idle", "damaged", "moving_forward", "moving_backward",
+                   "crouching", "crouch_attacking", "crouch_defending", "attack_canceling")
+GAME_STATUSES = ("playing", "paused", "finished")
+EVENTS = ("hit", "block", "ko", "round_start", "round_end", "player_moved", "stance_changed",
+          "movement_canceled", "combo_attack")
+EFFECTS = ("normal", "critical", "blocked", "crouch_hit", "cancel_combo", "crouch_blocked")
+ATTACK_TYPES = ("punch", "kick", "crouch_punch", "crouch_kick")
+MOVEMENTS = ("forward", "backward", "crouch", "stand")
+
+_NONE = 0xFF
+_MSGPACK_SEQ = b"\xa3seq"  # msgpack の "seq"
+_COMPACT = (",", ":")
+_POSE_CODES = {name: code for code, name in enumerate(POSE_LABELS)}
+
+
+def _codes(names):
+    return {name: code for code, name in enumerate(names)}
+
+
+_PLAYER_CODES = _codes(PLAYERS)
+_PLAYER_STATUS_CODES = _codes(PLAYER_STATUSES)
+_GAME_STATUS_CODES = _codes(GAME_STATUSES)
+_EVENT_CODES = _codes(EVENTS)
+
+_HEAD = struct.Struct("<BI")
+_SEQ = struct.Struct("<I")
+_FRAME = struct.Struct("<BIBBIqI")
+_STATE = struct.Struct("<BIIqHBB" + "hBhhB" * 2)
+_EVENT = struct.Struct("<BIBBBBBBhBBBq")
+_DETECTED = struct.Struct("<BIBq")
+
+_FRAME_TAGS = {None: TAG_FRAME, "pose_update": TAG_POSE_UPDATE, "heartbeat": TAG_HEARTBEAT}
+_FRAME_KINDS = {tag: kind for kind, tag in _FRAME_TAGS.items()}
+_SKELETON_TAGS = {None: TAG_SKELETON, "pose_update": TAG_SKELETON_UPDATE}
+_SKELETON_KINDS = {tag: kind for kind, tag in _SKELETON_TAGS.items()}
+# 1人モードは landmarks、2人対戦モードは p1_landmarks / p2_landmarks（値は landmark_codec の bytes）
+_LANDMARK_KEYS = ("landmarks", "p1_landmarks", "p2_landmarks")
+_STATE_KEYS = frozenset(("type", "player1", "player2", "game_timer", "round_number", "game_status", "tick",
+                         "timestamp", "seq"))
+_PLAYER_KEYS = frozenset(("health", "pose", "position", "status"))
+# game_event の任意フィールド: (名前, 値 -> コード, コード -> 値)。present の bit i が i 番目
+_EVENT_FIELDS = (
+    ("player", _PLAYER_CODES, PLAYERS),
+    ("attacker", _PLAYER_CODES, PLAYERS),
+    ("target", _PLAYER_CODES, PLAYERS),
+    ("winner", _PLAYER_CODES, PLAYERS),
+    ("damage", None, None),
+    ("effect", _codes(EFFECTS), EFFECTS),
+    ("attack_type", _codes(ATTACK_TYPES), ATTACK_TYPES),
+    ("movement", _codes(MOVEMENTS), MOVEMENTS),
+)
+_EVENT_KEYS = frozenset(["type", "event", "timestamp", "seq"] + [name for name, _, _ in _EVENT_FIELDS])
+_DETECTED_KEYS = frozenset(("type", "pose", "timestamp", "seq"))
+_FRAME_KEYS = frozenset(("type", "pose", "p1_pose", "p2_pose", "frame_id", "timestamp", "seq") + _LANDMARK_KEYS)
+
+Encoded = Union[str, bytes]
+
+
+def negotiate(subprotocol: Optional[str] = None, query: Optional[str] = None) -> str:
+    """選ばれたサブプロトコル（無ければクエリの codec）からコーデック名を決める。"""
+    if subprotocol and subprotocol.startswith(SUBPROTOCOL_PREFIX):
+        codec = subprotocol[len(SUBPROTOCOL_PREFIX):]
+        if codec in CODECS:
+            return codec
+    if query and query.lower() in CODECS:
+        return query.lower()
+    return CODEC_JSON
+
+
+def encode(message: Dict[str, Any], codec: str = CODEC_JSON, image: bytes = b"") -> Encoded:
+    """dict を codec の形式にする（json は str、それ以外は bytes）。
+
+    image は server.py のフレームのプレビュー JPEG（msgpack は "image" に bin で、packed は末尾に付ける）。
+    骨格だけのフレームは landmarks（2人対戦は p1_landmarks / p2_landmarks）に量子化ランドマークの bytes を入れる。
+    """
+    if codec == CODEC_PACKED:
+        return _pack(message, image)
+    if codec == CODEC_MSGPACK:
+        return msgpack.packb({**message, "image": image} if image else message)
+    return json.dumps(message)
+
+
+def decode(data: Encoded) -> Dict[str, Any]:
+    """どの形式のメッセージでも dict に戻す。形式が分からなければ ValueError。"""
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data:
+        raise ValueError("empty message")
+    first = data[0]
+    if 0 < first <= _TAG_MAX:
+        try:
+            return _unpack(data)
+        except (struct.error, IndexError) as e:
+            raise ValueError(f"broken packed message: {e}") from None
+    if msgpack is not None and (0x80 <= first <= 0x8F or first in (0xDE, 0xDF)):
+        return msgpack.unpackb(data)
+    raise ValueError(f"unknown binary message (first byte 0x{first:02x})")
+
+
+def with_seq(data: Encoded, seq: int) -> Encoded:
+    """エンコード済みメッセージに接続ごとの seq を足す（本体は全接続で共有しているので作り直さない）。"""
+    if isinstance(data, str):
+        return f'{data[:-1]}, "seq": {seq}}}'
+    first = data[0]
+    if 0 < first <= _TAG_MAX:
+        return b"".join((data[:1], _SEQ.pack(seq), data[_HEAD.size:]))
+    if 0x80 <= first < 0x8F:
+        # fixmap: 要素数を1つ増やして末尾に "seq" を足す
+        return b"".join((bytes((first + 1,)), data[1:], _MSGPACK_SEQ, msgpack.packb(seq)))
+    return msgpack.packb({**msgpack.unpackb(data), "seq": seq})
+
+
+class Outgoing:
+    """全接続で共有する送信メッセージ。コーデックごとのエンコード結果を最初の1回だけ作る。
+
+    dict から作るか、JSON 文字列から作る（ワーカー間の中継で受け取った分。dict は必要になるまで戻さない）。
+    """
+
+    __slots__ = ("_message", "_encoded")
+
+    def __init__(self, message: Optional[Dict[str, Any]] = None, text: Optional[str] = None):
+        self._message = message
+        self._encoded: Dict[str, Encoded] = {} if text is None else {CODEC_JSON: text}
+
+    @property
+    def message(self) -> Dict[str, Any]:
+        if self._message is None:
+            self._message = json.loads(self._encoded[CODEC_JSON])
+        return self._message
+
+    def encode(self, codec: str = CODEC_JSON) -> Encoded:
+        cached = self._encoded.get(codec)
+        if cached is None:
+            cached = self._encoded[codec] = encode(self.message, codec)
+        return cached
+
+
+# --- packed ---------------------------------------------------------------------
+
+def _pack(message: Dict[str, Any], image: bytes = b"") -> bytes:
+    kind = message.get("type")
+    try:
+        if kind == "game_state" and message.keys() <= _STATE_KEYS:
+            return _pack_state(message)
+        if kind == "game_event" and message.keys() <= _EVENT_KEYS:
+            return _pack_event(message)
+        if kind in _FRAME_TAGS and "frame_id" in message and message.keys() <= _FRAME_KEYS:
+            return _pack_frame(message, image)
+        if kind == "pose_detected" and message.keys() <= _DETECTED_KEYS:
+            return _DETECTED.pack(TAG_POSE_DETECTED, message.get("seq", 0), _POSE_CODES[message["pose"]],
+                                  message.get("timestamp", -1))
+        if kind == "error":
+            body = {k: v for k, v in message.items() if k not in ("type", "seq")}
+            return _HEAD.pack(TAG_ERROR, message.get("seq", 0)) + json.dumps(body, separators=_COMPACT).encode()
+    except (KeyError, TypeError, struct.error):
+        pass  # 列挙に無い値・範囲外は JSON で送る（画像・ランドマークは json モードと同じく Base64）
+    if image:
+        message = {**message, "image": image}
+    message = {key: base64.b64encode(value).decode("utf-8") if isinstance(value, bytes) else value
+               for key, value in message.items()}
+    return _HEAD.pack(TAG_JSON, message.get("seq", 0)) + json.dumps(message, separators=_COMPACT).encode()
+
+
+def _pack_frame(message: Dict[str, Any], image: bytes) -> bytes:
+    if "p1_pose" in message:
+        pose, p2_pose = _POSE_CODES[message["p1_pose"]], _POSE_CODES[message["p2_pose"]]
+    else:
+        pose, p2_pose = _POSE_CODES[message["pose"]], _NONE
+    timestamp = message.get("timestamp")
+    tag = _FRAME_TAGS[message.get("type")]
+    if "landmarks" in message or "p1_landmarks" in message:
+        # 骨格だけのフレーム（画像の代わりにランドマークを人数分つなげる）
+        tag = _SKELETON_TAGS[message.get("type")]
+        image = b"".join(message[key] for key in _LANDMARK_KEYS if key in message)
+    head = _FRAME.pack(tag, message.get("seq", 0), pose, p2_pose,
+                       message["frame_id"], -1 if timestamp is None else timestamp, len(image))
+    return head + image if image else head
+
+
+def _pack_player(player: Dict[str, Any]):
+    if player.keys() != _PLAYER_KEYS or not isinstance(player["position"]["x"], float):
+        raise KeyError("unknown player field")
+    position = player["position"]
+    return (player["health"], _POSE_CODES[player["pose"]], round(position["x"] * 10), position["y"],
+            _PLAYER_STATUS_CODES[player["status"]])
+
+
+def _pack_state(message: Dict[str, Any]) -> bytes:
+    if not isinstance(message["game_timer"], float):
+        raise KeyError("game_timer")
+    return _STATE.pack(TAG_GAME_STATE, message.get("seq", 0), message["tick"], message["timestamp"],
+                       round(message["game_timer"] * 10), message["round_number"],
+                       _GAME_STATUS_CODES[message["game_status"]],
+                       *_pack_player(message["player1"]), *_pack_player(message["player2"]))
+
+
+def _pack_event(message: Dict[str, Any]) -> bytes:
+    present = 0
+    values = []
+    for bit, (name, codes, _) in enumerate(_EVENT_FIELDS):
+        value = message.get(name)
+        if value is None:
+            values.append(0)
+            continue
+        present |= 1 << bit
+        values.append(codes[value] if codes is not None else value)
+    return _EVENT.pack(TAG_GAME_EVENT, message.get("seq", 0), _EVENT_CODES[message["event"]], present,
+                       *values, message["timestamp"])
+
+
+def _unpack(data: bytes) -> Dict[str, Any]:
+    tag, seq = _HEAD.unpack_from(data)
+    if tag == TAG_GAME_STATE:
+        message = _unpack_state(data)
+    elif tag == TAG_GAME_EVENT:
+        message = _unpack_event(data)
+    elif tag in _FRAME_KINDS or tag in _SKELETON_KINDS:
+        message = _unpack_frame(tag, data)
+    elif tag == TAG_POSE_DETECTED:
+        _, _, pose, timestamp = _DETECTED.unpack_from(data)
+        message = {"type": "pose_detected", "pose": POSE_LABELS[pose]}
+        if timestamp >= 0:
+            message["timestamp"] = timestamp
+    elif tag == TAG_ERROR:
+        message = {"type": "error", **json.loads(data[_HEAD.size:])}
+    elif tag == TAG_JSON:
+        message = json.loads(data[_HEAD.size:])
+    else:
+        raise ValueError(f"unknown packed tag 0x{tag:02x}")
+    if seq:
+        message["seq"] = seq
+    return message
+
+
+def _unpack_frame(tag: int, data: bytes) -> Dict[str, Any]:
+    _, _, pose, p2_pose, frame_id, timestamp, image_size = _FRAME.unpack_from(data)
+    skeleton = tag in _SKELETON_KINDS
+    kind = _SKELETON_KINDS[tag] if skeleton else _FRAME_KINDS[tag]
+    message: Dict[str, Any] = {"type": kind} if kind else {}
+    if p2_pose == _NONE:
+        message["pose"] = POSE_LABELS[pose]
+    else:
+        message["p1_pose"] = POSE_LABELS[pose]
+        message["p2_pose"] = POSE_LABELS[p2_pose]
+    message["frame_id"] = frame_id
+    if timestamp >= 0:
+        message["timestamp"] = timestamp
+    if skeleton:
+        # 人物なしのフレームは 2 バイトなので、先頭から1人ずつ長さを見て切り出す
+        offset = _FRAME.size
+        for key in ("landmarks",) if p2_pose == _NONE else ("p1_landmarks", "p2_landmarks"):
+            size = FRAME_SIZE if data[offset + 1] & FLAG_PRESENT else HEADER_SIZE
+            message[key] = data[offset:offset + size]
+            offset += size
+        return message
+    # image_size は切り出しにだけ使う（json / msgpack のメッセージには無いキーなので dict には入れない）
+    if image_size:
+        message["image"] = data[_FRAME.size:_FRAME.size + image_size]
+    return message
+
+
+def _unpack_player(values) -> Dict[str, Any]:
+    health, pose, x, y, status = values
+    return {"health": health, "pose": POSE_LABELS[pose], "position": {"x": x / 10, "y": y},
+            "status": PLAYER_STATUSES[status]}
+
+
+def _unpack_state(data: bytes) -> Dict[str, Any]:
+    values = _STATE.unpack_from(data)
+    _, _, tick, timestamp, game_timer, round_number, game_status = values[:7]
+    return {
+        "type": "game_state",
+        "player1": _unpack_player(values[7:12]),
+        "player2": _unpack_player(values[12:17]),
+        "game_timer": game_timer / 10,
+        "round_number": round_number,
+        "game_status": GAME_STATUSES[game_status],
+        "tick": tick,
+        "timestamp": timestamp,
+    }
+
+
+def _unpack_event(data: bytes) -> Dict[str, Any]:
+    values = _EVENT.unpack_from(data)
+    event, present = values[2], values[3]
+    message: Dict[str, Any] = {"type": "game_event", "event": EVENTS[event]}
+    for bit, (name, _, names) in enumerate(_EVENT_FIELDS):
+        if present & (1 << bit):
+            value = values[4 + bit]
+            message[name] = names[value] if names is not None else value
+    message["timestamp"] = values[-1]
+    return message
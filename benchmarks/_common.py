@@ -0,0 +1,139 @@
+"""
+ベンチマーク共通処理（結果 JSON の書き出し・パーセンタイル・メモリ最大値・合成ランドマーク）
+
+結果は次の形の JSON で出力する。コミット間の比較は compare.py で行う。
+    {
+      "suite": "classifier" | "ws",
+      "commit": "<git HEAD>",
+      "python": "3.11.9",
+      "created_at": "2026-01-01T00:00:00",
+      "results": {"<ケース名>": {"ops_per_s": ..., "p50_ms": ..., ...}, ...},
+      "max_rss_kb": 123456
+    }
+"""
+
+from __future__ import annotations
+
+import builtins
+import contextlib
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, "backend")
+GAME_DIR = os.path.join(ROOT, "fighting-game-pose")
+
+
+def use_dir(path: str) -> None:
+    """backend/ や fighting-game-pose/ のモジュールを import できるようにする（各サーバーはフラット import のため）。"""
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@contextlib.contextmanager
+def quiet():
+    """サーバー側の print（接続ログ・判定ごとのデバッグ出力）を止める。計測値に端末出力のコストを混ぜないため。"""
+    original = builtins.print
+    builtins.print = lambda *args, **kwargs: None
+    try:
+        yield
+    finally:
+        builtins.print = original
+
+
+def percentiles(values_s: Sequence[float]) -> Dict[str, float]:
+    """秒の列から p50/p95/p99/max をミリ秒で返す。"""
+    if not values_s:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    arr = np.asarray(values_s, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3), "max_ms": round(float(arr.max()), 3)}
+
+
+def max_rss_kb() -> int:
+    """このプロセスの最大常駐メモリ (KB)。"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(rss / 1024) if sys.platform == "darwin" else int(rss)
+
+
+def _git_head() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def write_results(suite: str, results: Dict[str, Any], out: str = "-") -> Dict[str, Any]:
+    doc = {
+        "suite": suite,
+        "commit": _git_head(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+        "max_rss_kb": max_rss_kb(),
+    }
+    text = json.dumps(doc, indent=2, ensure_ascii=False)
+    if out == "-":
+        print(text)
+    else:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"wrote {out}", file=sys.stderr)
+    return doc
+
+
+# --- 合成ランドマーク ---------------------------------------------------------
+
+# 正面を向いて直立した人物のおおよその座標（x, y, z）。MediaPipe の33点の並び。
+_STANDING = np.array([
+    (0.50, 0.20, -0.30),                                              # 0 nose
+    (0.51, 0.18, -0.28), (0.52, 0.18, -0.28), (0.53, 0.18, -0.28),    # 1-3 left eye
+    (0.49, 0.18, -0.28), (0.48, 0.18, -0.28), (0.47, 0.18, -0.28),    # 4-6 right eye
+    (0.55, 0.19, -0.15), (0.45, 0.19, -0.15),                         # 7-8 ears
+    (0.52, 0.23, -0.27), (0.48, 0.23, -0.27),                         # 9-10 mouth
+    (0.60, 0.32, -0.05), (0.40, 0.32, -0.05),                         # 11-12 shoulders
+    (0.63, 0.45, -0.02), (0.37, 0.45, -0.02),                         # 13-14 elbows
+    (0.64, 0.57, -0.05), (0.36, 0.57, -0.05),                         # 15-16 wrists
+    (0.65, 0.60, -0.06), (0.35, 0.60, -0.06),                         # 17-18 pinky
+    (0.65, 0.60, -0.07), (0.35, 0.60, -0.07),                         # 19-20 index
+    (0.64, 0.59, -0.06), (0.36, 0.59, -0.06),                         # 21-22 thumb
+    (0.56, 0.60, 0.00), (0.44, 0.60, 0.00),                           # 23-24 hips
+    (0.56, 0.76, 0.02), (0.44, 0.76, 0.02),                           # 25-26 knees
+    (0.56, 0.92, 0.08), (0.44, 0.92, 0.08),                           # 27-28 ankles
+    (0.56, 0.94, 0.09), (0.44, 0.94, 0.09),                           # 29-30 heels
+    (0.57, 0.96, 0.02), (0.43, 0.96, 0.02),                           # 31-32 foot index
+], dtype=np.float32)
+
+
+def synthetic_landmarks(n: int, seed: int = 0, jitter: float = 0.08) -> np.ndarray:
+    """直立姿勢にノイズを加えた (n, 33, 4) 配列。jitter を大きくすると様々なポーズが混ざる。"""
+    rng = np.random.default_rng(seed)
+    out = np.empty((n, 33, 4), dtype=np.float32)
+    out[:, :, :3] = _STANDING + rng.normal(0.0, jitter, size=(n, 33, 3)).astype(np.float32)
+    out[:, :, 3] = rng.uniform(0.3, 1.0, size=(n, 33)).astype(np.float32)
+    return out
+
+
+class LM:
+    """NormalizedLandmark 互換の軽量オブジェクト（スカラー版の分類器に渡す用）。"""
+
+    __slots__ = ("x", "y", "z", "visibility")
+
+    def __init__(self, x: float, y: float, z: float, visibility: float):
+        self.x, self.y, self.z, self.visibility = x, y, z, visibility
+
+
+def to_landmark_lists(arr: np.ndarray) -> List[List[LM]]:
+    return [[LM(*row) for row in frame.tolist()] for frame in arr]
@@ -0,0 +1,101 @@
+"""
+分類器のマイクロベンチマーク
+
+  python benchmarks/bench_classifier.py                         # 合成データ
+  python benchmarks/bench_classifier.py --plog session.plog     # 記録データも追加で計測
+  python benchmarks/bench_classifier.py --out bench/classifier.json
+
+計測対象（backend/pose_logic.py）:
+  - classify_pose_from_landmarks（1フレームずつ、landmark オブジェクト）
+  - _angle_deg / _get_scale
+  - classify_pose_batch（NumPy バッチ版、参考値）
+
+各ケースは repeat 回計測して最速と中央値を記録する（ops_per_s は最速回の値）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+from typing import Callable, Dict
+
+from _common import BACKEND_DIR, quiet, synthetic_landmarks, to_landmark_lists, use_dir, write_results
+
+use_dir(BACKEND_DIR)
+import pose_logic  # noqa: E402
+from pose_logic import PL  # noqa: E402
+
+
+def _measure(fn: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """fn は処理した件数を返す。"""
+    rates = []
+    n = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        n = fn()
+        elapsed = time.perf_counter() - started
+        rates.append(n / elapsed if elapsed > 0 else float("inf"))
+    best = max(rates)
+    return {
+        "n": n,
+        "ops_per_s": round(best, 1),
+        "ops_per_s_median": round(statistics.median(rates), 1),
+        "ns_per_op": round(1e9 / best, 1),
+    }
+
+
+def bench_dataset(name: str, arr, repeat: int) -> Dict[str, Dict[str, float]]:
+    frames = to_landmark_lists(arr)
+    results = {}
+
+    def classify_scalar() -> int:
+        # classify_pose_from_landmarks は判定ごとに print するので、端末出力のコストは除いて測る
+        with quiet():
+            for lm in frames:
+                pose_logic.classify_pose_from_landmarks(lm)
+        return len(frames)
+
+    def angle() -> int:
+        for lm in frames:
+            pose_logic._angle_deg(lm[PL.LEFT_SHOULDER], lm[PL.LEFT_ELBOW], lm[PL.LEFT_WRIST])
+        return len(frames)
+
+    def scale() -> int:
+        for lm in frames:
+            pose_logic._get_scale(lm)
+        return len(frames)
+
+    def classify_batch() -> int:
+        pose_logic.classify_pose_codes(arr)
+        return len(arr)
+
+    results[f"{name}/classify_pose_from_landmarks"] = _measure(classify_scalar, repeat)
+    results[f"{name}/_angle_deg"] = _measure(angle, repeat)
+    results[f"{name}/_get_scale"] = _measure(scale, repeat)
+    results[f"{name}/classify_pose_batch"] = _measure(classify_batch, repeat)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=20000, help="合成データのフレーム数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plog", action="append", default=[], help="記録データ (.plog)。複数指定可")
+    parser.add_argument("--out", default="-", help="結果 JSON の出力先（- は標準出力）")
+    args = parser.parse_args()
+
+    results = {}
+    results.update(bench_dataset("synthetic", synthetic_landmarks(args.frames, args.seed), args.repeat))
+    if args.plog:
+        from landmark_log import open_recording
+        for path in args.plog:
+            _, landmarks = open_recording(path)
+            results.update(bench_dataset(f"plog:{os.path.basename(path)}", landmarks[:args.frames], args.repeat))
+    write_results("classifier", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
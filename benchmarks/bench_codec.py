@@ -0,0 +1,191 @@
+"""
+WebSocket のメッセージ形式（wire_codec.py のコーデック）のベンチマーク
+
+  python benchmarks/bench_codec.py
+  python benchmarks/bench_codec.py --messages 5000 --out bench/codec.json
+
+api_specification.md のメッセージ種別ごとに、json / msgpack（入っていれば）/ packed（server.py のフレームは
+従来の ?mode=binary も）で 1 メッセージあたりのバイト数と、エンコード・デコードの CPU 時間を測る。
+試合のメッセージは game_state.py で実際に試合を進めて集めたもの、フレームは protocol.PoseFrame の出力
+（frame_skeleton は ?stream=skeleton の、JPEG の代わりにランドマークを載せたフレーム）。
+
+計測の前に、どの種別・形式でも decode(encode(m)) == m（seq を付けても同じ）になることを確かめ、
+崩れていれば AssertionError で止まる。
+
+計測値（ケース名は codec/<種別>/<形式>）:
+  bytes     : 1メッセージの平均バイト数（json は UTF-8 の長さ）
+  encode_us : dict からの1メッセージのエンコード時間（全接続で1回だけ払う分）
+  seq_us    : エンコード済みメッセージに接続ごとの seq を足す時間（接続ごとに払う分）
+  decode_us : 受け取った側の1メッセージのデコード時間
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from _common import BACKEND_DIR, GAME_DIR, quiet, use_dir, write_results
+
+use_dir(BACKEND_DIR)
+use_dir(GAME_DIR)
+from game_state import GameEngine  # noqa: E402
+from pose_logic import POSE_LABELS  # noqa: E402
+from protocol import MODE_BINARY, PoseFrame, decode_binary, with_seq  # noqa: E402
+from landmark_codec import encode_landmarks  # noqa: E402
+from wire_codec import CODEC_JSON, CODECS, decode, encode  # noqa: E402
+
+# メッセージを集めるときのティック数の上限（1件あたり）。超えたら試合が進んでいないとみなして止める
+MAX_TICKS_PER_MESSAGE = 50
+
+
+def _game_messages(count: int, seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """試合を進めて、種別ごとのメッセージ（dict）を count 件ずつ集める。"""
+    rng = random.Random(seed)
+    by_kind: Dict[str, List[Dict[str, Any]]] = {"game_state": [], "game_event": []}
+    engine = GameEngine(on_message=lambda match, message, changed: by_kind[message.message["type"]].append(
+        message.message))
+    matches = [engine.create_match(f"m{i}", round_seconds=600) for i in range(20)]
+    max_ticks = count * MAX_TICKS_PER_MESSAGE
+    for tick in range(max_ticks):
+        if len(by_kind["game_event"]) >= count and len(by_kind["game_state"]) >= count:
+            break
+        # KO で終わった試合はもう何も送らないので、新しい試合に入れ替える
+        for i, match in enumerate(matches):
+            if match.finished:
+                engine.remove_match(match.match_id)
+                matches[i] = engine.create_match(f"m{i}.{tick}", round_seconds=600)
+        for match in rng.sample(matches, 4):
+            match.set_pose(rng.randrange(2), rng.choice(POSE_LABELS))
+        engine.step()
+    else:
+        raise RuntimeError(f"{max_ticks} ticks で {count} 件集まらなかった "
+                           f"(game_state={len(by_kind['game_state'])}, game_event={len(by_kind['game_event'])})")
+    connected = [{"pose": "IDLE", "status": "connected", "match": f"m{i % 20}", "player": ("P1", "P2", None)[i % 3]}
+                 for i in range(count)]
+    detected = [{"type": "pose_detected", "pose": rng.choice(POSE_LABELS), "timestamp": 1700000000000 + i}
+                for i in range(count)]
+    return {
+        "game_state": by_kind["game_state"][:count],
+        "game_event": by_kind["game_event"][:count],
+        "connected": connected,
+        "pose_detected": detected,
+    }
+
+
+def _sample_messages() -> List[Dict[str, Any]]:
+    """試合では出てこない種別（server.py のフレーム・エラー）の見本。"""
+    skeleton = encode_landmarks(np.random.default_rng(0).random((33, 4), dtype=np.float32))
+    return [
+        {"pose": "PUNCH", "frame_id": 1, "timestamp": 1700000000000},
+        {"type": "pose_update", "p1_pose": "KICK", "p2_pose": "GUARD", "frame_id": 2, "timestamp": 1700000000001},
+        {"type": "heartbeat", "pose": "IDLE", "frame_id": 3},
+        {"type": "pose_update", "pose": "STAND", "frame_id": 4, "timestamp": 1700000000002, "landmarks": skeleton},
+        {"p1_pose": "CROUCH", "p2_pose": "IDLE", "frame_id": 5, "timestamp": 1700000000003,
+         "p1_landmarks": skeleton, "p2_landmarks": encode_landmarks(None)},
+        {"type": "error", "code": "CAMERA_ERROR", "message": "カメラアクセスに失敗しました", "player": "P1"},
+        {"error": "Camera not found."},
+    ]
+
+
+def _check_round_trip(messages: List[Dict[str, Any]]) -> None:
+    """どのコーデックでも decode(encode(m)) が m に戻ることを確かめる（seq 付き・プレビュー画像付きも）。"""
+    image = bytes(range(256)) * 4
+    for codec in CODECS:
+        for message in messages:
+            has_bytes = any(isinstance(value, bytes) for value in message.values())
+            if codec == CODEC_JSON and has_bytes:
+                continue  # json のバイト列は protocol.PoseFrame が Base64 にして送る
+            cases = [(message, b"", message), ({**message, "seq": 7}, b"", {**message, "seq": 7})]
+            if "frame_id" in message and not has_bytes and codec != CODEC_JSON:
+                cases.append((message, image, {**message, "image": image}))
+            for sent, attached, expected in cases:
+                got = decode(encode(sent, codec, attached))
+                assert got == expected, f"{codec}: {sent} -> {got}"
+            got = decode(with_seq(encode(message, codec), 9))
+            assert got == {**message, "seq": 9}, f"{codec} with_seq: {message} -> {got}"
+
+
+def _frames(count: int, seed: int, preview: bool, skeleton: bool = False) -> List[PoseFrame]:
+    rng = np.random.default_rng(seed)
+    # ノイズだけの画像は JPEG が極端に大きくなるので、なだらかな模様 + 少しのノイズにする
+    base = np.tile(np.linspace(0, 255, 320, dtype=np.uint8), (240, 1))
+    frames = []
+    for i in range(count):
+        image = landmarks = None
+        if skeleton:
+            landmarks = [rng.random((33, 4), dtype=np.float32)]
+        elif preview:
+            noise = rng.integers(0, 16, size=(240, 320), dtype=np.uint8)
+            image = np.dstack([base + noise] * 3)
+        frame = PoseFrame(POSE_LABELS[i % len(POSE_LABELS)], i, image, timestamp=1700000000000 + i,
+                          landmarks=landmarks)
+        if skeleton:
+            frame.skeleton()  # 量子化もどの形式でも同じなので計測から外す
+        else:
+            frame.jpeg()  # JPEG 化はどの形式でも同じなので計測から外す
+        frames.append(frame)
+    return frames
+
+
+def _encode_frame(frame: PoseFrame, mode: str, with_image: bool, skeleton: bool = False):
+    # 送信メッセージのキャッシュは使わない（形式ごとに1フレームを1回エンコードする分を測る）
+    frame._encoded.clear()
+    return frame.encode(mode, with_image=with_image, skeleton=skeleton)
+
+
+def _measure(items: List[Any], encode_one: Callable[[Any], Any], decode_one: Callable[[Any], Any]) -> Dict[str, float]:
+    perf = time.perf_counter
+    started = perf()
+    encoded = [encode_one(item) for item in items]
+    encode_s = perf() - started
+    started = perf()
+    for i, data in enumerate(encoded):
+        with_seq(data, i + 1)
+    seq_s = perf() - started
+    started = perf()
+    for data in encoded:
+        decode_one(data)
+    decode_s = perf() - started
+    n = len(items)
+    sizes = [len(data.encode()) if isinstance(data, str) else len(data) for data in encoded]
+    return {
+        "n": n,
+        "bytes": round(sum(sizes) / n, 1),
+        "encode_us": round(encode_s / n * 1e6, 3),
+        "seq_us": round(seq_s / n * 1e6, 3),
+        "decode_us": round(decode_s / n * 1e6, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="種別ごとのメッセージ数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="-", help="結果 JSON の出力先（- は標準出力）")
+    args = parser.parse_args()
+
+    results = {}
+    with quiet():
+        game_messages = _game_messages(args.messages, args.seed)
+        _check_round_trip([m for messages in game_messages.values() for m in messages] + _sample_messages())
+        for kind, messages in game_messages.items():
+            for codec in CODECS:
+                results[f"codec/{kind}/{codec}"] = _measure(
+                    messages, lambda message, codec=codec: encode(message, codec), decode)
+        for kind, preview, skeleton in (("frame", False, False), ("frame_preview", True, False),
+                                        ("frame_skeleton", True, True)):
+            count = min(args.messages, 500) if preview and not skeleton else args.messages
+            frames = _frames(count, args.seed, preview, skeleton)
+            for mode in CODECS + (MODE_BINARY,):
+                results[f"codec/{kind}/{mode}"] = _measure(
+                    frames, lambda frame, mode=mode: _encode_frame(frame, mode, preview, skeleton),
+                    decode_binary if mode == MODE_BINARY else decode)
+    write_results("codec", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+試合シミュレーション（backend/game_state.py）のベンチマーク
+
+  python benchmarks/bench_game.py                          # 100 / 300 / 1000 試合
+  python benchmarks/bench_game.py --matches 500 --seconds 20 --out bench/game.json
+  python benchmarks/bench_game.py --landmarks                # ブラウザからランドマークを受ける構成
+
+各試合に乱数のポーズ入力（約 0.2 秒ごとに変化）を与え、全試合を1ティック進める時間を計測する。
+メッセージは実際と同じく JSON 文字列にして捨てる（送信コストは含まない）。
+
+計測値:
+  tick_ms        : 全試合を1ティック進める時間の p50/p95/p99/max
+  budget_used_p99: p99 が 60Hz の1ティック (16.7ms) に占める割合（1.0 未満なら遅れない）
+  match_ticks_per_s: 1秒あたりに進められる「試合×ティック」数
+  changed_messages : ?updates=change の接続に届く数（変化した game_state + ハートビート + イベント）
+
+--landmarks では、全試合の P1 / P2 が 30fps で量子化ランドマーク（landmark_codec.py）を送ってくる想定で、
+受信側のデコード + submit と、ティックごとの一括分類（landmark_ingest.py）込みの時間を測る。
+  submit_ms : 1フレームあたりのデコード + submit の時間
+  players_per_core: budget_used_p99 から見積もった、1コアで 60Hz を保てるプレイヤー数
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict
+
+from _common import BACKEND_DIR, percentiles, quiet, use_dir, write_results
+
+use_dir(BACKEND_DIR)
+from _common import synthetic_landmarks  # noqa: E402
+from game_state import TICK_HZ, GameEngine  # noqa: E402
+from landmark_codec import decode_landmarks, encode_landmarks  # noqa: E402
+from landmark_ingest import LandmarkIngest  # noqa: E402
+from pose_logic import POSE_LABELS  # noqa: E402
+
+
+def bench_matches(n: int, seconds: float, seed: int) -> Dict[str, float]:
+    rng = random.Random(seed)
+    sent = [0, 0]
+
+    def on_message(match, message, changed) -> None:
+        # 従来どおり JSON 化までをティックの処理時間に含める（接続が1つでもあれば必ず作るので）
+        message.encode()
+        sent[0] += 1
+        sent[1] += changed
+
+    engine = GameEngine(on_message=on_message)
+    matches = [engine.create_match(f"m{i}", round_seconds=int(seconds) + 1) for i in range(n)]
+    ticks = int(seconds * TICK_HZ)
+    durations = []
+    for _ in range(ticks):
+        # 入力の変化（ポーズの確定は 60ms 間隔程度なので、1ティックで変わる試合は一部だけ）
+        for match in rng.sample(matches, max(1, n // 12)):
+            match.set_pose(rng.randrange(2), rng.choice(POSE_LABELS))
+        started = time.perf_counter()
+        engine.step()
+        durations.append(time.perf_counter() - started)
+
+    lat = percentiles(durations)
+    total = sum(durations)
+    return {
+        "matches": n,
+        "ticks": ticks,
+        "messages": sent[0],
+        "changed_messages": sent[1],
+        "tick_ms": lat,
+        "budget_used_p99": round(lat["p99_ms"] / (1000.0 / TICK_HZ), 3),
+        "match_ticks_per_s": round(n * ticks / total, 1) if total else 0.0,
+    }
+
+
+def bench_landmarks(n: int, seconds: float, seed: int) -> Dict[str, float]:
+    rng = random.Random(seed)
+    ingest = LandmarkIngest()
+    engine = GameEngine(on_message=lambda match, message, changed: message.encode(), before_step=ingest.flush)
+    matches = [engine.create_match(f"m{i}", round_seconds=int(seconds) + 1) for i in range(n)]
+    # 送られてくるフレームはあらかじめエンコードしておく（クライアント側のコスト）
+    frames = [encode_landmarks(arr) for arr in synthetic_landmarks(256, seed=seed, jitter=0.1)]
+    ticks = int(seconds * TICK_HZ)
+    durations = []
+    submits = []
+    for tick in range(ticks):
+        # 30fps: 各プレイヤーは2ティックに1回送ってくる（半分ずつずらす）
+        received = [rng.choice(frames) for _ in range(n)]
+        started = time.perf_counter()
+        count = 0
+        for i, match in enumerate(matches):
+            if (i + tick) % 2 == 0:
+                for side in (0, 1):
+                    ingest.submit(match, side, decode_landmarks(received[i]))
+                    count += 1
+        submits.append((time.perf_counter() - started, count))
+        started = time.perf_counter()
+        engine.step()
+        durations.append(time.perf_counter() - started)
+
+    lat = percentiles(durations)
+    # 1ティックに必要な CPU 時間 = 受信分（submit）+ ティック本体
+    per_tick = (sum(durations) + sum(t for t, _ in submits)) / ticks
+    return {
+        "matches": n,
+        "players": 2 * n,
+        "ticks": ticks,
+        "tick_ms": lat,
+        "submit_ms": percentiles([t / count for t, count in submits if count]),
+        "budget_used_p99": round(lat["p99_ms"] / (1000.0 / TICK_HZ), 3),
+        "players_per_core": int(2 * n * (1.0 / TICK_HZ) / per_tick) if per_tick else 0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--matches", type=int, action="append", help="同時試合数（複数指定可。既定 100, 300, 1000）")
+    parser.add_argument("--seconds", type=float, default=10.0, help="シミュレーションするゲーム内時間")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--landmarks", action="store_true", help="ポーズ名ではなくランドマークを受けて分類する構成を測る")
+    parser.add_argument("--out", default="-", help="結果 JSON の出力先（- は標準出力）")
+    args = parser.parse_args()
+
+    results = {}
+    with quiet():
+        for n in args.matches or [100, 300, 1000]:
+            if args.landmarks:
+                results[f"game/landmarks/m{n}"] = bench_landmarks(n, args.seconds, args.seed)
+            else:
+                results[f"game/m{n}"] = bench_matches(n, args.seconds, args.seed)
+    write_results("game", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
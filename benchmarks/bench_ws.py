@@ -0,0 +1,212 @@
+"""
+WebSocket エンドツーエンドベンチマーク
+
+サーバーを同一プロセス内で起動し（werkzeug threaded）、ローカルの WebSocket クライアントを
+複数スレッドでつないで計測する。外部サービスやカメラは使わない。
+
+  # fighting-game-pose/server.py の /ws。カメラの代わりに合成フレームを流す（MediaPipe は実物を使う）
+  python benchmarks/bench_ws.py --target server --clients 4 --seconds 10 --mode binary
+  python benchmarks/bench_ws.py --target server --fps 0 --players 2   # 2人対戦モードの推論 FPS（1人モードと比較）
+  python benchmarks/bench_ws.py --target server --stream skeleton      # ?stream=skeleton（JPEG の代わりにランドマーク）
+
+  # backend/app.py の /ws。クライアントがポーズメッセージを送り続ける
+  python benchmarks/bench_ws.py --target app --clients 16 --messages 2000
+
+  --out で結果 JSON を保存（compare.py で別コミットの結果と比較できる）。
+
+計測値:
+  server: 受信 frames/s（合計・1クライアント平均）、1クライアントの受信帯域 (kb_per_s_per_client)、
+          1メッセージの遅延（合成フレーム生成 → クライアント受信）、接続時間
+  app:    送信 messages/s、サーバー側の処理レートと処理時間 (ws_handle の p50/p95/p99)、接続時間
+  共通:   プロセスの最大常駐メモリ (max_rss_kb)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from _common import BACKEND_DIR, GAME_DIR, percentiles, quiet, use_dir, write_results
+
+
+def _start_server(app, port: int):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def _timed_source(fps: float, generated_at: Dict[int, float]):
+    """video_source.SyntheticSource に、生成時刻を frame_id（1始まり）ごとに控える機能を足したもの。"""
+    from video_source import SyntheticSource
+
+    class TimedSyntheticSource(SyntheticSource):
+        def read(self):
+            ok, frame = super().read()
+            if ok:
+                generated_at[self._n] = time.perf_counter()
+            return ok, frame
+
+    return TimedSyntheticSource(pacing=str(fps) if fps > 0 else "max")
+
+
+def bench_server(args) -> Dict[str, dict]:
+    use_dir(GAME_DIR)
+    import server
+    from protocol import decode_binary
+    import simple_websocket
+
+    generated_at: Dict[int, float] = {}
+    server.hub.source_factory = lambda: _timed_source(args.fps, generated_at)
+    server.hub.players = args.players
+    srv = _start_server(server.app, args.port)
+    url = f"ws://127.0.0.1:{args.port}/ws?mode={args.mode}&stream={args.stream}"
+    latencies: List[float] = []
+    connect_times: List[float] = []
+    counts: List[int] = []
+    received: List[int] = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(args.clients)
+
+    def client() -> None:
+        start_barrier.wait()
+        t0 = time.perf_counter()
+        ws = simple_websocket.Client.connect(url)
+        connected = time.perf_counter()
+        local_lat, n, size = [], 0, 0
+        deadline = connected + args.seconds
+        try:
+            while time.perf_counter() < deadline:
+                msg = ws.receive(timeout=1.0)
+                if msg is None:
+                    continue
+                now = time.perf_counter()
+                size += len(msg)
+                if isinstance(msg, bytes):
+                    frame_id = decode_binary(msg)[0].get("frame_id")
+                else:
+                    frame_id = json.loads(msg).get("frame_id")
+                gen = generated_at.get(frame_id)
+                if gen is not None:
+                    local_lat.append(now - gen)
+                n += 1
+        finally:
+            ws.close()
+        with lock:
+            latencies.extend(local_lat)
+            connect_times.append(connected - t0)
+            counts.append(n)
+            received.append(size)
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    srv.shutdown()
+
+    total = sum(counts)
+    return {
+        f"server/{args.mode}/{args.stream}/p{args.players}/c{args.clients}": {
+            "clients": args.clients,
+            "messages": total,
+            "messages_per_s": round(total / elapsed, 1),
+            "frames_per_s_per_client": round(total / elapsed / max(args.clients, 1), 1),
+            "kb_per_s_per_client": round(sum(received) / 1024 / elapsed / max(args.clients, 1), 1),
+            "latency": percentiles(latencies),
+            "connect": percentiles(connect_times),
+        }
+    }
+
+
+def bench_app(args) -> Dict[str, dict]:
+    use_dir(BACKEND_DIR)
+    import app as app_module
+    from metrics import METRICS
+    import simple_websocket
+
+    srv = _start_server(app_module.app, args.port)
+
+    url = f"ws://127.0.0.1:{args.port}/ws"
+    connect_times: List[float] = []
+    send_rates: List[float] = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(args.clients)
+    payload = json.dumps({"type": "pose_detected", "pose": "PUNCH", "timestamp": 0})
+    received_before = METRICS.meter("messages_received").count
+
+    def client() -> None:
+        start_barrier.wait()
+        t0 = time.perf_counter()
+        ws = simple_websocket.Client.connect(url)
+        ws.receive(timeout=5.0)  # 接続直後の {"status": "connected"}
+        connected = time.perf_counter()
+        for _ in range(args.messages):
+            ws.send(payload)
+        sent = time.perf_counter()
+        with lock:
+            connect_times.append(connected - t0)
+            send_rates.append(args.messages / (sent - connected))
+        time.sleep(0.2)
+        ws.close()
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # サーバーがすべて処理し終わるまで待つ
+    expected = received_before + args.clients * args.messages
+    deadline = time.perf_counter() + 30
+    while METRICS.meter("messages_received").count < expected and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    processed = METRICS.meter("messages_received").count - received_before
+    handle = METRICS.histogram("ws_handle").snapshot()
+    srv.shutdown()
+
+    return {
+        f"app/ws/c{args.clients}": {
+            "clients": args.clients,
+            "messages": processed,
+            "server_messages_per_s": round(processed / elapsed, 1),
+            "client_send_per_s_avg": round(float(np.mean(send_rates)), 1) if send_rates else 0.0,
+            "handle_latency": {k: v for k, v in handle.items() if k != "count"},
+            "connect": percentiles(connect_times),
+        }
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("server", "app"), default="app")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--out", default="-", help="結果 JSON の出力先（- は標準出力）")
+    # server 用
+    parser.add_argument("--seconds", type=float, default=5.0, help="[server] 計測時間")
+    parser.add_argument("--fps", type=float, default=30.0, help="[server] 合成フレームの FPS（0 で最高速）")
+    parser.add_argument("--mode", choices=("json", "binary"), default="json", help="[server] 送信フォーマット")
+    parser.add_argument("--players", type=int, choices=(1, 2), default=1, help="[server] 2 で2人対戦モード")
+    parser.add_argument("--stream", choices=("video", "skeleton"), default="video",
+                        help="[server] プレビューを JPEG（video）で受けるかランドマーク（skeleton）で受けるか")
+    # app 用
+    parser.add_argument("--messages", type=int, default=1000, help="[app] 1クライアントが送るメッセージ数")
+    args = parser.parse_args()
+
+    with quiet():
+        results = bench_server(args) if args.target == "server" else bench_app(args)
+    write_results("ws", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
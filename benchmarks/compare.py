@@ -0,0 +1,63 @@
+"""
+ベンチマーク結果 JSON の比較
+
+  python benchmarks/compare.py old.json new.json [--threshold 0.1]
+
+両方にあるケースの数値を並べ、変化率を表示する。*_per_s は大きいほど良い、*_ms / *_kb は小さいほど良い
+として扱い、threshold（既定 10%）を超えて悪化した項目に "REGRESSION" を付ける。
+悪化が1つでもあれば終了コード 1。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from typing import Dict, Iterator, Tuple
+
+
+def _flatten(prefix: str, value) -> Iterator[Tuple[str, float]]:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _flatten(f"{prefix}.{k}" if prefix else k, v)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, float(value)
+
+
+def _higher_is_better(key: str) -> bool:
+    return key.endswith("_per_s") or "per_s" in key.rsplit(".", 1)[-1]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    old_values: Dict[str, float] = dict(_flatten("", old.get("results", {})))
+    new_values: Dict[str, float] = dict(_flatten("", new.get("results", {})))
+    old_values["max_rss_kb"] = old.get("max_rss_kb", 0)
+    new_values["max_rss_kb"] = new.get("max_rss_kb", 0)
+
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    regressions = 0
+    for key in sorted(old_values.keys() & new_values.keys()):
+        if key.endswith((".n", ".count", ".clients", ".peak_connected", ".drops")) or ".mix." in key:
+            continue
+        a, b = old_values[key], new_values[key]
+        if a == 0:
+            continue
+        change = (b - a) / a
+        worse = -change if _higher_is_better(key) else change
+        flag = "  REGRESSION" if worse > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{key:70s} {a:14.3f} -> {b:14.3f} ({change:+7.1%}){flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
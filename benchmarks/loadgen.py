@@ -0,0 +1,527 @@
+"""
+WebSocket 負荷生成ツール（1デプロイで何人まで持つかを測る）
+
+別プロセスのサーバー（backend/app.py・app_async.py・fighting-game-pose/server.py）に、数千の
+模擬クライアントを asyncio でつなぐ。相手はローカルのサーバーだけで、外部サービスは使わない。
+aiohttp が必要（backend/requirements.txt）。
+
+  # Procfile と同じ構成（gunicorn gthread、1 ワーカー x 4 スレッド）を起動して 1000 クライアント
+  python benchmarks/loadgen.py --spawn gunicorn --clients 1000 --seconds 30 --out bench/load_gthread.json
+  # Dockerfile と同じ gevent ワーカー / スレッド数を変えたもの。compare.py で比べる
+  python benchmarks/loadgen.py --spawn gunicorn --worker-class gevent --clients 1000 --out bench/load_gevent.json
+  python benchmarks/loadgen.py --spawn gunicorn --threads 16 --clients 1000 --out bench/load_t16.json
+  python benchmarks/compare.py bench/load_gthread.json bench/load_gevent.json
+  # asyncio 版（python app_async.py）/ 開発サーバー（python app.py）/ 任意のコマンド（{port} を置き換える）
+  python benchmarks/loadgen.py --spawn async --clients 3000
+  python benchmarks/loadgen.py --spawn "gunicorn app:app -b 127.0.0.1:{port} -k gevent -w 2"
+  # 起動済みのサーバー（CPU / メモリは --pid を渡したときだけ測る）
+  python benchmarks/loadgen.py --url http://127.0.0.1:5000 --pid 12345
+  # fighting-game-pose/server.py（POSE_SOURCE=synthetic で起動する。MediaPipe が必要）
+  python benchmarks/loadgen.py --target pose --spawn dev --clients 50 --query preview=0
+  # メッセージ形式（wire_codec.py）をサブプロトコルで選ぶ。received_kb_per_s と server の CPU を比べる
+  python benchmarks/loadgen.py --spawn gunicorn --clients 1000 --codec packed --out bench/load_packed.json
+
+クライアントの振る舞いは --mix で割合を指定する（既定 stream:0.8,slow:0.1,drop:0.1）。
+  stream : --rate 回/秒でポーズを送り（--target pose と /test は読むだけ）、届いたメッセージをすぐ読む
+  slow   : stream と同じだが、1メッセージ読むごとに --slow-ms 待つ（読むのが遅いクライアント）
+  drop   : stream と同じだが、平均 --drop-after 秒で close ハンドシェイク無しに TCP を切り、つなぎ直す
+  idle   : 何も送らず読むだけ（観戦者）
+app の /ws は2接続ずつ同じ部屋（POST /rooms で作る）に P1 / P2 として入る。--payload landmarks で
+ポーズ名の代わりに量子化ランドマーク（landmark_codec.py）を送る。--endpoint test で /test。
+--codec json|msgpack|packed で接続時にサブプロトコル gafa.<codec> を希望し、選ばれた形式で送受信する
+（未指定ならサブプロトコル無し = json。server.py は --query mode=binary の従来形式も読める）。
+--workers 2 以上では、gunicorn が起動ディレクトリから読む backend/gunicorn.conf.py がルームホスト（room_host.py）を
+立て、部屋は ROOM_BUS 経由でワーカー間で共有される。同じ部屋の2人が別のワーカーに入っても同じ試合になる。
+
+計測値:
+  connect        : WebSocket のハンドシェイク完了までの時間。connect_errors は失敗数（タイムアウト含む）
+  latency        : サーバーがメッセージに付けた時刻（timestamp / ts）からクライアントが受け取るまで
+                   （slow は自分で読むのを遅らせているので含めない）
+  input_latency  : [app /ws] ポーズを送ってから、それを反映した game_state を受け取るまで。サンプルが無ければ null
+                   （--payload landmarks では送ったフレームがどのポーズになるかはサーバーの分類と安定化しだいで
+                   待ち合わせられないので、常に null。0 ms と区別して compare.py の比較からも外れる）
+  received_per_s / sent_per_s / received_kb_per_s : スループット
+  seq_gaps       : seq の飛び（届く途中で抜けたメッセージ。0 のはず。seq は送信時に振るので、サーバーが
+                   遅いクライアントのキューから捨てた分は server_metrics の dropped_messages に出る）
+  server_closed  : サーバー側から切られた接続数。drops は drop クライアントが自分で切った回数
+  client_loop_lag: 負荷生成側のイベントループの遅れ。大きければ計測値は生成側の限界で頭打ちになっている
+  server         : サーバーのプロセス（子プロセスを含む）の CPU 使用率（100 = 1コア）と最大 RSS（/proc）
+  server_metrics : 終了時にサーバーの /metrics から取った counters
+"""
+
+from __future__ import annotations
+
+import argparse
+import array
+import asyncio
+import os
+import random
+import resource
+import shlex
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from _common import BACKEND_DIR, GAME_DIR, percentiles, use_dir, write_results
+
+use_dir(BACKEND_DIR)
+from _common import synthetic_landmarks  # noqa: E402
+from landmark_codec import encode_landmarks  # noqa: E402
+from pose_logic import POSE_LABELS  # noqa: E402
+from wire_codec import CODECS, SUBPROTOCOL_PREFIX, decode, encode, negotiate  # noqa: E402
+
+BEHAVIOURS = ("stream", "slow", "drop", "idle")
+# 入力の遅れを測るとき、送ったポーズが game_state に出てこないまま待つ上限（秒）
+INPUT_TIMEOUT = 2.0
+_HEADER_LEN = struct.Struct(">I")
+
+
+class Stats:
+    """全クライアントの計測値（イベントループ1本から触るのでロックは無い）。"""
+
+    def __init__(self):
+        self.connect = array.array("d")
+        self.latency = array.array("d")
+        self.input_latency = array.array("d")
+        self.loop_lag = array.array("d")
+        self.connect_errors = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.sent = 0
+        self.seq_gaps = 0
+        self.server_closed = 0
+        self.drops = 0
+        self.connected = 0
+        self.peak_connected = 0
+
+
+class ProcessSampler:
+    """サーバーのプロセスとその子孫の CPU 時間と RSS を /proc から一定間隔で読む（Linux のみ）。"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_percent: List[float] = []
+        self.rss_kb: List[int] = []
+        self.processes = 0
+        self._ticks = os.sysconf("SC_CLK_TCK")
+        self._page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+
+    def _read(self) -> Tuple[float, int, int]:
+        stats = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "rb") as f:
+                    fields = f.read().rsplit(b")", 1)[1].split()
+            except OSError:
+                continue
+            # fields[1]=ppid, [11]=utime, [12]=stime, [21]=rss（ページ数）
+            stats[int(entry)] = (int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21]))
+        tree = {self.pid}
+        changed = True
+        while changed:
+            children = {pid for pid, (ppid, _, _) in stats.items() if ppid in tree} - tree
+            tree |= children
+            changed = bool(children)
+        tree &= stats.keys()
+        cpu = sum(stats[pid][1] for pid in tree) / self._ticks
+        rss = sum(stats[pid][2] for pid in tree) * self._page_kb
+        return cpu, rss, len(tree)
+
+    async def run(self) -> None:
+        cpu, _, _ = self._read()
+        at = time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            now_cpu, rss, self.processes = self._read()
+            now = time.perf_counter()
+            self.cpu_percent.append(max(now_cpu - cpu, 0.0) / (now - at) * 100.0)
+            self.rss_kb.append(rss)
+            cpu, at = now_cpu, now
+
+    def snapshot(self) -> Dict[str, float]:
+        cpu = self.cpu_percent or [0.0]
+        return {
+            "cpu_percent_avg": round(sum(cpu) / len(cpu), 1),
+            "cpu_percent_max": round(max(cpu), 1),
+            "rss_kb_max": max(self.rss_kb or [0]),
+            "processes": self.processes,
+        }
+
+
+def _parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition(":")
+        name = name.strip()
+        if name not in BEHAVIOURS:
+            raise ValueError(f"unknown behaviour {name!r} (choose from {', '.join(BEHAVIOURS)})")
+        mix[name] = float(weight or 1)
+    if sum(mix.values()) <= 0:
+        raise ValueError("--mix weights must add up to more than 0")
+    return mix
+
+
+def _assign(clients: int, mix: Dict[str, float]) -> List[str]:
+    """割合どおりにクライアントへ振る舞いを割り当てる（端数は先頭から）。"""
+    total = sum(mix.values())
+    out: List[str] = []
+    for name, weight in mix.items():
+        out += [name] * int(clients * weight / total)
+    names = list(mix)
+    while len(out) < clients:
+        out.append(names[len(out) % len(names)])
+    random.Random(0).shuffle(out)
+    return out
+
+
+def _spawn_command(args) -> Tuple[List[str], str, Dict[str, str]]:
+    """--spawn からサーバーの起動コマンド・作業ディレクトリ・環境変数を作る。"""
+    cwd = BACKEND_DIR if args.target == "app" else GAME_DIR
+    env = dict(os.environ, PORT=str(args.port))
+    if args.target == "pose":
+        env.setdefault("POSE_SOURCE", "synthetic")
+    bind = f"127.0.0.1:{args.port}"
+    if args.spawn == "gunicorn":
+        if args.worker_class == "aiohttp.GunicornWebWorker":
+            module = "app_async:create_app()"
+        else:
+            module = "app:app" if args.target == "app" else "server:app"
+        cmd = ["gunicorn", module, "--bind", bind, "--workers", str(args.workers),
+               "--threads", str(args.threads), "--worker-class", args.worker_class, "--timeout", "120"]
+    elif args.spawn == "async":
+        cmd = [sys.executable, "app_async.py"]
+    elif args.spawn == "dev":
+        cmd = [sys.executable, "app.py" if args.target == "app" else "server.py"]
+    else:
+        cmd = shlex.split(args.spawn.format(port=args.port))
+    return cmd, cwd, env
+
+
+async def _wait_ready(session: aiohttp.ClientSession, url: str, timeout: float, proc=None) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            async with session.get(f"{url}/metrics") as resp:
+                if resp.status == 200:
+                    return
+        except (aiohttp.ClientError, OSError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not become ready in {timeout:.0f}s")
+
+
+async def _create_rooms(session: aiohttp.ClientSession, url: str, count: int, round_seconds: int) -> List[str]:
+    """部屋を count 個作る。/rooms の無いサーバー（古いコミット）では名前を決めて入る。"""
+    rooms = []
+    for i in range(count):
+        try:
+            async with session.post(f"{url}/rooms", json={"round_seconds": round_seconds}) as resp:
+                if resp.status != 201:
+                    raise aiohttp.ClientError(resp.status)
+                rooms.append((await resp.json())["room"])
+        except (aiohttp.ClientError, OSError, ValueError, KeyError):
+            rooms.append(f"load{i}")
+    return rooms
+
+
+def _abort(ws: aiohttp.ClientWebSocketResponse) -> None:
+    """close フレームを送らずに TCP を切る（タブを閉じた・回線が落ちたときと同じ見え方）。"""
+    sock = ws.get_extra_info("socket")
+    if sock is None:
+        return
+    raw = socket.socket(fileno=os.dup(sock.fileno()))
+    try:
+        # 最後の fd が閉じたときに FIN ではなく RST を送る
+        raw.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        raw.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        raw.close()
+
+
+class Client:
+    """模擬クライアント1つ。drop の振る舞いでは切断とつなぎ直しを繰り返す。"""
+
+    def __init__(self, index: int, behaviour: str, url: str, args, stats: Stats, frames: List[bytes]):
+        self.index = index
+        self.behaviour = behaviour
+        self.url = url
+        self.args = args
+        self.stats = stats
+        self.frames = frames
+        self.rng = random.Random(index)
+        self.sends = behaviour != "idle" and args.rate > 0 and args.target == "app" and args.endpoint == "ws"
+        self.player_key: Optional[str] = None
+        self.pose = "IDLE"
+        self.pending: Optional[Tuple[str, float]] = None  # (送ったポーズ, 送った時刻)
+        self.protocols = (SUBPROTOCOL_PREFIX + args.codec,) if args.codec else ()
+
+    async def run(self, session: aiohttp.ClientSession, stop_at: float) -> None:
+        stats = self.stats
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                ws = await asyncio.wait_for(
+                    session.ws_connect(self.url, autoping=True, max_msg_size=0, protocols=self.protocols),
+                    self.args.connect_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                stats.connect_errors += 1
+                return
+            stats.connect.append(time.perf_counter() - started)
+            stats.connected += 1
+            stats.peak_connected = max(stats.peak_connected, stats.connected)
+            end = stop_at
+            if self.behaviour == "drop":
+                end = min(stop_at, time.perf_counter() + self.rng.expovariate(1.0 / self.args.drop_after))
+            tasks = [asyncio.create_task(self._read(ws))]
+            if self.sends:
+                tasks.append(asyncio.create_task(self._send(ws)))
+            done, _ = await asyncio.wait(tasks, timeout=max(end - time.perf_counter(), 0.0),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            server_closed = tasks[0] in done
+            dropped = not server_closed and end < stop_at
+            if dropped:
+                _abort(ws)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if not dropped and not ws.closed:
+                try:
+                    await asyncio.wait_for(ws.close(), 2.0)
+                except (asyncio.TimeoutError, aiohttp.ClientError, OSError):
+                    pass
+            stats.connected -= 1
+            if server_closed:
+                stats.server_closed += 1
+                return
+            if not dropped:
+                return
+            stats.drops += 1
+            self.player_key, self.pending = None, None
+            await asyncio.sleep(self.rng.uniform(0.1, 0.5))
+
+    async def _send(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        interval = 1.0 / self.args.rate
+        codec = negotiate(ws.protocol)
+        # 送り始めはクライアントごとにずらす（全員が同じ瞬間に送らないように）
+        await asyncio.sleep(self.rng.uniform(0.0, interval))
+        next_at = time.perf_counter()
+        while True:
+            if self.frames:
+                await ws.send_bytes(self.frames[self.rng.randrange(len(self.frames))])
+            else:
+                self.pose = self.rng.choice([p for p in POSE_LABELS if p != self.pose])
+                now = time.perf_counter()
+                if self.pending is None or now - self.pending[1] > INPUT_TIMEOUT:
+                    self.pending = (self.pose, now)
+                message = encode({"type": "pose_detected", "pose": self.pose}, codec)
+                await (ws.send_str(message) if isinstance(message, str) else ws.send_bytes(message))
+            self.stats.sent += 1
+            next_at += interval
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0.0))
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        stats = self.stats
+        slow = self.args.slow_ms / 1000.0 if self.behaviour == "slow" else 0.0
+        last_seq = 0
+        async for message in ws:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                raw = message.data
+                size = len(raw)
+            elif message.type == aiohttp.WSMsgType.BINARY:
+                size = len(message.data)
+                raw = message.data
+                if raw[:1] == b"\0":
+                    # server.py の ?mode=binary: [ヘッダ長] + [ヘッダ JSON] + [JPEG]
+                    (header_len,) = _HEADER_LEN.unpack_from(raw)
+                    raw = raw[4:4 + header_len].decode()
+            else:
+                break
+            stats.received += 1
+            stats.received_bytes += size
+            try:
+                data = decode(raw)
+            except ValueError:
+                continue
+            now = time.time()
+            seq = data.get("seq")
+            if isinstance(seq, int):
+                if last_seq and seq > last_seq + 1:
+                    stats.seq_gaps += seq - last_seq - 1
+                last_seq = seq
+            if not slow:
+                if "timestamp" in data:
+                    stats.latency.append(max(now - data["timestamp"] / 1000.0, 0.0))
+                elif "ts" in data:
+                    stats.latency.append(max(now - data["ts"], 0.0))
+            if data.get("status") == "connected":
+                self.player_key = {"P1": "player1", "P2": "player2"}.get(data.get("player"))
+            elif self.pending is not None and self.player_key and data.get("type") == "game_state":
+                if data[self.player_key]["pose"] == self.pending[0]:
+                    stats.input_latency.append(time.perf_counter() - self.pending[1])
+                    self.pending = None
+            if slow:
+                await asyncio.sleep(slow)
+
+
+async def _watch_loop_lag(stats: Stats, interval: float = 0.05) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(time.perf_counter() - started - interval)
+
+
+def _ws_url(args, base: str, index: int, rooms: List[str]) -> str:
+    url = base.replace("http://", "ws://", 1) + "/" + args.endpoint
+    params = []
+    if args.target == "app" and args.endpoint == "ws":
+        params += [f"room={rooms[index // 2]}", f"player={'P1' if index % 2 == 0 else 'P2'}"]
+    if args.query:
+        params.append(args.query)
+    return url + ("?" + "&".join(params) if params else "")
+
+
+async def run_load(args) -> Dict[str, dict]:
+    stats = Stats()
+    proc = None
+    sampler = None
+    pid = args.pid
+    base = args.url or f"http://127.0.0.1:{args.port}"
+    if args.spawn:
+        cmd, cwd, env = _spawn_command(args)
+        print(f"spawn: {' '.join(cmd)} (cwd={cwd})", file=sys.stderr)
+        log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        pid = proc.pid
+    behaviours = _assign(args.clients, _parse_mix(args.mix))
+    frames = [encode_landmarks(lm) for lm in synthetic_landmarks(64, seed=1)] if args.payload == "landmarks" else []
+    # limit=0: aiohttp の既定（同時 100 接続まで）を外す
+    connector = aiohttp.TCPConnector(limit=0, force_close=True)
+    background: List[asyncio.Task] = []
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await _wait_ready(session, base, args.ready_timeout, proc)
+            rooms: List[str] = []
+            if args.target == "app" and args.endpoint == "ws":
+                rooms = await _create_rooms(session, base, (args.clients + 1) // 2,
+                                            min(int(args.seconds) + 30, 600))
+            if pid and os.path.isdir("/proc"):
+                sampler = ProcessSampler(pid)
+                background.append(asyncio.create_task(sampler.run()))
+            background.append(asyncio.create_task(_watch_loop_lag(stats)))
+            clients = [Client(i, behaviours[i], _ws_url(args, base, i, rooms), args, stats, frames)
+                       for i in range(args.clients)]
+            started = time.perf_counter()
+            stop_at = started + args.ramp + args.seconds
+            tasks = []
+            for i, client in enumerate(clients):
+                # --ramp 秒かけて均等に接続していく
+                if args.ramp > 0:
+                    await asyncio.sleep(max(started + args.ramp * i / args.clients - time.perf_counter(), 0.0))
+                tasks.append(asyncio.create_task(client.run(session, stop_at)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+            server_metrics = {}
+            try:
+                async with session.get(f"{base}/metrics") as resp:
+                    server_metrics = (await resp.json()).get("counters", {})
+            except (aiohttp.ClientError, OSError, ValueError):
+                pass
+    finally:
+        for task in background:
+            task.cancel()
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    key = f"{args.target}/{args.endpoint}/{args.spawn or 'external'}/c{args.clients}"
+    if args.codec:
+        key += f"/{args.codec}"
+    result = {
+        "clients": args.clients,
+        "mix": {b: behaviours.count(b) for b in BEHAVIOURS if b in behaviours},
+        "peak_connected": stats.peak_connected,
+        "connect_errors": stats.connect_errors,
+        "server_closed": stats.server_closed,
+        "drops": stats.drops,
+        "seq_gaps": stats.seq_gaps,
+        "received_per_s": round(stats.received / elapsed, 1),
+        "received_kb_per_s": round(stats.received_bytes / 1024 / elapsed, 1),
+        "sent_per_s": round(stats.sent / elapsed, 1),
+        "connect": percentiles(stats.connect),
+        "latency": percentiles(stats.latency),
+        "input_latency": percentiles(stats.input_latency) if stats.input_latency else None,
+        "client_loop_lag": percentiles(stats.loop_lag),
+        "server_metrics": server_metrics,
+    }
+    if sampler is not None:
+        result["server"] = sampler.snapshot()
+    return {key: result}
+
+
+def _raise_fd_limit() -> None:
+    """数千接続ぶんのファイルディスクリプタを使えるよう、ソフトリミットをハードリミットまで上げる。"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("app", "pose"), default="app",
+                        help="app = backend/app.py（app_async.py）、pose = fighting-game-pose/server.py")
+    parser.add_argument("--endpoint", choices=("ws", "test"), default="ws")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=20.0, help="全員がつながってからの計測時間")
+    parser.add_argument("--ramp", type=float, default=5.0, help="全クライアントが接続し終えるまでの秒数")
+    parser.add_argument("--mix", default="stream:0.8,slow:0.1,drop:0.1", help="振る舞いの割合（stream/slow/drop/idle）")
+    parser.add_argument("--rate", type=float, default=10.0, help="stream / slow / drop が送る回数/秒")
+    parser.add_argument("--payload", choices=("pose", "landmarks"), default="pose", help="[app /ws] 送る内容")
+    parser.add_argument("--slow-ms", type=float, default=200.0, help="slow が1メッセージ読むごとに待つミリ秒")
+    parser.add_argument("--drop-after", type=float, default=5.0, help="drop が切断するまでの平均秒数")
+    parser.add_argument("--codec", choices=CODECS, help="接続時にサブプロトコルで希望するメッセージ形式（wire_codec.py）")
+    parser.add_argument("--query", default="", help="/ws に付けるクエリ（例: updates=change、mode=binary）")
+    parser.add_argument("--connect-timeout", type=float, default=10.0)
+    # サーバー
+    parser.add_argument("--spawn", help="gunicorn / async / dev / 任意のコマンド（{port} を置き換える）")
+    parser.add_argument("--url", help="起動済みのサーバー（例: http://127.0.0.1:5000）")
+    parser.add_argument("--pid", type=int, help="起動済みのサーバーの PID（CPU / メモリを測る）")
+    parser.add_argument("--port", type=int, default=5098, help="--spawn で起動するサーバーのポート")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="[gunicorn] Procfile / Dockerfile は WEB_CONCURRENCY（既定 1）。2 以上なら ROOM_BUS で部屋を共有する")
+    parser.add_argument("--threads", type=int, default=4, help="[gunicorn] Procfile は 4")
+    parser.add_argument("--worker-class", default="gthread", help="[gunicorn] Procfile は gthread、Dockerfile は gevent")
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--server-log", help="起動したサーバーの出力の保存先（既定は捨てる）")
+    parser.add_argument("--out", default="-", help="結果 JSON の出力先（- は標準出力）")
+    args = parser.parse_args()
+    if bool(args.spawn) == bool(args.url):
+        parser.error("give either --spawn or --url")
+    if args.spawn == "async" and args.target != "app":
+        parser.error("--spawn async is only for --target app")
+    try:
+        _parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    _raise_fd_limit()
+    results = asyncio.run(run_load(args))
+    write_results("load", results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,118 @@ const gravity = 0.7
 const cameraFeed = document.getElementById('cameraFeed');
 
 // 2. WebSocketサーバーに接続
-const socket = new WebSocket('ws://localhost:5000/ws');
+// WS_MODE: 'json'（従来: JSON + Base64画像）/ 'binary'（ヘッダ + JPEG生バイト。帯域・CPUが軽い）
+const WS_MODE = 'json';
+// WS_STREAM: 'video'（サーバーが骨格を描いた JPEG）/ 'skeleton'（ランドマークだけ受け取り、骨格はここで描く。
+// 1人 266 バイトで、サーバーは描画も JPEG 化もしない。滑らかにしたければ fps を上げる）
+const WS_STREAM = 'video';
+const wsQuery = [];
+if (WS_MODE === 'binary') wsQuery.push('mode=binary');
+if (WS_STREAM === 'skeleton') wsQuery.push('stream=skeleton', 'fps=30');
+const socket = new WebSocket('ws://localhost:5000/ws' + (wsQuery.length ? '?' + wsQuery.join('&') : ''));
+socket.binaryType = 'arraybuffer';
+let cameraFeedUrl = null;
+const skeletonCanvas = document.getElementById('skeletonCanvas');
+const skeletonContext = skeletonCanvas.getContext('2d');
+if (WS_STREAM === 'skeleton') {
+  cameraFeed.style.display = 'none';
+  skeletonCanvas.style.display = 'block';
+}
+// サーバーの送信通し番号（seq が飛んだら取りこぼし、戻ったら順序の入れ替わり）
+let lastSeq = 0;
+
+// バイナリメッセージ: [ヘッダ長(4byte)] + [ヘッダJSON] + [JPEG]
+function handleBinaryMessage(buffer) {
+  const headerLen = new DataView(buffer).getUint32(0);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLen)));
+  if (header.image_size > 0) {
+    const blob = new Blob([new Uint8Array(buffer, 4 + headerLen)], { type: 'image/jpeg' });
+    if (cameraFeedUrl) URL.revokeObjectURL(cameraFeedUrl);
+    cameraFeedUrl = URL.createObjectURL(blob);
+    cameraFeed.src = cameraFeedUrl;
+  }
+  if (header.landmarks_size > 0) {
+    drawSkeletons(splitLandmarks(new Uint8Array(buffer, 4 + headerLen, header.landmarks_size)));
+  }
+  return header;
+}
+
+// --- ?stream=skeleton: 量子化ランドマーク（landmark_codec.py）から骨格を描く ---
+const LANDMARK_MAGIC = 0x4C;
+const LANDMARK_FLAG_PRESENT = 0x01;
+const LANDMARK_FRAME_SIZE = 2 + 33 * 4 * 2;
+const LANDMARK_SCALE = 8192;
+// MediaPipe Pose の POSE_CONNECTIONS（サーバー側の描画と同じ線）
+const SKELETON_CONNECTIONS = [
+  [0, 1], [1, 2], [2, 3], [3, 7], [0, 4], [4, 5], [5, 6], [6, 8], [9, 10],
+  [11, 12], [11, 13], [13, 15], [15, 17], [15, 19], [15, 21], [17, 19],
+  [12, 14], [14, 16], [16, 18], [16, 20], [16, 22], [18, 20],
+  [11, 23], [12, 24], [23, 24], [23, 25], [24, 26], [25, 27], [26, 28],
+  [27, 29], [28, 30], [29, 31], [30, 32], [27, 31], [28, 32],
+];
+
+// プレイヤー数ぶん連結されたランドマークを分けて、[[x, y, visibility] x 33]（人物なしは null）の配列にする
+function splitLandmarks(bytes) {
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  const players = [];
+  let offset = 0;
+  while (offset + 2 <= bytes.length && bytes[offset] === LANDMARK_MAGIC) {
+    if (!(bytes[offset + 1] & LANDMARK_FLAG_PRESENT)) {
+      players.push(null);
+      offset += 2;
+      continue;
+    }
+    const points = [];
+    for (let i = 0; i < 33; i++) {
+      const at = offset + 2 + i * 8;
+      points.push([
+        view.getInt16(at, true) / LANDMARK_SCALE,
+        view.getInt16(at + 2, true) / LANDMARK_SCALE,
+        view.getInt16(at + 6, true) / LANDMARK_SCALE,
+      ]);
+    }
+    players.push(points);
+    offset += LANDMARK_FRAME_SIZE;
+  }
+  return players;
+}
+
+function base64Bytes(text) {
+  return Uint8Array.from(atob(text), (ch) => ch.charCodeAt(0));
+}
+
+function drawSkeletons(players) {
+  const w = skeletonCanvas.width;
+  const h = skeletonCanvas.height;
+  skeletonContext.fillStyle = '#222';
+  skeletonContext.fillRect(0, 0, w, h);
+  if (players.length > 1) {
+    // P1/P2 の境界線
+    skeletonContext.strokeStyle = 'white';
+    skeletonContext.lineWidth = 1;
+    skeletonContext.beginPath();
+    skeletonContext.moveTo(w / 2, 0);
+    skeletonContext.lineTo(w / 2, h);
+    skeletonContext.stroke();
+  }
+  for (const points of players) {
+    if (!points) continue;
+    skeletonContext.strokeStyle = 'rgb(230, 66, 245)';
+    skeletonContext.lineWidth = 2;
+    skeletonContext.beginPath();
+    for (const [a, b] of SKELETON_CONNECTIONS) {
+      if (points[a][2] < 0.5 || points[b][2] < 0.5) continue;
+      skeletonContext.moveTo(points[a][0] * w, points[a][1] * h);
+      skeletonContext.lineTo(points[b][0] * w, points[b][1] * h);
+    }
+    skeletonContext.stroke();
+    skeletonContext.fillStyle = 'rgb(66, 117, 245)';
+    for (const [x, y, visibility] of points) {
+      if (visibility < 0.5) continue;
+      skeletonContext.fillRect(x * w - 2, y * h - 2, 4, 4);
+    }
+  }
+}
 
 // 3. 接続が確立したときの処理
 socket.onopen = function () {
@@ -24,7 +135,16 @@ socket.onopen = function () {
 // 4. サーバーからメッセージを受信したときの処理
 socket.onmessage = function (event) {
   try {
-    const data = JSON.parse(event.data);
+    const data = (event.data instanceof ArrayBuffer)
+      ? handleBinaryMessage(event.data)
+      : JSON.parse(event.data);
+
+    if (data.seq) {
+      if (data.seq !== lastSeq + 1 && lastSeq > 0) {
+        console.warn(`WebSocket seq gap: ${lastSeq} -> ${data.seq}`);
+      }
+      lastSeq = data.seq;
+    }
 
     // ポーズ名を受信した場合
     if (data.pose) {
@@ -38,11 +158,33 @@ socket.onmessage = function (event) {
       // poseController.setCurrentPose('player1', data.pose);
     }
 
+    // 2人対戦モード（サーバーを POSE_PLAYERS=2 で起動）: 画面の左側の人が P1、右側の人が P2
+    if (data.p1_pose) {
+      document.getElementById('player1-pose').textContent = data.p1_pose;
+      poseController.setPlayer1Pose(data.p1_pose);
+    }
+    if (data.p2_pose) {
+      document.getElementById('player2-pose').textContent = data.p2_pose;
+      poseController.setPlayer2Pose(data.p2_pose);
+    }
+
     // カメラ映像を受信した場合
     if (data.image) {
       cameraFeed.src = 'data:image/jpeg;base64,' + data.image;
     }
 
+    // 骨格を受信した場合（?stream=skeleton の json。2人対戦は p1_landmarks / p2_landmarks）
+    const landmarks = data.landmarks !== undefined ? [data.landmarks]
+      : (data.p1_landmarks !== undefined ? [data.p1_landmarks, data.p2_landmarks] : null);
+    if (landmarks) {
+      drawSkeletons(landmarks.map((text) => splitLandmarks(base64Bytes(text))[0] || null));
+    }
+
+    // プレビューを受け取ったら ack を返す（サーバーが RTT を測って画質を自動調整する）
+    if (data.frame_id && (data.image || data.image_size > 0 || landmarks || data.landmarks_size > 0)) {
+      socket.send(JSON.stringify({ ack: data.frame_id }));
+    }
+
     // エラーを受信した場合
     if (data.error) {
       console.error("サーバーエラー:", data.error);
@@ -0,0 +1,53 @@
+"""
+ランドマークの量子化バイナリ形式（ブラウザ → サーバー / server.py → ブラウザ）
+
+ブラウザ側で MediaPipe を動かし（frontend/pose_logic.js の encodeLandmarks）、33 点の
+ランドマークをそのまま送ってもらう形式。サーバーはカメラも推論も持たずに pose_logic で分類する。
+逆向きに、fighting-game-pose/server.py の ?stream=skeleton ではサーバーが推論したランドマークを
+この形式でブラウザへ送り、骨格はブラウザが描く（protocol.py。backend/ と fighting-game-pose/ に同じ内容で置いている）。
+
+1 メッセージ = WebSocket のバイナリフレーム1つ（リトルエンディアン）:
+    MAGIC (uint8, 0x4C 'L') + flags (uint8) + [33 x 4 int16]
+    flags の bit0 (FLAG_PRESENT) が 1 のときだけランドマークが続く（0 なら人物なし、2 バイトだけ）。
+    int16 は x, y, z, visibility を SCALE (8192) 倍して丸めたもの（±4.0 まで、分解能 約 0.00012。
+    640px の画像でも 0.1px 未満）。
+
+JSON で {"landmarks": [{"x": ..., ...}, ...]} を送ると約 3KB になるところが 266 バイトで済み、
+サーバー側もパースが np.frombuffer 1回で終わる。
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+MAGIC = 0x4C
+FLAG_PRESENT = 0x01
+NUM_LANDMARKS = 33
+SCALE = 8192.0
+HEADER_SIZE = 2
+FRAME_SIZE = HEADER_SIZE + NUM_LANDMARKS * 4 * 2
+
+_INT16 = np.dtype("<i2")
+
+
+def encode_landmarks(landmarks: Optional[np.ndarray]) -> bytes:
+    """(33, 4) 配列（人物なしは None）を量子化バイナリにする。"""
+    if landmarks is None:
+        return bytes((MAGIC, 0))
+    arr = np.asarray(landmarks, dtype=np.float32).reshape(NUM_LANDMARKS, 4)
+    quantized = np.clip(np.rint(arr * SCALE), -32768, 32767).astype(_INT16)
+    return bytes((MAGIC, FLAG_PRESENT)) + quantized.tobytes()
+
+
+def decode_landmarks(data: bytes) -> Optional[np.ndarray]:
+    """量子化バイナリを (33, 4) float32 配列に戻す（人物なしは None）。形式が違えば ValueError。"""
+    if len(data) < HEADER_SIZE or data[0] != MAGIC:
+        raise ValueError("not a landmark frame")
+    if not data[1] & FLAG_PRESENT:
+        return None
+    if len(data) != FRAME_SIZE:
+        raise ValueError(f"landmark frame must be {FRAME_SIZE} bytes, got {len(data)}")
+    quantized = np.frombuffer(data, dtype=_INT16, offset=HEADER_SIZE)
+    return (quantized.astype(np.float32) / SCALE).reshape(NUM_LANDMARKS, 4)
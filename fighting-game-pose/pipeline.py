@@ -0,0 +1,109 @@
+"""
+パイプライン用の小さな部品
+
+キャプチャ → 推論 → エンコード を別スレッドで動かすための受け渡し口と計測器。
+
+- LatestSlot: 「最新フレーム優先」の1要素スロット。読まれる前に次が来たら上書きする。
+  後段が遅くても前段は待たされず、後段は常に一番新しいフレームを処理する。
+- StageStats: ステージごとのスループット(FPS)・処理時間・フレーム年齢（キャプチャからの経過時間）を記録する。
+
+時刻はすべて time.perf_counter() の値（秒）で扱う。クライアントに渡すときだけ wall_ms() でエポックミリ秒に直す。
+"""
+
+from __future__ import annotations
+
+import collections
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# perf_counter から壁時計への換算差（起動時に1回だけ測る。以後の時計合わせの影響を受けない）
+_WALL_OFFSET = time.time() - time.perf_counter()
+
+
+def wall_ms(perf: float) -> int:
+    """perf_counter の時刻をエポックミリ秒にする（api_specification.md の timestamp）。"""
+    return int((perf + _WALL_OFFSET) * 1000)
+
+
+class Frame:
+    """キャプチャした1フレーム。frame_id は 1 始まりの通し番号。"""
+
+    __slots__ = ("frame_id", "captured_at", "image")
+
+    def __init__(self, frame_id: int, captured_at: float, image: Any):
+        self.frame_id = frame_id
+        self.captured_at = captured_at
+        self.image = image
+
+
+class LatestSlot:
+    """最新の1件だけを保持する受け渡し口。未読のまま上書きされた件数を overwritten に数える。"""
+
+    def __init__(self):
+        self._item: Any = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self.overwritten = 0
+
+    def put(self, item: Any) -> None:
+        with self._cond:
+            if self._item is not None:
+                self.overwritten += 1
+            self._item = item
+            self._cond.notify()
+
+    def take(self, timeout: Optional[float] = None) -> Any:
+        """最新の要素を取り出す。timeout 内に来なければ（または close 済みなら）None。"""
+        with self._cond:
+            if self._item is None and not self._closed:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class StageStats:
+    """1ステージ分の計測値。直近 window 件から FPS と平均/最大値を出す。"""
+
+    def __init__(self, name: str, window: int = 120):
+        self.name = name
+        self.count = 0
+        self._lock = threading.Lock()
+        self._finished = collections.deque(maxlen=window)   # 完了時刻
+        self._busy = collections.deque(maxlen=window)       # 処理時間
+        self._age = collections.deque(maxlen=window)        # 完了時点でのフレーム年齢
+
+    def record(self, captured_at: float, started_at: float, finished_at: Optional[float] = None) -> None:
+        if finished_at is None:
+            finished_at = time.perf_counter()
+        with self._lock:
+            self.count += 1
+            self._finished.append(finished_at)
+            self._busy.append(finished_at - started_at)
+            self._age.append(finished_at - captured_at)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            finished = list(self._finished)
+            busy = list(self._busy)
+            age = list(self._age)
+            count = self.count
+        fps = 0.0
+        if len(finished) >= 2 and finished[-1] > finished[0]:
+            fps = (len(finished) - 1) / (finished[-1] - finished[0])
+        return {
+            "count": count,
+            "fps": round(fps, 2),
+            "busy_ms_avg": round(1000.0 * sum(busy) / len(busy), 2) if busy else 0.0,
+            "age_ms_avg": round(1000.0 * sum(age) / len(age), 2) if age else 0.0,
+            "age_ms_max": round(1000.0 * max(age), 2) if age else 0.0,
+        }
@@ -0,0 +1,525 @@
+"""
+共有キャプチャ + ブロードキャスト層
+
+映像ソース (video_source.py。既定は Webカメラ) と MediaPipe Pose をプロセス内で1つだけ持ち、
+1フレームごとの判定結果を購読中のすべての WebSocket へ配信する。
+
+使い方例:
+    hub = PoseHub(camera_index=0)
+    hub = PoseHub(source_factory=source_from_env)   # POSE_SOURCE=synthetic などで差し替え
+    sub = hub.subscribe()
+    try:
+        while True:
+            message = sub.get(timeout=1.0)
+            if message is None:
+                if sub.closed:
+                    break
+                continue
+            ws.send(message.encode(mode) if isinstance(message, PoseFrame) else message)
+    finally:
+        hub.unsubscribe(sub)
+
+- 最初の購読者が来たときにカメラを開き、最後の購読者が抜けたら解放する（linger 秒を指定すると、
+  その間に誰も来なかったときだけ解放する。すぐ再接続するクライアントはカメラを開き直さずに済む）。
+- pose_pool（pose_pool.PosePool）を渡すと、推論ステージはウォームアップ済みの Pose を借りて使い、
+  止まるときに返す。起動のたびにモデルの読み込みとグラフの初期化を払わない。
+- 新しい購読者には、直近（0.5 秒以内）のフレームをすぐ1つ渡す（次のフレームを待たない）。
+- 購読者ごとに有界キューを持ち、満杯なら最も古いメッセージを捨てる。
+  送信の遅いブラウザがいても、カメラループや他のクライアントは止まらない。
+- 配信物は protocol.PoseFrame（エラー時のみ JSON 文字列）。JPEG エンコードは1フレーム1回、
+  送信フォーマットごとのシリアライズも1回だけ行い、全購読者で共有する。
+- 購読者ごとに欲しいプレビュー（subscribe(stream=...)）を持つ。映像（"video"）の購読者が1人もいなければ
+  骨格の描画と JPEG 化は行わず、骨格（"skeleton"、?stream=skeleton）の購読者がいればランドマーク配列を
+  PoseFrame に載せる（描画はブラウザ側）。
+- 内部は キャプチャ → 推論 → エンコード の3ステージに分かれ、それぞれ別スレッドで動く。
+  ステージ間は「最新フレーム優先」のスロット (pipeline.LatestSlot) でつなぐので、
+  推論は常に最新フレームを処理し、エンコードは次フレームの推論と重なって進む。
+  各ステージの FPS とフレーム年齢は stats() で取得できる。
+- players=2 で2人対戦モード。画面の左半分を P1、右半分を P2 として、プレイヤーごとの
+  Pose インスタンスで同時に推論し、両者の確定ポーズを同じ frame_id の1メッセージで配る。
+  FPS の目安: 4コア CPU で推論 FPS が1人モードの 80% 以上（2人分の推論が2コアで並列に
+  進むため。benchmarks/bench_ws.py --players 2 と1人モードの結果を比べて確認する）。
+- roi=True で前フレームの人物の周りだけを推論する（roi.py）。追跡が外れたら全体に戻る。
+- inference="process" で推論を別プロセスのワーカーに移す（pose_worker.py）。フレームは共有メモリで
+  渡し、戻りはランドマーク配列だけ。ワーカーが落ちても作り直し、購読者の接続は切らない。
+"""
+
+from __future__ import annotations
+
+import atexit
+import collections
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from landmark_log import LandmarkRecorder
+from metrics import METRICS
+from pipeline import Frame, LatestSlot, StageStats, wall_ms
+from pose_pool import PosePool
+from pose_logic import landmarks_to_array
+from pose_worker import InferencePool, InferenceUnavailable, results_from_array
+from protocol import STREAM_SKELETON, STREAM_VIDEO, PoseFrame
+from roi import RoiTracker
+from stabilizer import PoseStabilizer, StabilizerConfig
+from video_source import CameraSource, VideoSource
+
+# 購読直後に渡す直近フレームの鮮度の上限（秒）
+REPLAY_MAX_AGE = 0.5
+
+
+class Subscriber:
+    """購読者1人分の有界キュー。満杯のときは最古の要素を捨てて新しい要素を入れる。
+
+    stream は欲しいプレビュー（"video" / "skeleton"、None ならポーズだけ）。
+    """
+
+    def __init__(self, maxlen: int = 2, stream: Optional[str] = STREAM_VIDEO):
+        self.stream = stream
+        self._queue: collections.deque = collections.deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self.closed = False
+        # キューあふれで捨てたメッセージ数（遅いクライアントの目安）
+        self.dropped = 0
+
+    def put(self, item: Any) -> None:
+        with self._cond:
+            if self.closed:
+                return
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+                METRICS.inc("dropped_messages")
+            self._queue.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """次のメッセージを返す。timeout 内に来なければ None。"""
+        with self._cond:
+            if not self._queue and not self.closed:
+                self._cond.wait(timeout)
+            if self._queue:
+                return self._queue.popleft()
+            return None
+
+    @property
+    def pending(self) -> int:
+        """未送信でキューに残っている件数。"""
+        return len(self._queue)
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class PoseHub:
+    """カメラ1台 + Pose 1インスタンスを共有し、結果を全購読者へ配る。"""
+
+    def __init__(self, camera_index: int = 0, stabilizer: Optional[StabilizerConfig] = None, queue_size: int = 2,
+                 record_path: Optional[str] = None,
+                 source_factory: Optional[Callable[[], VideoSource]] = None,
+                 players: int = 1, roi: bool = False, inference: str = "thread",
+                 inference_workers: Optional[int] = None, pose_pool: Optional[PosePool] = None,
+                 linger: float = 0.0):
+        if players not in (1, 2):
+            raise ValueError("players must be 1 or 2")
+        if inference not in ("thread", "process"):
+            raise ValueError("inference must be 'thread' or 'process'")
+        # "process" なら MediaPipe を別プロセスで動かす（pose_worker.py）。ワーカー数の既定はプレイヤー数
+        self.inference = inference
+        self.inference_workers = inference_workers
+        # True なら前フレームの人物周りだけを推論する（roi.py）。節約量は /metrics の "roi" で見られる
+        self.roi = roi
+        self._roi_area: collections.deque = collections.deque(maxlen=240)
+        self.camera_index = camera_index
+        # 2 にすると画面を左右に分けて P1/P2 を同時に判定する（2人対戦モード）
+        self.players = players
+        # キャプチャ開始ごとに呼ばれ、新しい VideoSource を返す。省略時は camera_index の Webカメラ
+        self.source_factory = source_factory or (lambda: CameraSource(self.camera_index))
+        # 確定ポーズの安定化設定（時間ベースのデバウンス + 任意のランドマークフィルタ、stabilizer.py）
+        self.stabilizer = stabilizer or StabilizerConfig()
+        self.queue_size = queue_size
+        # ウォームアップ済みの Pose の貸し出し元（inference="thread" のとき。省略時は起動のたびに作る）
+        self.pose_pool = pose_pool
+        # 最後の購読者が抜けてからカメラを解放するまでの猶予（秒）。0 なら即解放
+        self.linger = linger
+
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()       # 購読者リスト用
+        self._run_lock = threading.Lock()   # キャプチャスレッドの起動/停止用
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._idle_since = 0.0
+        # 直近に配ったフレーム (キャプチャ時刻, PoseFrame)。新しい購読者にすぐ渡す
+        self._latest: Optional[Tuple[float, PoseFrame]] = None
+
+        # ステージ計測とステージ間スロット（キャプチャ開始ごとに作り直す）
+        self._stage_stats: Dict[str, StageStats] = {}
+        self._infer_slot: Optional[LatestSlot] = None
+        self._encode_slot: Optional[LatestSlot] = None
+
+        # record_path を渡すと推論結果のランドマークを .plog に記録する（landmark_log.py）
+        self._recorder: Optional[LandmarkRecorder] = None
+        if record_path:
+            self._recorder = LandmarkRecorder(record_path)
+            atexit.register(self._recorder.close)
+            print(f"Recording landmarks to {record_path}")
+
+        METRICS.gauge("clients", lambda: self.subscriber_count)
+        METRICS.gauge("dropped_frames", lambda: {
+            "inference": self._infer_slot.overwritten if self._infer_slot else 0,
+            "encode": self._encode_slot.overwritten if self._encode_slot else 0,
+        })
+        METRICS.gauge("roi", self._roi_stats)
+
+    # --- 購読 ---
+    def subscribe(self, stream: Optional[str] = STREAM_VIDEO) -> Subscriber:
+        """stream は欲しいプレビュー（"video" / "skeleton"、None ならポーズだけ）。"""
+        sub = Subscriber(self.queue_size, stream)
+        with self._lock:
+            # publish_frame と同じロックの中で入れるので、直近フレームとその次のフレームが前後しない
+            latest = self._latest
+            if latest is not None and time.perf_counter() - latest[0] <= REPLAY_MAX_AGE:
+                sub.put(latest[1])
+            self._subscribers.append(sub)
+        self._ensure_running()
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        sub.close()
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+            empty = not self._subscribers
+            if empty:
+                self._idle_since = time.perf_counter()
+        if empty and self.linger <= 0:
+            # 誰も見ていなければカメラを解放する（linger があればキャプチャループが猶予後に止める）
+            self._stop.set()
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _streams(self) -> set:
+        """今の購読者が欲しいプレビューの種類。"""
+        with self._lock:
+            return {sub.stream for sub in self._subscribers}
+
+    def publish(self, message: Any) -> None:
+        """全購読者のキューに同じメッセージを入れる（ブロックしない）。"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.put(message)
+
+    def _publish_frame(self, pose_frame: PoseFrame, captured_at: float) -> None:
+        """publish と同じだが、新しい購読者向けに直近フレームとして覚えておく。"""
+        with self._lock:
+            self._latest = (captured_at, pose_frame)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.put(pose_frame)
+
+    def _idle_expired(self, stop: threading.Event) -> bool:
+        """購読者がいない状態が linger 秒続いたら stop を立てて True を返す。"""
+        with self._lock:
+            if self._subscribers or time.perf_counter() - self._idle_since < self.linger:
+                return False
+            stop.set()
+            return True
+
+    def _close_all(self) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.close()
+
+    # --- キャプチャスレッド ---
+    def _ensure_running(self) -> None:
+        with self._run_lock:
+            if self._thread is not None and self._thread.is_alive():
+                if not self._stop.is_set():
+                    return
+                # 停止処理中のスレッドがカメラを離すのを待ってから開き直す
+                self._thread.join()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name="pose-hub", daemon=True)
+            self._thread.start()
+
+    def _roi_stats(self) -> Dict[str, Any]:
+        """ROI 追跡の効果。推論面積の平均比率と、全体 / ROI それぞれの pose.process 時間の中央値。"""
+        if not self.roi:
+            return {"enabled": False}
+        areas = list(self._roi_area)
+        full = METRICS.histogram("pose_process.full").snapshot()
+        cropped = METRICS.histogram("pose_process.roi").snapshot()
+        saved = full["p50_ms"] - cropped["p50_ms"] if full["count"] and cropped["count"] else 0.0
+        return {
+            "enabled": True,
+            "area_ratio_avg": round(sum(areas) / len(areas), 3) if areas else 1.0,
+            "process_full_p50_ms": full["p50_ms"],
+            "process_roi_p50_ms": cropped["p50_ms"],
+            "saved_ms_per_frame": round(saved, 3),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """ステージごとの FPS・処理時間・フレーム年齢と、スロットで捨てたフレーム数。"""
+        return {
+            "subscribers": self.subscriber_count,
+            "stages": {name: st.snapshot() for name, st in self._stage_stats.items()},
+            "skipped": {
+                "inference": self._infer_slot.overwritten if self._infer_slot else 0,
+                "encode": self._encode_slot.overwritten if self._encode_slot else 0,
+            },
+        }
+
+    def _run(self, stop: threading.Event) -> None:
+        """キャプチャステージ。推論・エンコードのワーカーを起動し、自身は映像ソースを読み続ける。"""
+        opened_at = time.perf_counter()
+        try:
+            cap = self.source_factory()
+        except Exception as e:
+            print(f"PoseHub source error: {e}")
+            cap = None
+        if cap is None or not cap.is_opened():
+            if cap is not None:
+                cap.release()
+            print("Error: Camera not found.")
+            self.publish(json.dumps({"error": "Camera not found."}))
+            self._close_all()
+            return
+
+        METRICS.observe("source_open", time.perf_counter() - opened_at)
+        print("Camera opened (shared).")
+        self._stage_stats = {name: StageStats(name) for name in ("capture", "inference", "encode")}
+        infer_slot = self._infer_slot = LatestSlot()
+        encode_slot = self._encode_slot = LatestSlot()
+        failed = threading.Event()  # ワーカーが例外で止まったら立てる
+        workers = [
+            threading.Thread(target=self._inference_worker, args=(stop, failed, infer_slot, encode_slot), name="pose-hub-inference", daemon=True),
+            threading.Thread(target=self._encode_worker, args=(stop, failed, encode_slot), name="pose-hub-encode", daemon=True),
+        ]
+        for w in workers:
+            w.start()
+
+        capture_stats = self._stage_stats["capture"]
+        frame_id = 0
+        try:
+            while not stop.is_set() and cap.is_opened():
+                if self.linger > 0 and self._idle_expired(stop):
+                    break
+                started = time.perf_counter()
+                ret, image = cap.read()
+                if not ret:
+                    break
+                captured = time.perf_counter()
+                METRICS.observe("capture", captured - started)
+                METRICS.tick("fps.capture")
+                frame_id += 1
+                infer_slot.put(Frame(frame_id, captured, image))
+                capture_stats.record(captured, started, captured)
+        except Exception as e:
+            print(f"PoseHub capture error: {e}")
+        finally:
+            # unsubscribe 以外の理由（カメラ終了・ワーカー例外）で止まったか
+            unexpected = failed.is_set() or not stop.is_set()
+            stop.set()
+            infer_slot.close()
+            encode_slot.close()
+            for w in workers:
+                w.join()
+            cap.release()
+            with self._lock:
+                self._latest = None
+            print("Camera released (shared).")
+            if unexpected:
+                # カメラ側・ワーカー側の理由で止まった場合は購読者にも終了を伝える
+                self._close_all()
+
+    def _player_regions(self, width: int) -> List[Tuple[int, int]]:
+        """プレイヤーごとの担当範囲 (x0, x1)。2人対戦ではカメラ画像の左半分が P1、右半分が P2。"""
+        if self.players == 1:
+            return [(0, width)]
+        half = width // 2
+        return [(0, half), (half, width)]
+
+    def _inference_worker(self, stop: threading.Event, failed: threading.Event, infer_slot: LatestSlot, encode_slot: LatestSlot) -> None:
+        """推論ステージ。常に最新フレームだけを MediaPipe に通し、判定とスムージングを行う。
+
+        2人対戦モードでは左右の領域をプレイヤーごとの Pose インスタンスで同時に推論する
+        （P2 は別スレッド。MediaPipe の推論中は GIL が外れるので2コアで並列に進む）。
+        inference="process" のときは Pose を持たず、推論は pose_worker のワーカープロセスに任せる。
+        pose_pool があれば Pose はそこから借り、止まるときに返す。
+        """
+        import cv2
+
+        stats = self._stage_stats["inference"]
+        poses: List[Any] = []
+        workers: Optional[InferencePool] = None
+        # しきい値はプレイヤーごとのプロファイル（P1 / P2、無ければ default）からフレームごとに引く
+        stabilizers = [PoseStabilizer(self.stabilizer, profile=f"P{i + 1}") for i in range(self.players)]
+        executor = ThreadPoolExecutor(max_workers=self.players - 1, thread_name_prefix="pose-hub-player") if self.players > 1 else None
+
+        trackers = [RoiTracker() if self.roi else None for _ in range(self.players)]
+
+        def infer(player: int, image, captured_at: float) -> Tuple[Any, str]:
+            # ROI 追跡中は前フレームの人物の周りだけを推論する（座標は update で image 全体基準に戻る）
+            tracker = trackers[player]
+            h, w = image.shape[:2]
+            if tracker is not None:
+                x0, y0, x1, y1 = tracker.roi(w, h)
+                image = image[y0:y1, x0:x1]
+            process_started = time.perf_counter()
+            if workers is not None:
+                # 共有メモリ経由でワーカープロセスへ（cvtColor もワーカー側で行う）
+                with METRICS.timer("pose_process"):
+                    results = results_from_array(workers.infer(image))
+            else:
+                # MediaPipeでの処理（image は元フレームの一部を指すビュー。コピーは cvtColor の1回だけ）
+                with METRICS.timer("cvt_color"):
+                    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                rgb.flags.writeable = False
+                process_started = time.perf_counter()
+                with METRICS.timer("pose_process"):
+                    results = poses[player].process(rgb)
+            if tracker is not None:
+                cropped = image.shape[:2] != (h, w)
+                METRICS.observe("pose_process.roi" if cropped else "pose_process.full", time.perf_counter() - process_started)
+                METRICS.inc("roi.cropped_frames" if cropped else "roi.full_frames")
+                self._roi_area.append(tracker.update(results, w, h))
+            # ポーズ判定 + スムージング（キャプチャ時刻で測るので推論の待ち時間は遅延に含まれない）
+            return results, stabilizers[player].update_results(results, captured_at)
+
+        try:
+            if self.inference == "process":
+                workers = InferencePool(workers=self.inference_workers or self.players)
+            elif self.pose_pool is not None:
+                poses.extend(self.pose_pool.lease() for _ in range(self.players))
+            else:
+                import mediapipe as mp
+                poses.extend(mp.solutions.pose.Pose(model_complexity=1) for _ in range(self.players))
+            while not stop.is_set():
+                frame = infer_slot.take(timeout=0.5)
+                if frame is None:
+                    continue
+                started = time.perf_counter()
+                if workers is not None and not workers.started:
+                    workers.start(frame_bytes=frame.image.nbytes)
+
+                regions = self._player_regions(frame.image.shape[1])
+                futures = [executor.submit(infer, i, frame.image[:, x0:x1], frame.captured_at)
+                           for i, (x0, x1) in enumerate(regions) if i > 0]
+                try:
+                    outputs = [infer(0, frame.image[:, regions[0][0]:regions[0][1]], frame.captured_at)]
+                    outputs.extend(f.result() for f in futures)
+                except InferenceUnavailable:
+                    # ワーカープロセスの再起動中。このフレームは捨てる（WebSocket の接続はそのまま）
+                    for f in futures:
+                        f.exception()
+                    METRICS.inc("inference_skipped_frames")
+                    continue
+
+                # 記録（キューに入れるだけ。書き込みは記録スレッドが行う）。.plog は1人分の形式なので P1 のみ
+                if self._recorder is not None:
+                    landmarks = outputs[0][0].pose_landmarks
+                    self._recorder.record(
+                        frame.captured_at,
+                        landmarks_to_array(landmarks.landmark) if landmarks else None,
+                    )
+
+                stable = [pose for _, pose in outputs]
+                encode_slot.put((frame, regions, [results for results, _ in outputs], stable))
+                stats.record(frame.captured_at, started)
+                METRICS.tick("fps.inference")
+        except Exception as e:
+            print(f"PoseHub inference error: {e}")
+            failed.set()
+            stop.set()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            for pose in poses:
+                if self.pose_pool is not None:
+                    self.pose_pool.release(pose)
+                else:
+                    pose.close()
+            if workers is not None:
+                workers.close()
+
+    def _encode_worker(self, stop: threading.Event, failed: threading.Event, encode_slot: LatestSlot) -> None:
+        """エンコードステージ。骨格描画 → JPEG を行い、PoseFrame として全購読者へ配る。
+        次フレームの推論と並行して動くので、エンコード時間は推論の FPS に加算されない。
+        映像の購読者がいなければ描画と JPEG は飛ばし、骨格の購読者がいればランドマーク配列を付ける。"""
+        import cv2
+        import mediapipe as mp
+
+        mp_pose = mp.solutions.pose
+        mp_drawing = mp.solutions.drawing_utils
+        landmark_spec = mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2)
+        connection_spec = mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2)
+
+        stats = self._stage_stats["encode"]
+        try:
+            while not stop.is_set():
+                item = encode_slot.take(timeout=0.5)
+                if item is None:
+                    continue
+                frame, regions, player_results, stable = item
+                started = time.perf_counter()
+                streams = self._streams()
+
+                landmarks = None
+                if STREAM_SKELETON in streams:
+                    # 座標は各プレイヤーの領域基準なので、カメラ画像全体を 0〜1 とする座標に直す
+                    width = frame.image.shape[1]
+                    landmarks = []
+                    for (x0, x1), results in zip(regions, player_results):
+                        if not results.pose_landmarks:
+                            landmarks.append(None)
+                            continue
+                        arr = landmarks_to_array(results.pose_landmarks.landmark)
+                        if len(regions) > 1:
+                            arr[:, 0] = (x0 + arr[:, 0] * (x1 - x0)) / width
+                        landmarks.append(arr)
+
+                if STREAM_VIDEO not in streams:
+                    # 映像を見る購読者がいない（skeleton / preview=0 だけ）なら描画も JPEG 化もしない
+                    METRICS.inc("preview_skipped_frames")
+                    pose_frame = PoseFrame(stable[0], frame.frame_id, None,
+                                           p2_pose=stable[1] if len(stable) > 1 else None,
+                                           timestamp=wall_ms(frame.captured_at), landmarks=landmarks)
+                    self._publish_frame(pose_frame, frame.captured_at)
+                    stats.record(frame.captured_at, started)
+                    continue
+
+                # 骨格を描画した画像を作成（BGRの元フレームにそのまま描く。2人対戦では各自の領域に）
+                with METRICS.timer("draw"):
+                    for (x0, x1), results in zip(regions, player_results):
+                        if results.pose_landmarks:
+                            mp_drawing.draw_landmarks(
+                                frame.image[:, x0:x1],
+                                results.pose_landmarks,
+                                mp_pose.POSE_CONNECTIONS,
+                                landmark_spec,
+                                connection_spec
+                            )
+                    if len(regions) > 1:
+                        # P1/P2 の境界線
+                        x = regions[1][0]
+                        cv2.line(frame.image, (x, 0), (x, frame.image.shape[0] - 1), (255, 255, 255), 1)
+
+                # 既定品質の JPEG はここで1回だけ作っておく。別品質・縮小版が必要な購読者は
+                # PoseFrame のキャッシュ経由で設定ごとに1回だけエンコードする
+                pose_frame = PoseFrame(stable[0], frame.frame_id, frame.image,
+                                       p2_pose=stable[1] if len(stable) > 1 else None,
+                                       timestamp=wall_ms(frame.captured_at), landmarks=landmarks)
+                pose_frame.jpeg()
+                self._publish_frame(pose_frame, frame.captured_at)
+                stats.record(frame.captured_at, started)
+        except Exception as e:
+            print(f"PoseHub encode error: {e}")
+            failed.set()
+            stop.set()
@@ -0,0 +1,138 @@
+"""
+ウォームアップ済みの MediaPipe Pose インスタンスのプール
+
+Pose は作った直後の最初の process() でモデルの読み込みとグラフの初期化が走り、数百ms〜秒かかる。
+PoseHub は最初の購読者が来るたびに推論ステージを起動し直すので、以前は接続のたびにこの時間を
+払っていた。プロセス起動時にインスタンスを作ってダミー画像で1回推論しておき、推論ステージには
+それを貸し出す（返却されたものは次のセッションでそのまま使う）。
+
+使い方例:
+    pool = PosePool(size=2).start()       # 起動時に裏でウォームアップを始める
+    pose = pool.lease()                   # ウォームアップ中なら終わるのを待つ。空なら新しく作る
+    try:
+        results = pose.process(rgb)
+    finally:
+        pool.release(pose)
+
+- 返却時は人物のいない画像を1枚通して追跡状態を捨てる（前のセッションのランドマークを引きずらない）。
+- /metrics: pose_warmup（1インスタンスの作成+初回推論の時間）、pose_pool_cold（プールが空で
+  その場で作った回数）、gauges.pose_pool（待機中 / 貸出中の数）。
+- mediapipe の import もここ（ウォームアップのスレッド）で行うので、import 自体が起動を止めない。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+from metrics import METRICS
+
+# ウォームアップ・リセットに流す画像（人物なし）。推論するサイズはグラフの初期化に影響しない
+_BLANK_SHAPE = (256, 256, 3)
+
+
+def _default_factory(model_complexity: int) -> Callable[[], Any]:
+    def create():
+        import mediapipe as mp
+        return mp.solutions.pose.Pose(model_complexity=model_complexity)
+    return create
+
+
+class PosePool:
+    """ウォームアップ済みの Pose を size 個まで待機させ、推論ステージに貸し出す。"""
+
+    def __init__(self, size: int = 1, model_complexity: int = 1, factory: Optional[Callable[[], Any]] = None):
+        if size < 0:
+            raise ValueError("size must be >= 0")
+        self.size = size
+        # 省略時は mediapipe.solutions.pose.Pose(model_complexity=...)
+        self.factory = factory or _default_factory(model_complexity)
+        self._idle: List[Any] = []
+        self._leased = 0
+        self._warming = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._blank = np.zeros(_BLANK_SHAPE, dtype=np.uint8)
+        self._blank.flags.writeable = False
+        METRICS.gauge("pose_pool", lambda: {"idle": len(self._idle), "leased": self._leased, "warming": self._warming})
+
+    def start(self) -> "PosePool":
+        """裏のスレッドで size 個を作ってウォームアップする（呼び出し元はすぐ戻る）。"""
+        with self._cond:
+            if self._warming or self.size == 0:
+                return self
+            self._warming = True
+        threading.Thread(target=self._warm_up, name="pose-pool-warmup", daemon=True).start()
+        return self
+
+    def _create(self) -> Any:
+        started = time.perf_counter()
+        pose = self.factory()
+        pose.process(self._blank)
+        METRICS.observe("pose_warmup", time.perf_counter() - started)
+        return pose
+
+    def _warm_up(self) -> None:
+        try:
+            for _ in range(self.size):
+                with self._cond:
+                    if self._closed or len(self._idle) + self._leased >= self.size:
+                        break
+                pose = self._create()
+                with self._cond:
+                    if self._closed:
+                        pose.close()
+                        break
+                    self._idle.append(pose)
+                    self._cond.notify()
+        except Exception as e:
+            print(f"PosePool warm-up error: {e}")
+        finally:
+            with self._cond:
+                self._warming = False
+                self._cond.notify_all()
+
+    def lease(self, timeout: Optional[float] = None) -> Any:
+        """Pose を1つ借りる。ウォームアップ中なら待ち、待機中のものが無ければその場で作る。"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("PosePool is closed")
+            self._cond.wait_for(lambda: self._idle or not self._warming, timeout)
+            self._leased += 1
+            if self._idle:
+                return self._idle.pop()
+        try:
+            METRICS.inc("pose_pool_cold")
+            return self._create()
+        except BaseException:
+            with self._cond:
+                self._leased -= 1
+            raise
+
+    def release(self, pose: Any) -> None:
+        """借りた Pose を返す。追跡状態を捨ててから待機させる（size を超える分は閉じる）。"""
+        try:
+            pose.process(self._blank)
+        except Exception as e:
+            print(f"PosePool reset error: {e}")
+            pose.close()
+            pose = None
+        with self._cond:
+            self._leased -= 1
+            if pose is not None and not self._closed and len(self._idle) < self.size:
+                self._idle.append(pose)
+                self._cond.notify()
+                return
+        if pose is not None:
+            pose.close()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pose in idle:
+            pose.close()
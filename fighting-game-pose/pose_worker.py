@@ -0,0 +1,272 @@
+"""
+別プロセスでの MediaPipe 推論（共有メモリのフレームリング）
+
+pose.process と cvtColor を専用のワーカープロセスで実行し、サーバープロセスは入出力
+（キャプチャ・配信）だけを受け持つ。重い推論が Web サーバー側の GIL やイベントループを止めない。
+
+使い方例:
+    pool = InferencePool(workers=2)
+    pool.start(frame_bytes=480 * 640 * 3)
+    try:
+        landmarks = pool.infer(image)   # (33, 4) float32 / 人物なしなら None
+    except InferenceUnavailable:
+        pass                            # ワーカーが落ちた（自動で再起動される）。このフレームは捨てる
+    pool.close()
+
+- 画像は pickle せず、multiprocessing.shared_memory 上のリング（スロット数 = workers + 1）に
+  書き込み、ワーカーへは (ジョブ番号, スロット, 形状) だけを Pipe で渡す。
+  戻りはランドマーク配列（約 500byte）と推論時間だけ。
+- 1ワーカーは同時に1フレームだけ処理する。infer() はスレッドセーフで、空いているワーカーに
+  割り当てるので、2人対戦モードの P1/P2 はそれぞれ別のワーカーで並行に推論される。
+- ワーカーが落ちた・応答しなくなった場合は InferenceUnavailable を投げ、そのワーカーを
+  作り直す（inference_worker_restarts に数える）。WebSocket の接続はそのまま残る。
+- 起動方式は spawn（スレッドを持つ親プロセスを fork しない）。
+"""
+
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp_proc
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+from typing import List, Optional
+
+import numpy as np
+
+from metrics import METRICS
+
+
+class InferenceUnavailable(RuntimeError):
+    """ワーカーが落ちた・タイムアウトしたためにこのフレームの推論結果が無い。"""
+
+
+class FrameRing:
+    """共有メモリ上の固定サイズスロットの並び。スロット i は [i * slot_bytes, (i+1) * slot_bytes)。"""
+
+    def __init__(self, slots: int, slot_bytes: int, name: Optional[str] = None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+            self.owner = True
+        else:
+            # spawn した子は親と同じ resource_tracker を使うので、登録の解除は親の unlink に任せる
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def view(self, slot: int, shape) -> np.ndarray:
+        """スロットを指定形状の uint8 配列として見る（コピーしない）。使い終わったら参照を手放すこと。"""
+        nbytes = int(np.prod(shape))
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"frame of {nbytes} bytes does not fit slot of {self.slot_bytes} bytes")
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(shm_name: str, slots: int, slot_bytes: int, conn, model_complexity: int) -> None:
+    """ワーカープロセスの本体。タスク (job, slot, shape) を受け取り、(job, landmarks, 推論秒) を返す。"""
+    import cv2
+    import mediapipe as mp
+    from pose_logic import landmarks_to_array
+
+    ring = FrameRing(slots, slot_bytes, name=shm_name)
+    try:
+        with mp.solutions.pose.Pose(model_complexity=model_complexity) as pose:
+            conn.send(("ready", os.getpid()))
+            while True:
+                task = conn.recv()
+                if task is None:
+                    break
+                job, slot, shape = task
+                image = ring.view(slot, shape)
+                rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                del image  # 共有メモリへの参照はすぐ手放す（close 時の BufferError 防止）
+                rgb.flags.writeable = False
+                started = time.perf_counter()
+                results = pose.process(rgb)
+                elapsed = time.perf_counter() - started
+                landmarks = results.pose_landmarks
+                conn.send((job, landmarks_to_array(landmarks.landmark) if landmarks else None, elapsed))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        ring.close()
+
+
+class _Worker:
+    __slots__ = ("index", "process", "conn", "ready")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.ready = False
+
+
+class InferencePool:
+    """推論ワーカープロセスの集合。start() で共有メモリとプロセスを用意し、infer() で1フレーム推論する。"""
+
+    def __init__(self, workers: int = 1, model_complexity: int = 1,
+                 ready_timeout: float = 60.0, result_timeout: float = 5.0, restart_interval: float = 1.0):
+        self.workers = workers
+        self.model_complexity = model_complexity
+        self.ready_timeout = ready_timeout      # モデル読み込みを待つ時間
+        self.result_timeout = result_timeout    # 1フレームの応答を待つ時間（超えたらワーカーを作り直す）
+        self.restart_interval = restart_interval  # 起動直後に落ち続ける場合に再起動を詰めすぎない
+        self.restarts = 0
+        self._last_restart = 0.0
+        self._ctx = mp_proc.get_context("spawn")
+        self._ring: Optional[FrameRing] = None
+        self._workers: List[_Worker] = []
+        self._idle: List[_Worker] = []
+        self._free_slots: List[int] = []
+        self._cond = threading.Condition()
+        self._jobs = itertools.count(1)
+        self._next_slot = 0
+        self._closed = False
+
+    @property
+    def started(self) -> bool:
+        return self._ring is not None
+
+    def start(self, frame_bytes: int) -> None:
+        """frame_bytes は1フレームの最大バイト数（高さ×幅×3）。"""
+        slots = self.workers + 1
+        self._ring = FrameRing(slots, frame_bytes)
+        self._free_slots = list(range(slots))
+        self._workers = [_Worker(i) for i in range(self.workers)]
+        for worker in self._workers:
+            self._spawn(worker)
+        self._idle = list(self._workers)
+
+    def _spawn(self, worker: _Worker) -> None:
+        parent, child = self._ctx.Pipe()
+        ring = self._ring
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(ring.name, ring.slots, ring.slot_bytes, child, self.model_complexity),
+            name=f"pose-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child.close()
+        worker.conn = parent
+        worker.ready = False
+
+    def _restart(self, worker: _Worker) -> None:
+        self.restarts += 1
+        METRICS.inc("inference_worker_restarts")
+        print(f"Pose worker {worker.index} died; restarting.")
+        try:
+            worker.conn.close()
+        except OSError:
+            pass
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5.0)
+        wait = self._last_restart + self.restart_interval - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_restart = time.perf_counter()
+        self._spawn(worker)
+
+    def _wait_ready(self, worker: _Worker) -> None:
+        if worker.ready:
+            return
+        if not worker.conn.poll(self.ready_timeout):
+            raise TimeoutError("pose worker did not become ready")
+        worker.conn.recv()  # ("ready", pid)
+        worker.ready = True
+
+    def _acquire(self):
+        with self._cond:
+            while not self._closed and (not self._idle or not self._free_slots):
+                self._cond.wait()
+            if self._closed:
+                raise InferenceUnavailable("inference pool is closed")
+            worker = self._idle.pop()
+            # リングを順に回して使う（直前に書いたスロットをすぐには上書きしない）
+            free = sorted(self._free_slots, key=lambda s: (s - self._next_slot) % self._ring.slots)
+            slot = free[0]
+            self._free_slots.remove(slot)
+            self._next_slot = (slot + 1) % self._ring.slots
+            return worker, slot
+
+    def _release(self, worker: _Worker, slot: int) -> None:
+        with self._cond:
+            self._idle.append(worker)
+            self._free_slots.append(slot)
+            self._cond.notify()
+
+    def infer(self, image: np.ndarray) -> Optional[np.ndarray]:
+        """BGR 画像（ビューでもよい）を推論し、(33, 4) のランドマーク配列か None（人物なし）を返す。"""
+        worker, slot = self._acquire()
+        try:
+            try:
+                self._wait_ready(worker)
+                view = self._ring.view(slot, image.shape)
+                np.copyto(view, image)
+                del view
+                job = next(self._jobs)
+                worker.conn.send((job, slot, image.shape))
+                deadline = time.perf_counter() + self.result_timeout
+                while True:
+                    if worker.conn.poll(0.05):
+                        got, landmarks, elapsed = worker.conn.recv()
+                        if got == job:
+                            METRICS.observe("pose_worker.process", elapsed)
+                            return landmarks
+                        continue  # 前のジョブの遅れた応答は捨てる
+                    if not worker.process.is_alive() or time.perf_counter() > deadline:
+                        raise InferenceUnavailable(f"pose worker {worker.index} stopped responding")
+            except (EOFError, OSError, TimeoutError) as e:
+                raise InferenceUnavailable(str(e)) from e
+        except InferenceUnavailable:
+            if not self._closed:
+                self._restart(worker)
+            raise
+        finally:
+            self._release(worker, slot)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5.0)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.conn.close()
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+
+def results_from_array(landmarks: Optional[np.ndarray]):
+    """ランドマーク配列を MediaPipe の results と同じ形（.pose_landmarks.landmark）に戻す。
+    分類器・ROI 追跡・mp_drawing.draw_landmarks がそのまま使える。"""
+    if landmarks is None:
+        return SimpleNamespace(pose_landmarks=None)
+    from mediapipe.framework.formats import landmark_pb2
+
+    landmark_list = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in landmarks.tolist():
+        landmark_list.landmark.add(x=x, y=y, z=z, visibility=visibility)
+    return SimpleNamespace(pose_landmarks=landmark_list)
@@ -0,0 +1,170 @@
+"""
+プレビュー映像の適応ビットレート制御（クライアントごと）
+
+送信の詰まり具合（ws.send にかかった時間・購読キューの滞留/取りこぼし）と、
+クライアントが返す ack から測った往復時間 (RTT) を見て、
+  圧迫時: JPEG 品質 → 解像度 → 送信FPS の順に下げる
+  余裕時: 送信FPS → 解像度 → JPEG 品質 の順に戻す
+という AIMD 風の調整を行う。ポーズは常に毎フレーム送り、間引くのはプレビュー画像だけ。
+
+接続ごとの設定はクエリで渡す（すべて任意）:
+    /ws?mode=binary&q_min=30&q_max=80&scale_min=0.25&scale_max=1.0&fps=15
+
+RTT を測りたいクライアントは、プレビュー付きメッセージを受け取るたびに
+{"ack": <frame_id>} を送り返す（送らなくても送信時間だけで制御する）。
+"""
+
+from __future__ import annotations
+
+import collections
+import time
+from dataclasses import dataclass
+from typing import Mapping, Optional, Tuple
+
+from protocol import DEFAULT_JPEG_QUALITY
+
+# 品質・縮小率は段階に丸める。同じ段階の購読者同士で JPEG キャッシュを共有するため。
+QUALITY_STEP = 10
+SCALE_STEPS = (0.25, 0.5, 0.75, 1.0)
+
+
+@dataclass(frozen=True)
+class PreviewConfig:
+    # JPEG 品質の下限/上限（1〜100）
+    quality_min: int = 30
+    quality_max: int = DEFAULT_JPEG_QUALITY
+    # 解像度の縮小率の下限/上限（SCALE_STEPS に丸める）
+    scale_min: float = 0.25
+    scale_max: float = 1.0
+    # プレビューの目標FPS（上限）。カメラ側のFPSより大きくしても意味はない
+    target_fps: float = 15.0
+    # RTT がこれを超えたら圧迫とみなす [秒]
+    rtt_target: float = 0.15
+    # 余裕が何回続いたら1段上げるか
+    raise_after: int = 15
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> "PreviewConfig":
+        """クエリ引数から作る。不正な値は無視して既定値を使う。"""
+        def num(key: str, cast, default):
+            try:
+                return cast(args[key]) if key in args else default
+            except (TypeError, ValueError):
+                return default
+
+        d = cls()
+        q_min = min(max(num("q_min", int, d.quality_min), 1), 100)
+        q_max = min(max(num("q_max", int, d.quality_max), q_min), 100)
+        s_min = _snap_scale(num("scale_min", float, d.scale_min))
+        s_max = max(_snap_scale(num("scale_max", float, d.scale_max)), s_min)
+        fps = max(num("fps", float, d.target_fps), 0.5)
+        return cls(quality_min=q_min, quality_max=q_max, scale_min=s_min, scale_max=s_max, target_fps=fps)
+
+
+def _snap_scale(value: float) -> float:
+    for step in SCALE_STEPS:
+        if value <= step:
+            return step
+    return SCALE_STEPS[-1]
+
+
+class PreviewController:
+    """1接続分のプレビュー制御。送信ループのスレッドからだけ呼ぶ前提（ロック無し）。"""
+
+    def __init__(self, config: Optional[PreviewConfig] = None):
+        self.config = config or PreviewConfig()
+        c = self.config
+        self.quality = c.quality_max
+        self.scale = _snap_scale(c.scale_max)
+        self.fps = c.target_fps
+        self._calm = 0                  # 連続で余裕があった回数
+        self._last_preview_at = 0.0
+        self._last_dropped = 0
+        self._pressure = False          # 次の送信判断までに観測した圧迫
+        self._sent_at = collections.OrderedDict()  # frame_id -> 送信時刻（ack 待ち）
+        self.send_time = 0.0            # ws.send にかかった時間の指数移動平均 [秒]
+        self.rtt: Optional[float] = None
+        self.previews_sent = 0
+        self.previews_skipped = 0
+
+    @property
+    def level(self) -> Tuple[int, float]:
+        """現在の (JPEG品質, 縮小率)。"""
+        return self.quality, self.scale
+
+    # --- 観測 ---
+    def observe_backlog(self, pending: int, dropped: int) -> None:
+        """購読キューの滞留数と累計取りこぼし数。どちらかが増えていれば送信が追いついていない。"""
+        if pending > 0 or dropped > self._last_dropped:
+            self._pressure = True
+        self._last_dropped = dropped
+
+    def observe_send(self, seconds: float, frame_id: Optional[int] = None, now: Optional[float] = None) -> None:
+        """ws.send にかかった時間。frame_id を渡すとプレビュー送信として ack 待ちに登録する。"""
+        self.send_time = seconds if self.send_time == 0.0 else 0.8 * self.send_time + 0.2 * seconds
+        # 1フレームの持ち時間の半分以上を送信でブロックしていたら圧迫
+        if seconds > 0.5 / max(self.config.target_fps, 1.0):
+            self._pressure = True
+        if frame_id is not None:
+            self._sent_at[frame_id] = time.perf_counter() if now is None else now
+            while len(self._sent_at) > 64:
+                self._sent_at.popitem(last=False)
+
+    def observe_ack(self, frame_id: int, now: Optional[float] = None) -> None:
+        sent_at = self._sent_at.pop(frame_id, None)
+        if sent_at is None:
+            return
+        rtt = (time.perf_counter() if now is None else now) - sent_at
+        self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+        if rtt > self.config.rtt_target:
+            self._pressure = True
+
+    # --- 判断 ---
+    def should_send_preview(self, now: Optional[float] = None) -> bool:
+        """このフレームにプレビューを付けるか。呼ぶたびに直前までの観測で段階を調整する。"""
+        if now is None:
+            now = time.perf_counter()
+        self._adjust()
+        if now - self._last_preview_at < 1.0 / self.fps:
+            self.previews_skipped += 1
+            return False
+        self._last_preview_at = now
+        self.previews_sent += 1
+        return True
+
+    def _adjust(self) -> None:
+        c = self.config
+        if self._pressure:
+            self._pressure = False
+            self._calm = 0
+            # 品質 → 解像度 → FPS の順に下げる
+            if self.quality > c.quality_min:
+                self.quality = max(c.quality_min, self.quality - QUALITY_STEP)
+            elif self.scale > c.scale_min:
+                self.scale = SCALE_STEPS[max(SCALE_STEPS.index(self.scale) - 1, 0)]
+            else:
+                self.fps = max(self.fps / 2, 0.5)
+            return
+
+        self._calm += 1
+        if self._calm < c.raise_after:
+            return
+        self._calm = 0
+        # FPS → 解像度 → 品質 の順に戻す
+        if self.fps < c.target_fps:
+            self.fps = min(self.fps * 2, c.target_fps)
+        elif self.scale < c.scale_max:
+            self.scale = SCALE_STEPS[SCALE_STEPS.index(self.scale) + 1]
+        elif self.quality < c.quality_max:
+            self.quality = min(c.quality_max, self.quality + QUALITY_STEP)
+
+    def snapshot(self) -> dict:
+        return {
+            "quality": self.quality,
+            "scale": self.scale,
+            "fps": round(self.fps, 2),
+            "send_ms": round(self.send_time * 1000.0, 2),
+            "rtt_ms": None if self.rtt is None else round(self.rtt * 1000.0, 2),
+            "previews_sent": self.previews_sent,
+            "previews_skipped": self.previews_skipped,
+        }
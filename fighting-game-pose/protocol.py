@@ -0,0 +1,264 @@
+"""
+WebSocket 送信フォーマット
+
+接続時のクエリ ?mode=... でクライアントごとに選ぶ。
+
+- "json"（既定・従来互換）: {"pose": ..., "image": <Base64 JPEG>} をテキストで送る。
+  2人対戦モード (PoseHub(players=2)) では "pose" の代わりに "p1_pose" / "p2_pose" を送る
+  （例: {"p1_pose": "PUNCH", "p2_pose": "IDLE", "frame_id": 123}）。binary のヘッダも同様。
+- "binary": 1メッセージ = [ヘッダ長 (4byte, big endian)] + [ヘッダ JSON (UTF-8)] + [JPEG 生バイト]
+  をバイナリで送る。Base64 の約33%の膨張と、大きな文字列の JSON エスケープが無くなる。
+  ヘッダ例: {"pose": "PUNCH", "frame_id": 123, "image_size": 34567}
+
+- "msgpack" / "packed": wire_codec.py のコーデック。?mode= の代わりにサブプロトコル
+  （new WebSocket(url, ["gafa.packed", "gafa.json"])）か ?codec= で選ぶ。選ばれればそちらが優先。
+  msgpack は json と同じ dict（画像は Base64 にせず bin）、packed はポーズ 1 バイト + frame_id /
+  timestamp 固定幅のヘッダ 20 バイト + JPEG。どちらもバイナリで送る。
+
+ブラウザ側の受け取り例 (binary):
+    socket.binaryType = 'arraybuffer';
+    const view = new DataView(event.data);
+    const headerLen = view.getUint32(0);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(event.data, 4, headerLen)));
+    const jpeg = new Blob([new Uint8Array(event.data, 4 + headerLen)], {type: 'image/jpeg'});
+
+プレビューを間引いたフレームは画像なし（json は "image" キー無し、binary は image_size=0）で、
+ポーズだけを即座に送る。
+
+映像が要らないクライアントは ?stream=skeleton で、プレビュー画像の代わりに 33 点のランドマークを
+量子化バイナリ（landmark_codec.py、1人 266 バイト。座標はカメラ画像全体を 0〜1 とした値）で受け取り、
+骨格は自分で描く。全員が skeleton（または ?preview=0）なら、サーバーは骨格の描画も JPEG 化も行わない。
+- json / msgpack: "landmarks"（2人対戦は "p1_landmarks" / "p2_landmarks"）。json は Base64、msgpack は bin。
+- binary: ヘッダに "landmarks_size"（バイト数）、ヘッダの後ろに JPEG の代わりにランドマークを人数分。
+- packed: タグ 0x09 / 0x0A（wire_codec.py）。
+送る間隔はプレビューと同じ（?fps= の上限と、詰まったときの間引き）。人物がいないプレイヤーは 2 バイト。
+
+どのメッセージにも frame_id（キャプチャの通し番号）、timestamp（キャプチャ時刻、エポックミリ秒）、
+seq（接続ごとの送信通し番号、1 始まり）が付く。seq が飛べば取りこぼし、戻れば順序の入れ替わり。
+
+送信タイミングは ?updates=... で選ぶ。
+- "frame"（既定・従来互換）: 毎フレーム送る。
+- "change": 確定ポーズが変わったときだけ {"type": "pose_update", ...} を送り、変化が無い間は
+  ?heartbeat=<秒>（既定 1.0）ごとに現在のポーズを {"type": "heartbeat", ...} で送る。
+  プレビュー付きのフレームは pose_update として送る（?preview=0 でプレビュー自体を止められる）。
+
+エラーはどちらのモードでも {"error": ...} のテキストメッセージで送る。
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import struct
+import threading
+from typing import List, Optional
+
+from landmark_codec import encode_landmarks
+from metrics import METRICS
+from wire_codec import CODEC_JSON, CODEC_MSGPACK, CODEC_PACKED, encode, negotiate
+from wire_codec import with_seq as codec_with_seq
+
+MODE_JSON = "json"
+MODE_BINARY = "binary"
+MODE_MSGPACK = CODEC_MSGPACK
+MODE_PACKED = CODEC_PACKED
+MODES = (MODE_JSON, MODE_BINARY)
+
+STREAM_VIDEO = "video"
+STREAM_SKELETON = "skeleton"
+STREAMS = (STREAM_VIDEO, STREAM_SKELETON)
+
+UPDATES_FRAME = "frame"
+UPDATES_CHANGE = "change"
+UPDATES = (UPDATES_FRAME, UPDATES_CHANGE)
+DEFAULT_HEARTBEAT_SECONDS = 1.0
+
+KIND_POSE_UPDATE = "pose_update"
+KIND_HEARTBEAT = "heartbeat"
+
+_HEADER_LEN = struct.Struct(">I")
+
+
+def parse_mode(value: Optional[str]) -> str:
+    """クエリ文字列の mode を正規化する。未指定・不明なら従来互換の "json"。"""
+    if value and value.lower() in MODES:
+        return value.lower()
+    return MODE_JSON
+
+
+def select_mode(mode: Optional[str], subprotocol: Optional[str] = None, codec: Optional[str] = None) -> str:
+    """接続の送信フォーマット。サブプロトコル / ?codec= でコーデックが選ばれていればそれ、無ければ ?mode=。"""
+    selected = negotiate(subprotocol, codec)
+    return selected if selected != CODEC_JSON else parse_mode(mode)
+
+
+def parse_stream(value: Optional[str]) -> str:
+    """クエリ文字列の stream を正規化する。未指定・不明なら従来互換の "video"。"""
+    if value and value.lower() in STREAMS:
+        return value.lower()
+    return STREAM_VIDEO
+
+
+def parse_updates(value: Optional[str]) -> str:
+    """クエリ文字列の updates を正規化する。未指定・不明なら従来互換の "frame"。"""
+    if value and value.lower() in UPDATES:
+        return value.lower()
+    return UPDATES_FRAME
+
+
+def with_seq(message, seq: int):
+    """エンコード済みメッセージに接続ごとの seq を足す。
+
+    本体はフレーム単位で共有キャッシュしているので、末尾の "}" の直前に差し込むだけにする
+    （画像部分を作り直さない）。binary はヘッダ JSON だけを組み直す。"""
+    if isinstance(message, str):
+        return f'{message[:-1]}, "seq": {seq}}}'
+    if message[0] != 0:
+        # msgpack / packed（binary のヘッダ長の先頭バイトは常に 0）
+        return codec_with_seq(message, seq)
+    (header_len,) = _HEADER_LEN.unpack_from(message, 0)
+    start = _HEADER_LEN.size
+    header = b"%s,\"seq\":%d}" % (message[start:start + header_len - 1], seq)
+    return b"".join((_HEADER_LEN.pack(len(header)), header, memoryview(message)[start + header_len:]))
+
+
+# JPEG の既定品質（cv2 の既定 95 より軽くする）。preview.PreviewConfig の上限の既定値も同じ。
+DEFAULT_JPEG_QUALITY = 80
+
+
+class PoseFrame:
+    """1フレーム分の配信内容。
+
+    image は骨格描画済みの BGR 画像（映像を見る購読者がいなければ None）。JPEG は (品質, 縮小率) ごとに、
+    送信メッセージは (モード, 品質, 縮小率, 画像有無, 種別) ごとに最初の1回だけ作り、同じ設定の購読者で使い回す。
+    landmarks はプレイヤーごとの (33, 4) 配列（人物なしは None。?stream=skeleton の購読者がいるときだけ入る）。
+    timestamp はキャプチャ時刻（エポックミリ秒）。
+    """
+
+    def __init__(self, pose: str, frame_id: int, image=None, p2_pose: Optional[str] = None,
+                 timestamp: Optional[int] = None, landmarks: Optional[list] = None):
+        self.pose = pose
+        # 2人対戦モードのときだけ P2 のポーズが入る（pose は P1 のポーズ）
+        self.p2_pose = p2_pose
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.image = image
+        self.landmarks = landmarks
+        self._skeleton: Optional[List[bytes]] = None
+        self._lock = threading.Lock()
+        self._jpeg_locks = {}
+        self._jpeg = {}
+        self._encoded = {}
+
+    def jpeg(self, quality: int = DEFAULT_JPEG_QUALITY, scale: float = 1.0) -> bytes:
+        """指定の品質・縮小率で JPEG 化したバイト列（キャッシュ付き）。画像が無ければ b""。"""
+        if self.image is None:
+            return b""
+        key = (quality, scale)
+        cached = self._jpeg.get(key)
+        if cached is not None:
+            return cached
+        # 設定ごとにロックを分け、別の品質を要求する購読者同士は並行してエンコードできるようにする
+        with self._lock:
+            key_lock = self._jpeg_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            cached = self._jpeg.get(key)
+            if cached is None:
+                import cv2
+                image = self.image
+                if scale < 1.0:
+                    h, w = image.shape[:2]
+                    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+                    image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+                with METRICS.timer("jpeg_encode"):
+                    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+                cached = buffer.tobytes()
+                self._jpeg[key] = cached
+        return cached
+
+    def has_preview(self, skeleton: bool = False) -> bool:
+        """プレビュー（skeleton=True ならランドマーク、False なら画像）を持っているか。"""
+        return (self.landmarks if skeleton else self.image) is not None
+
+    def skeleton(self) -> List[bytes]:
+        """プレイヤーごとの量子化ランドマーク（landmark_codec.py、キャッシュ付き）。"""
+        if self._skeleton is None:
+            self._skeleton = [encode_landmarks(landmarks) for landmarks in self.landmarks or ()]
+        return self._skeleton
+
+    def encode(self, mode: str, quality: int = DEFAULT_JPEG_QUALITY, scale: float = 1.0, with_image: bool = True,
+               kind: Optional[str] = None, seq: Optional[int] = None, skeleton: bool = False):
+        """mode に応じて str（テキスト）または bytes（バイナリ）を返す。
+        with_image=False ならプレビューを付けずポーズだけの小さなメッセージになる。
+        skeleton=True ならプレビューは画像の代わりに量子化ランドマーク（?stream=skeleton）。
+        kind を渡すと "type" に入る（pose_update / heartbeat）。seq は接続ごとの通し番号。"""
+        with_image = with_image and self.has_preview(skeleton)
+        if not with_image:
+            key = (mode, None, None, False, kind)
+        elif skeleton:
+            key = (mode, None, None, STREAM_SKELETON, kind)
+        else:
+            key = (mode, quality, scale, True, kind)
+        cached = self._encoded.get(key)
+        if cached is None:
+            jpeg = self.jpeg(quality, scale) if with_image and not skeleton else b""
+            if with_image and skeleton:
+                cached = self._encode_skeleton(mode, kind)
+            elif mode == MODE_BINARY:
+                cached = self._encode_binary(jpeg, kind)
+            elif mode in (MODE_MSGPACK, MODE_PACKED):
+                cached = encode(self._header(kind), mode, jpeg)
+            else:
+                cached = self._encode_json(jpeg if with_image else None, kind)
+            self._encoded[key] = cached
+        return cached if seq is None else with_seq(cached, seq)
+
+    def _header(self, kind: Optional[str]) -> dict:
+        header = {"type": kind} if kind else {}
+        if self.p2_pose is None:
+            header["pose"] = self.pose
+        else:
+            header["p1_pose"] = self.pose
+            header["p2_pose"] = self.p2_pose
+        header["frame_id"] = self.frame_id
+        if self.timestamp is not None:
+            header["timestamp"] = self.timestamp
+        return header
+
+    def _encode_skeleton(self, mode: str, kind: Optional[str] = None):
+        frames = self.skeleton()
+        keys = ("landmarks",) if self.p2_pose is None else ("p1_landmarks", "p2_landmarks")
+        if mode == MODE_BINARY:
+            body = b"".join(frames)
+            header = json.dumps(
+                {**self._header(kind), "image_size": 0, "landmarks_size": len(body)},
+                separators=(",", ":"),
+            ).encode("utf-8")
+            return b"".join((_HEADER_LEN.pack(len(header)), header, body))
+        if mode in (MODE_MSGPACK, MODE_PACKED):
+            return encode({**self._header(kind), **dict(zip(keys, frames))}, mode)
+        payload = self._header(kind)
+        for key, frame in zip(keys, frames):
+            payload[key] = base64.b64encode(frame).decode('utf-8')
+        return json.dumps(payload)
+
+    def _encode_json(self, jpeg: Optional[bytes], kind: Optional[str] = None) -> str:
+        payload = self._header(kind)
+        if jpeg is not None:
+            payload["image"] = base64.b64encode(jpeg).decode('utf-8')
+        return json.dumps(payload)
+
+    def _encode_binary(self, jpeg: bytes, kind: Optional[str] = None) -> bytes:
+        header = json.dumps(
+            {**self._header(kind), "image_size": len(jpeg)},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        return b"".join((_HEADER_LEN.pack(len(header)), header, jpeg))
+
+
+def decode_binary(message: bytes):
+    """バイナリメッセージを (header dict, jpeg bytes) に戻す。テストやツール用。"""
+    (header_len,) = _HEADER_LEN.unpack_from(message, 0)
+    start = _HEADER_LEN.size
+    header = json.loads(message[start:start + header_len].decode("utf-8"))
+    return header, message[start + header_len:]
@@ -0,0 +1,118 @@
+"""
+ROI（注目領域）トラッキング
+
+前フレームのランドマークから人物の周り（+ 余白）だけを切り出して pose.process に渡し、
+推論入力を小さくする。結果のランドマークは元の画像（2人対戦ならプレイヤーの担当領域）の
+正規化座標に戻すので、pose_logic の分類器や骨格描画から見た座標は全体を推論した場合と同じ。
+
+使い方例:
+    tracker = RoiTracker()
+    x0, y0, x1, y1 = tracker.roi(width, height)
+    results = pose.process(rgb[y0:y1, x0:x1])
+    tracker.update(results, width, height)   # 座標を全体基準に戻し、次フレームの ROI を決める
+
+- ランドマークが無い・肩と腰の visibility が低いときは追跡を解除し、次フレームは全体を推論する。
+- MediaPipe は内部でフレーム間のトラッキングと平滑化を行うので、切り出し位置が毎フレーム
+  動くと不利になる。ROI は align ピクセル単位に揃え、人物が枠の端に近づいたときか
+  枠が大きすぎるときだけ更新する（ヒステリシス）。
+- ROI が全体の max_area_ratio 以上になるなら切り出さずに全体を使う。
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+from pose_logic import PL
+
+Box = Tuple[int, int, int, int]
+
+# 追跡の継続判定に使う胴体のランドマーク（肩と腰）
+_TORSO = (PL.LEFT_SHOULDER, PL.RIGHT_SHOULDER, PL.LEFT_HIP, PL.RIGHT_HIP)
+
+
+class RoiTracker:
+    """1人分の ROI を管理する。roi() で今回の切り出し範囲、update() で結果の座標変換と次回の更新。"""
+
+    def __init__(self, margin: float = 0.3, min_visibility: float = 0.5, point_visibility: float = 0.3,
+                 edge: float = 0.1, align: int = 16, max_area_ratio: float = 0.8):
+        self.margin = margin                    # 人物の大きさに対する余白の割合
+        self.min_visibility = min_visibility    # 胴体の平均 visibility がこれ未満なら追跡解除
+        self.point_visibility = point_visibility  # 枠の計算に使うランドマークの最低 visibility
+        self.edge = edge                        # 枠の端からこの割合以内に入ったら枠を更新
+        self.align = align
+        self.max_area_ratio = max_area_ratio
+        self._box: Optional[Box] = None         # None は全体
+        self._last: Box = (0, 0, 0, 0)          # 直近の roi() が返した範囲（update で使う）
+
+    @property
+    def tracking(self) -> bool:
+        return self._box is not None
+
+    def reset(self) -> None:
+        self._box = None
+
+    def roi(self, width: int, height: int) -> Box:
+        """今回 pose.process に渡す範囲 (x0, y0, x1, y1)。追跡していなければ全体。"""
+        box = self._box
+        if box is None or box[2] > width or box[3] > height:
+            box = (0, 0, width, height)
+        self._last = box
+        return box
+
+    def update(self, results, width: int, height: int) -> float:
+        """results のランドマークを全体の正規化座標に書き換え、次フレームの ROI を決める。
+        今回推論した面積の全体比（1.0 = 全体）を返す。"""
+        x0, y0, x1, y1 = self._last
+        cw, ch = x1 - x0, y1 - y0
+        area_ratio = (cw * ch) / float(width * height) if width and height else 1.0
+
+        landmarks = getattr(results, "pose_landmarks", None)
+        if not landmarks:
+            self._box = None
+            return area_ratio
+        points = landmarks.landmark
+        if (cw, ch) != (width, height):
+            sx, sy = cw / width, ch / height
+            ox, oy = x0 / width, y0 / height
+            for p in points:
+                p.x = ox + p.x * sx
+                p.y = oy + p.y * sy
+                p.z = p.z * sx  # z は切り出し画像の幅を基準にしたスケールなので x と同じく縮める
+
+        torso = [points[i].visibility for i in _TORSO]
+        if sum(torso) / len(torso) < self.min_visibility:
+            self._box = None
+            return area_ratio
+        self._box = self._next_box(points, width, height)
+        return area_ratio
+
+    def _next_box(self, points, width: int, height: int) -> Optional[Box]:
+        xs = [p.x for p in points if p.visibility >= self.point_visibility]
+        ys = [p.y for p in points if p.visibility >= self.point_visibility]
+        if not xs:
+            return None
+        bx0, bx1 = min(xs) * width, max(xs) * width
+        by0, by1 = min(ys) * height, max(ys) * height
+        size = max(bx1 - bx0, by1 - by0)
+
+        current = self._box
+        if current is not None:
+            # 人物が枠の内側（端から edge 以上離れている）に収まっていて、枠が大きすぎなければ据え置く
+            cx0, cy0, cx1, cy1 = current
+            ex, ey = (cx1 - cx0) * self.edge, (cy1 - cy0) * self.edge
+            inside = bx0 >= cx0 + ex and bx1 <= cx1 - ex and by0 >= cy0 + ey and by1 <= cy1 - ey
+            loose = (cx1 - cx0) * (cy1 - cy0) > 2.5 * (size * (1 + 2 * self.margin)) ** 2
+            if inside and not loose:
+                return current
+
+        pad = size * self.margin
+        a = self.align
+        nx0 = max(0, int((bx0 - pad) // a * a))
+        ny0 = max(0, int((by0 - pad) // a * a))
+        nx1 = min(width, int(-(-(bx1 + pad) // a) * a))
+        ny1 = min(height, int(-(-(by1 + pad) // a) * a))
+        if nx1 - nx0 < a or ny1 - ny0 < a:
+            return None
+        if (nx1 - nx0) * (ny1 - ny0) >= self.max_area_ratio * width * height:
+            return None
+        return (nx0, ny0, nx1, ny1)
@@ -1,26 +1,86 @@
 # server.py
 
-import cv2
-import mediapipe as mp
-import json
-import base64 # ★ 画像エンコードのために追加
-from flask import Flask, send_from_directory
+import os
+import time
+from flask import Flask, jsonify, request, send_from_directory
 from flask_sock import Sock
-from pose_logic import classify_pose_from_results
+from metrics import METRICS
+from pose_hub import PoseHub
+from pose_logic import PROFILES
+from pose_pool import PosePool
+from preview import PreviewConfig, PreviewController
+from protocol import (DEFAULT_HEARTBEAT_SECONDS, KIND_HEARTBEAT, KIND_POSE_UPDATE, STREAM_SKELETON, UPDATES_CHANGE,
+                      PoseFrame, parse_stream, parse_updates, select_mode)
+from stabilizer import StabilizerConfig
+from video_source import source_from_env
+from wire_codec import SUBPROTOCOLS, decode
 
 # --- Flask & WebSocket 設定 ---
 app = Flask(__name__)
+# new WebSocket(url, ["gafa.packed", ...]) で希望されたコーデックを受ける（wire_codec.py）
+app.config['SOCK_SERVER_OPTIONS'] = {'subprotocols': SUBPROTOCOLS}
 sock = Sock(app)
 
-# --- MediaPipe 設定 ---
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils # ★ 描画ユーティリティを追加
-SMOOTHING_STREAK = 3
+# --- 共有キャプチャ設定 ---
+# カメラと MediaPipe はプロセスで1つだけ持ち、全接続にブロードキャストする
+# 確定ポーズの安定化は POSE_HOLD_MS / POSE_ATTACK_HOLD_MS / POSE_FILTER で調整する（stabilizer.py）
+STABILIZER = StabilizerConfig.from_env()
+# POSE_RECORD=session.plog を指定するとランドマークを記録する（リプレイは landmark_log.py）
+# 映像ソースは POSE_SOURCE で切り替える（既定 camera:0。file:<path> / synthetic、video_source.py 参照）
+#   例: POSE_SOURCE=file:match.mp4 POSE_SOURCE_PACING=max POSE_SOURCE_LOOP=1 python server.py
+# POSE_PLAYERS=2 で2人対戦モード（画面の左半分が P1、右半分が P2。{"p1_pose", "p2_pose"} を送る）
+# POSE_ROI=1 で前フレームの人物の周りだけを推論する（節約量は /metrics の gauges.roi）
+# POSE_INFERENCE=process で MediaPipe を別プロセスで動かす（ワーカー数は POSE_INFER_WORKERS、既定はプレイヤー数）
+# POSE_THRESHOLDS=thresholds.json でしきい値をファイルから読み、保存のたびに読み直す（/thresholds でも変更可）
+# MediaPipe Pose はプロセス起動時に POSE_POOL 個（既定はプレイヤー数）作ってウォームアップしておき、
+# 接続のたびにモデルの読み込みを払わない（pose_pool.py。process 推論ではワーカー側で持つので 0）
+# POSE_HUB_LINGER 秒（既定 5）は最後の接続が切れてもカメラを開いたままにし、再接続をすぐ返す
+# 接続から最初のポーズを送るまでの時間は /metrics の time_to_first_pose
+if os.environ.get("POSE_THRESHOLDS"):
+    PROFILES.watch(os.environ["POSE_THRESHOLDS"])
+PLAYERS = int(os.environ.get("POSE_PLAYERS", "1"))
+INFERENCE = os.environ.get("POSE_INFERENCE", "thread")
+POSE_POOL = PosePool(size=int(os.environ.get("POSE_POOL", PLAYERS if INFERENCE == "thread" else 0))).start()
+hub = PoseHub(stabilizer=STABILIZER, record_path=os.environ.get("POSE_RECORD"),
+              source_factory=source_from_env, players=PLAYERS,
+              roi=os.environ.get("POSE_ROI", "0") == "1",
+              inference=INFERENCE,
+              inference_workers=int(os.environ["POSE_INFER_WORKERS"]) if os.environ.get("POSE_INFER_WORKERS") else None,
+              pose_pool=POSE_POOL, linger=float(os.environ.get("POSE_HUB_LINGER", "5")))
 
 @app.route('/')
 def index():
     return send_from_directory('.', 'index.html')
 
+@app.route('/metrics')
+def metrics():
+    # ステージ別レイテンシ(p50/p95/p99)・FPS・ドロップ数・接続数。POSE_METRICS=0 で無効
+    return jsonify({**METRICS.snapshot(), "pipeline": hub.stats()})
+
+@app.route('/thresholds', methods=['GET', 'POST'])
+def thresholds():
+    """しきい値のプロファイルを見る / 変える。カメラや MediaPipe は止めず、次のフレームから反映される。
+
+    POST {"profile": "P2", "values": {"guard_elbow_angle_max": 110}}  # 差分を更新（"replace": true で置き換え）
+    POST {"reload": true}                                             # POSE_THRESHOLDS のファイルを読み直す
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            if body.get("reload"):
+                if PROFILES.path is None:
+                    raise ValueError("no thresholds file (set POSE_THRESHOLDS)")
+                PROFILES.load(PROFILES.path)
+            else:
+                values = body.get("values")
+                if not isinstance(values, dict):
+                    raise ValueError('expected {"profile": ..., "values": {...}}')
+                PROFILES.set(body.get("profile") or "default", values, replace=bool(body.get("replace")))
+        except (OSError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+        METRICS.inc("threshold_updates")
+    return jsonify(PROFILES.snapshot())
+
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     return send_from_directory('js', filename)
@@ -31,81 +91,96 @@ def serve_root_files(filename):
 
 @sock.route('/ws')
 def pose_websocket(ws):
-    print("WebSocket connected!")
-
-    cap = cv2.VideoCapture(0) # カメラに合わせてこの数字は変更してください
-    if not cap.isOpened():
-        print("Error: Camera not found.")
-        ws.send(json.dumps({"error": "Camera not found."}))
-        return
-
-    with mp_pose.Pose(model_complexity=1) as pose:
-        stable_pose_name = "IDLE"
-        candidate_pose = None
-        candidate_count = 0
-
-        try:
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
+    # 送信フォーマットは接続時に選ぶ: /ws（従来のJSON+Base64）or /ws?mode=binary
+    # サブプロトコル gafa.msgpack / gafa.packed（または ?codec=）ならそちら（protocol.py 参照）
+    mode = select_mode(request.args.get("mode"), ws.subprotocol, request.args.get("codec"))
+    # プレビューの品質/解像度/FPS の上下限もクエリで指定できる（preview.py 参照）
+    preview = PreviewController(PreviewConfig.from_args(request.args))
+    show_preview = request.args.get("preview", "1") != "0"
+    # ?stream=skeleton でプレビューを JPEG ではなくランドマークで受け取り、骨格はブラウザが描く
+    stream = parse_stream(request.args.get("stream"))
+    skeleton = stream == STREAM_SKELETON
+    # ?updates=change でポーズが変わったときだけ送り、間はハートビートだけにする（protocol.py 参照）
+    changes_only = parse_updates(request.args.get("updates")) == UPDATES_CHANGE
+    try:
+        heartbeat = max(float(request.args.get("heartbeat", DEFAULT_HEARTBEAT_SECONDS)), 0.1)
+    except ValueError:
+        heartbeat = DEFAULT_HEARTBEAT_SECONDS
+    print(f"WebSocket connected! (mode={mode}, stream={stream}, changes_only={changes_only}, preview={preview.config})")
+
+    connected_at = time.perf_counter()
+    sub = hub.subscribe(stream if show_preview else None)
+    seq = 0
+    last_poses = None
+    last_frame = None
+    last_sent_at = time.perf_counter()
+    try:
+        while True:
+            message = sub.get(timeout=min(1.0, heartbeat))
+            if message is None:
+                if sub.closed:
                     break
-
-                # MediaPipeでの処理
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                rgb.flags.writeable = False #この画像データは変更しません、と一時的に伝えて処理を早くする
-                results = pose.process(rgb) #骨格情報をresultに抽出する
-                rgb.flags.writeable = True # 元に戻す
-
-                # ポーズ判定
-                pose_raw = classify_pose_from_results(results)
-
-                # スムージング処理
-                if pose_raw == stable_pose_name:
-                    candidate_pose = None
-                    candidate_count = 0
+                # フレームが来なくてもハートビートは続ける（timestamp が古いままなのでキャプチャの停止が分かる）
+                if changes_only and last_frame is not None and time.perf_counter() - last_sent_at >= heartbeat:
+                    seq += 1
+                    _send(ws, last_frame.encode(mode, with_image=False, kind=KIND_HEARTBEAT, seq=seq))
+                    last_sent_at = time.perf_counter()
+                continue
+            if not isinstance(message, PoseFrame):
+                ws.send(message)
+                continue
+
+            # 送信が詰まっていればプレビューを落としてポーズだけ送る（ポーズは遅らせない）
+            preview.observe_backlog(sub.pending, sub.dropped)
+            with_image = show_preview and message.has_preview(skeleton) and preview.should_send_preview()
+            kind = None
+            if changes_only:
+                last_frame = message
+                poses = (message.pose, message.p2_pose)
+                if poses != last_poses or with_image:
+                    kind = KIND_POSE_UPDATE
+                    last_poses = poses
+                elif time.perf_counter() - last_sent_at >= heartbeat:
+                    kind = KIND_HEARTBEAT
                 else:
-                    if pose_raw == candidate_pose:
-                        candidate_count += 1
-                    else:
-                        candidate_pose = pose_raw
-                        candidate_count = 1
-
-                    if candidate_count >= SMOOTHING_STREAK:
-                        stable_pose_name = candidate_pose
-                        candidate_pose = None
-                        candidate_count = 0
-
-                # ▼▼▼▼▼ 映像送信の処理を追加 ▼▼▼▼▼
-
-                # 骨格を描画した画像を作成
-                vis_image = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR) # 表示用にBGRに戻す
-                if results.pose_landmarks:
-                    mp_drawing.draw_landmarks(
-                        vis_image,
-                        results.pose_landmarks,
-                        mp_pose.POSE_CONNECTIONS,
-                        mp_drawing.DrawingSpec(color=(245, 117, 66), thickness=2, circle_radius=2),
-                        mp_drawing.DrawingSpec(color=(245, 66, 230), thickness=2, circle_radius=2)
-                    )
-
-                # 画像をJPEG形式にエンコード
-                _, buffer = cv2.imencode('.jpg', vis_image)
-                # Base64形式の文字列に変換
-                jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-
-                # ポーズ名と画像データを一緒に送信
-                payload = {
-                    "pose": stable_pose_name,
-                    "image": jpg_as_text
-                }
-                ws.send(json.dumps(payload))
-                # ▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲▲
-
-        except Exception as e:
-            print(f"WebSocket error: {e}")
-        finally:
-            print("WebSocket disconnected.")
-            cap.release()
+                    METRICS.inc("pose_messages_suppressed")
+                    _receive_acks(ws, preview)
+                    continue
+            quality, scale = preview.level
+            seq += 1
+            sent = _send(ws, message.encode(mode, quality, scale, with_image, kind=kind, seq=seq,
+                                           skeleton=skeleton))
+            if seq == 1:
+                METRICS.observe("time_to_first_pose", time.perf_counter() - connected_at)
+            last_sent_at = time.perf_counter()
+            preview.observe_send(sent, message.frame_id if with_image else None)
+            _receive_acks(ws, preview)
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+    finally:
+        hub.unsubscribe(sub)
+        print(f"WebSocket disconnected. (sent={seq}, dropped={sub.dropped}, preview={preview.snapshot()})")
+
+def _send(ws, data):
+    """送信して所要時間（秒）を返す。"""
+    started = time.perf_counter()
+    ws.send(data)
+    sent = time.perf_counter() - started
+    METRICS.observe("ws_send", sent)
+    return sent
+
+def _receive_acks(ws, preview):
+    """クライアントから届いている {"ack": frame_id} を待たずに読み切り、RTT を更新する（msgpack / packed も可）。"""
+    while True:
+        incoming = ws.receive(timeout=0)
+        if incoming is None:
+            return
+        try:
+            frame_id = decode(incoming).get("ack")
+        except (ValueError, AttributeError):
+            continue
+        if isinstance(frame_id, int):
+            preview.observe_ack(frame_id)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "5000")))
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+ポーズの安定化（時間ベースのデバウンス + ランドマークの平滑化）
+
+生の判定結果はフレームごとにちらつくので、「同じ候補ポーズが hold 秒続いたら確定」する。
+以前のフレーム数ベース（3 フレーム続いたら確定）は FPS で遅延が変わっていた
+（30fps で 100ms、10fps だと 300ms）が、時刻で測るので FPS に依らず同じ遅延になる。
+
+- hold は「候補が最初に出てから」の秒数で、ポーズごとに変えられる（既定: 構え・移動は 60ms =
+  30fps で従来の 3 フレーム相当、攻撃は 30ms = 2 フレーム相当）。攻撃は素早く切り替え、構えは慎重に確定する。
+- 分類の前に、33 点のランドマークへまとめて One-Euro / EMA フィルタを任意でかけられる
+  （NumPy の1回の演算で全点を処理する）。
+- 足した遅延（候補が最初に出てから確定までの時間、フィルタの遅れの目安）を /metrics の
+  stabilizer_delay / landmark_filter_lag に記録し、last_delay / last_filter_lag でも読める。
+
+使い方例:
+    stabilizer = PoseStabilizer(StabilizerConfig(filter="one_euro"))
+    stable = stabilizer.update_results(results, time.perf_counter())   # MediaPipe の results から
+    stable = stabilizer.update_array(arr, t)                            # (33, 4) 配列から
+    stable = stabilizer.update("PUNCH", t)                              # 判定済みのポーズ名から
+
+環境変数（StabilizerConfig.from_env）:
+    POSE_HOLD_MS=60 POSE_ATTACK_HOLD_MS=30 POSE_FILTER=one_euro|ema|none
+
+backend/ と fighting-game-pose/ に同じ内容で置いている（pose_logic.py と同様）。
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Mapping, Optional
+
+import numpy as np
+
+from metrics import METRICS
+from pose_logic import PROFILES, classify_pose_from_landmarks, classify_pose_from_results, landmarks_to_array
+
+ATTACK_POSES = ("PUNCH", "KICK", "CROUCH_PUNCH", "CROUCH_KICK")
+FILTERS = ("none", "ema", "one_euro")
+
+
+def _attack_holds() -> Dict[str, float]:
+    return {name: 0.03 for name in ATTACK_POSES}
+
+
+@dataclass(frozen=True)
+class StabilizerConfig:
+    # 候補ポーズがこの秒数続いたら確定する（hold_by_pose に無いポーズ）
+    hold: float = 0.06
+    # ポーズごとの確定時間（既定では攻撃だけ短い）
+    hold_by_pose: Mapping[str, float] = field(default_factory=_attack_holds)
+    # 分類前のランドマークフィルタ: "none" / "ema" / "one_euro"
+    filter: str = "none"
+    # EMA の時定数（秒）。フレーム間隔から係数を決めるので FPS に依らない
+    ema_tau: float = 0.05
+    # One-Euro: 静止時のカットオフ [Hz]、速度に応じた増分、速度推定のカットオフ [Hz]
+    min_cutoff: float = 2.0
+    beta: float = 5.0
+    d_cutoff: float = 1.0
+
+    def hold_for(self, pose) -> float:
+        return self.hold_by_pose.get(pose, self.hold)
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None) -> "StabilizerConfig":
+        """POSE_HOLD_MS / POSE_ATTACK_HOLD_MS / POSE_FILTER から作る。未指定は既定値。"""
+        env = os.environ if environ is None else environ
+        d = cls()
+        hold = float(env["POSE_HOLD_MS"]) / 1000.0 if env.get("POSE_HOLD_MS") else d.hold
+        holds = dict(d.hold_by_pose)
+        if env.get("POSE_ATTACK_HOLD_MS"):
+            holds = {name: float(env["POSE_ATTACK_HOLD_MS"]) / 1000.0 for name in ATTACK_POSES}
+        kind = env.get("POSE_FILTER", d.filter).lower()
+        if kind not in FILTERS:
+            raise ValueError(f"unknown POSE_FILTER: {kind!r} (expected one of {FILTERS})")
+        return cls(hold=hold, hold_by_pose=holds, filter=kind)
+
+
+class _Point:
+    """配列の1行を landmark のように見せる（1フレームの分類は配列版よりランドマーク版のほうが速い）。"""
+
+    __slots__ = ("x", "y", "z", "visibility")
+
+    def __init__(self, x: float, y: float, z: float, visibility: float):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.visibility = visibility
+
+
+def _alpha(cutoff, dt: float):
+    """カットオフ周波数 [Hz] とサンプル間隔 [s] から一次ローパスの係数を求める（配列可）。"""
+    tau = 1.0 / (2.0 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class LandmarkFilter:
+    """(33, 4) のランドマーク配列の x, y, z を時間方向に平滑化する（visibility はそのまま）。
+
+    全点を1つの配列として扱うので、1フレームあたり NumPy の数回の演算で済む。
+    人物が消えた（NaN の）フレームで状態をリセットし、次に見つかったフレームから始め直す。
+    """
+
+    def __init__(self, config: StabilizerConfig):
+        if config.filter not in FILTERS:
+            raise ValueError(f"unknown filter: {config.filter!r} (expected one of {FILTERS})")
+        self.config = config
+        self.last_lag = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        self._t: Optional[float] = None
+        self._x: Optional[np.ndarray] = None
+        self._dx: Optional[np.ndarray] = None
+
+    def __call__(self, landmarks: np.ndarray, t: float) -> np.ndarray:
+        c = self.config
+        if c.filter == "none":
+            return landmarks
+        x = np.asarray(landmarks, dtype=np.float64)[:, :3]
+        if np.isnan(x).any():
+            self.reset()
+            return landmarks
+        if self._x is None or t <= self._t:
+            self._t, self._x, self._dx = t, x.copy(), np.zeros_like(x)
+            return landmarks
+        dt = t - self._t
+        self._t = t
+        if c.filter == "ema":
+            a = 1.0 - math.exp(-dt / c.ema_tau)
+        else:
+            # One-Euro: 速く動いている点ほどカットオフを上げて遅れを減らす
+            self._dx += _alpha(c.d_cutoff, dt) * ((x - self._x) / dt - self._dx)
+            a = _alpha(c.min_cutoff + c.beta * np.abs(self._dx), dt)
+        self._x += a * (x - self._x)
+        # 一次ローパスの遅れの目安 dt * (1 - a) / a（全点の平均）
+        self.last_lag = float(np.mean(dt * (1.0 - a) / a))
+        METRICS.observe("landmark_filter_lag", self.last_lag)
+        out = np.array(landmarks, dtype=np.float32)
+        out[:, :3] = self._x
+        return out
+
+
+class PoseStabilizer:
+    """候補ポーズが StabilizerConfig.hold_for(候補) 秒続いたら確定ポーズにする。
+
+    時刻は単調増加の秒（time.perf_counter() やフレームのキャプチャ時刻）。hold が 0 なら即確定。
+    last_delay は直近の確定で足した遅延（候補が最初に出てから確定までの秒）。
+    分類のしきい値はフレームごとに pose_logic.PROFILES の profile（"P1" など。無ければ default）から引く。
+    """
+
+    def __init__(self, config: Optional[StabilizerConfig] = None, initial="IDLE", profile: Optional[str] = None):
+        self.config = config or StabilizerConfig()
+        self.profile = profile
+        self.filter = LandmarkFilter(self.config)
+        self.stable = initial
+        self.last_delay = 0.0
+        self._candidate = None
+        self._since = 0.0
+
+    @property
+    def last_filter_lag(self) -> float:
+        return self.filter.last_lag
+
+    def update(self, pose, t: float):
+        """判定済みのポーズを入れ、確定ポーズを返す。"""
+        if pose == self.stable:
+            self._candidate = None
+            return self.stable
+        if pose != self._candidate:
+            self._candidate = pose
+            self._since = t
+        if t - self._since >= self.config.hold_for(pose):
+            self.stable = pose
+            self.last_delay = t - self._since
+            self._candidate = None
+            METRICS.observe("stabilizer_delay", self.last_delay)
+        return self.stable
+
+    def update_array(self, landmarks: Optional[np.ndarray], t: float):
+        """(33, 4) 配列（人物なしは None）をフィルタ → 分類 → 安定化する。"""
+        if landmarks is None:
+            self.filter.reset()
+            return self.update("IDLE", t)
+        filtered = self.filter(landmarks, t)
+        with METRICS.timer("classify"):
+            pose = classify_pose_from_landmarks([_Point(*row) for row in filtered.tolist()], PROFILES.get(self.profile))
+        return self.update(pose, t)
+
+    def update_results(self, results, t: float):
+        """MediaPipe の results から。フィルタ無しなら従来どおりランドマークのまま分類する。"""
+        if self.config.filter == "none":
+            with METRICS.timer("classify"):
+                pose = classify_pose_from_results(results, PROFILES.get(self.profile))
+            return self.update(pose, t)
+        landmarks = getattr(results, "pose_landmarks", None)
+        return self.update_array(landmarks_to_array(landmarks.landmark) if landmarks else None, t)
@@ -0,0 +1,215 @@
+"""
+映像ソースの抽象化（Webカメラ / 動画ファイル / 合成映像）
+
+カメラの無いヘッドレス環境でも、パイプライン全体を負荷試験・プロファイルできるようにする。
+
+使い方例:
+    source = open_source("camera:0")                        # Webカメラ（cv2.VideoCapture(0)）
+    source = open_source("file:match.mp4", pacing="max")    # 動画ファイルを最高速で
+    source = open_source("synthetic:640x480", pacing="30")  # 合成映像を 30fps 固定で
+    with source:
+        while source.is_opened():
+            ok, frame = source.read()   # frame は BGR の np.ndarray
+            if not ok:
+                break
+
+ソース指定 (spec):
+    camera[:<index>]               既定は camera:0
+    file:<path>                    OpenCV が読める動画ファイル
+    synthetic[:<幅>x<高さ>]         動く図形を描いた合成フレーム（既定 640x480）
+
+ペース (pacing):
+    "realtime"  ソース本来の速さ（ファイルは動画の FPS、合成は 30fps）。カメラは常にカメラの速さ
+    "max"       待たずにできるだけ速く
+    "<数値>"    その FPS に固定（例: "15"）
+ペース配分は絶対時刻のスケジュールで行うので、長時間流しても遅れが積み上がらない。
+
+server.py / pose_test.py は環境変数 POSE_SOURCE / POSE_SOURCE_PACING / POSE_SOURCE_LOOP で切り替える。
+backend/ と fighting-game-pose/ に同じ内容で置いている（pose_logic.py と同様）。
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class Pacer:
+    """一定間隔でフレームを出すためのタイマー。interval=0 なら待たない。"""
+
+    def __init__(self, fps: Optional[float]):
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self._next: Optional[float] = None
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self._next is None:
+            self._next = now
+        delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.interval:
+            # 1フレーム以上遅れたら（処理落ち・一時停止）スケジュールを今に合わせ直す
+            self._next = now
+        self._next += self.interval
+
+
+def _parse_pacing(pacing: str, native_fps: Optional[float]) -> Optional[float]:
+    """pacing 文字列を FPS（None/0 は待たない）に変換する。"""
+    pacing = (pacing or "realtime").strip().lower()
+    if pacing == "max":
+        return None
+    if pacing == "realtime":
+        return native_fps
+    return float(pacing)
+
+
+class VideoSource:
+    """映像ソースの共通インターフェース。read() は (成功したか, BGR画像) を返す。"""
+
+    fps: Optional[float] = None
+
+    def is_opened(self) -> bool:
+        raise NotImplementedError
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def release(self) -> None:
+        pass
+
+    def __enter__(self) -> "VideoSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class CameraSource(VideoSource):
+    """Webカメラ。ペースはカメラ自身が決めるので pacing は使わない。"""
+
+    def __init__(self, index: int = 0, width: Optional[int] = None, height: Optional[int] = None,
+                 api: Optional[int] = None):
+        import cv2
+        self._cap = cv2.VideoCapture(index) if api is None else cv2.VideoCapture(index, api)
+        if width:
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or None
+
+    def is_opened(self) -> bool:
+        return self._cap.isOpened()
+
+    def read(self):
+        return self._cap.read()
+
+    def release(self) -> None:
+        self._cap.release()
+
+
+class FileSource(VideoSource):
+    """動画ファイル。loop=True なら終端で先頭に戻る。"""
+
+    def __init__(self, path: str, pacing: str = "realtime", loop: bool = False):
+        import cv2
+        self._cv2 = cv2
+        self.path = path
+        self.loop = loop
+        self._cap = cv2.VideoCapture(path)
+        native = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.fps = _parse_pacing(pacing, native)
+        self._pacer = Pacer(self.fps)
+
+    def is_opened(self) -> bool:
+        return self._cap.isOpened()
+
+    def read(self):
+        ok, frame = self._cap.read()
+        if not ok and self.loop:
+            self._cap.set(self._cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._cap.read()
+        if ok:
+            self._pacer.wait()
+        return ok, frame
+
+    def release(self) -> None:
+        self._cap.release()
+
+
+class SyntheticSource(VideoSource):
+    """合成映像。背景の上を四角形が動く。frames を指定するとその枚数で終わる。
+
+    フレームは毎回新しい配列を返す（後段が骨格を描き込んでもソース側は汚れない）。
+    """
+
+    NATIVE_FPS = 30.0
+
+    def __init__(self, width: int = 640, height: int = 480, pacing: str = "realtime",
+                 frames: Optional[int] = None):
+        self.width = width
+        self.height = height
+        self.fps = _parse_pacing(pacing, self.NATIVE_FPS)
+        self._pacer = Pacer(self.fps)
+        self._remaining = frames
+        self._n = 0
+        self._opened = True
+        # 背景は1回だけ作る（縦方向のグラデーション）
+        ramp = np.linspace(40, 200, height, dtype=np.uint8)[:, None]
+        self._background = np.repeat(np.repeat(ramp, width, axis=1)[:, :, None], 3, axis=2)
+
+    def is_opened(self) -> bool:
+        return self._opened
+
+    def read(self):
+        if not self._opened or self._remaining == 0:
+            return False, None
+        if self._remaining is not None:
+            self._remaining -= 1
+        self._pacer.wait()
+        frame = self._background.copy()
+        size = max(8, min(self.width, self.height) // 6)
+        x = (self._n * 7) % max(1, self.width - size)
+        y = (self.height - size) // 2
+        frame[y:y + size, x:x + size] = (60, 180, 240)
+        self._n += 1
+        return True, frame
+
+    def release(self) -> None:
+        self._opened = False
+
+
+def open_source(spec: str = "camera:0", pacing: str = "realtime", loop: bool = False,
+                width: Optional[int] = None, height: Optional[int] = None,
+                api: Optional[int] = None) -> VideoSource:
+    """spec 文字列から映像ソースを作る（書式はモジュールの説明を参照）。"""
+    kind, _, arg = (spec or "camera:0").partition(":")
+    kind = kind.strip().lower()
+    if kind == "camera":
+        return CameraSource(int(arg or 0), width=width, height=height, api=api)
+    if kind == "file":
+        if not arg:
+            raise ValueError("file source needs a path: file:<path>")
+        return FileSource(arg, pacing=pacing, loop=loop)
+    if kind == "synthetic":
+        if arg:
+            w, _, h = arg.lower().partition("x")
+            width, height = int(w), int(h)
+        return SyntheticSource(width or 640, height or 480, pacing=pacing)
+    raise ValueError(f"unknown video source: {spec!r}")
+
+
+def source_from_env(environ=None, **kwargs) -> VideoSource:
+    """環境変数 POSE_SOURCE / POSE_SOURCE_PACING / POSE_SOURCE_LOOP から映像ソースを作る。"""
+    import os
+    env = os.environ if environ is None else environ
+    return open_source(
+        env.get("POSE_SOURCE", "camera:0"),
+        pacing=env.get("POSE_SOURCE_PACING", "realtime"),
+        loop=env.get("POSE_SOURCE_LOOP", "0") not in ("", "0", "false"),
+        **kwargs,
+    )
@@ -159,4 +159,122 @@ function classifyPoseFromLandmarks(landmarks) {
     }
 
     return "IDLE";
+}
+// --- ランドマークの量子化バイナリ (backend/landmark_codec.py と同じ形式) ---
+// MAGIC(0x4C) + flags(bit0: 人物あり) + 33x4 の int16 (x, y, z, visibility を 8192 倍、リトルエンディアン)
+// サーバーに分類させるときに送る。JSON より約 10 分の1 (266 バイト)
+const LANDMARK_MAGIC = 0x4C;
+const LANDMARK_SCALE = 8192;
+
+function encodeLandmarks(landmarks) {
+    if (!landmarks || landmarks.length === 0) {
+        return new Uint8Array([LANDMARK_MAGIC, 0]).buffer;
+    }
+    const buffer = new ArrayBuffer(2 + 33 * 4 * 2);
+    const view = new DataView(buffer);
+    view.setUint8(0, LANDMARK_MAGIC);
+    view.setUint8(1, 1);
+    const q = (v) => Math.max(-32768, Math.min(32767, Math.round((v ?? 0) * LANDMARK_SCALE)));
+    for (let i = 0; i < 33; i++) {
+        const lm = landmarks[i] ?? {};
+        const offset = 2 + i * 8;
+        view.setInt16(offset, q(lm.x), true);
+        view.setInt16(offset + 2, q(lm.y), true);
+        view.setInt16(offset + 4, q(lm.z), true);
+        view.setInt16(offset + 6, q(lm.visibility ?? 1.0), true);
+    }
+    return buffer;
+}
+
+// --- WebSocket のメッセージ形式 (backend/wire_codec.py と同じ) ---
+// new WebSocket(url, ['gafa.packed', 'gafa.json']) で packed を選ぶと、サーバーからはバイナリで届く。
+// 先頭 1 バイトがメッセージの種類 (タグ)、続く uint32 が seq。列挙は番号で送られる (順番は wire_codec.py と揃える)
+const WIRE_SUBPROTOCOL_PACKED = 'gafa.packed';
+const WIRE_POSES = ["IDLE", "PUNCH", "KICK", "GUARD", "FORWARD", "BACKWARD",
+    "STAND", "CROUCH", "CROUCH_PUNCH", "CROUCH_KICK", "CROUCH_GUARD"];
+const WIRE_PLAYERS = ["P1", "P2", "DRAW"];
+const WIRE_PLAYER_STATUSES = ["attacking", "defending", "idle", "damaged", "moving_forward", "moving_backward",
+    "crouching", "crouch_attacking", "crouch_defending", "attack_canceling"];
+const WIRE_GAME_STATUSES = ["playing", "paused", "finished"];
+const WIRE_EVENTS = ["hit", "block", "ko", "round_start", "round_end", "player_moved", "stance_changed",
+    "movement_canceled", "combo_attack"];
+const WIRE_EVENT_FIELDS = [
+    ["player", WIRE_PLAYERS], ["attacker", WIRE_PLAYERS], ["target", WIRE_PLAYERS], ["winner", WIRE_PLAYERS],
+    ["damage", null],
+    ["effect", ["normal", "critical", "blocked", "crouch_hit", "cancel_combo", "crouch_blocked"]],
+    ["attack_type", ["punch", "kick", "crouch_punch", "crouch_kick"]],
+    ["movement", ["forward", "backward", "crouch", "stand"]],
+];
+const WIRE_FRAME_KINDS = { 2: null, 3: "pose_update", 4: "heartbeat" };
+
+// テキストは JSON、バイナリ (ArrayBuffer) は packed として、サーバーの JSON と同じ形のオブジェクトに戻す
+function decodeMessage(data) {
+    if (typeof data === 'string') return JSON.parse(data);
+    const view = new DataView(data);
+    const tag = view.getUint8(0);
+    const seq = view.getUint32(1, true);
+    const json = (offset) => JSON.parse(new TextDecoder().decode(new Uint8Array(data, offset)));
+    let message;
+    if (tag === 0x05) {
+        const player = (o) => ({
+            health: view.getInt16(o, true), pose: WIRE_POSES[view.getUint8(o + 2)],
+            position: { x: view.getInt16(o + 3, true) / 10, y: view.getInt16(o + 5, true) },
+            status: WIRE_PLAYER_STATUSES[view.getUint8(o + 7)],
+        });
+        message = {
+            type: "game_state", player1: player(21), player2: player(29),
+            game_timer: view.getUint16(17, true) / 10, round_number: view.getUint8(19),
+            game_status: WIRE_GAME_STATUSES[view.getUint8(20)],
+            tick: view.getUint32(5, true), timestamp: Number(view.getBigInt64(9, true)),
+        };
+    } else if (tag === 0x06) {
+        message = { type: "game_event", event: WIRE_EVENTS[view.getUint8(5)] };
+        const present = view.getUint8(6);
+        // player / attacker / target / winner (uint8 x 4)、damage (int16)、effect / attack_type / movement (uint8 x 3)
+        const offsets = [7, 8, 9, 10, 11, 13, 14, 15];
+        WIRE_EVENT_FIELDS.forEach(([name, names], bit) => {
+            if (!(present & (1 << bit))) return;
+            message[name] = names ? names[view.getUint8(offsets[bit])] : view.getInt16(offsets[bit], true);
+        });
+        message.timestamp = Number(view.getBigInt64(16, true));
+    } else if (tag in WIRE_FRAME_KINDS) {
+        message = WIRE_FRAME_KINDS[tag] ? { type: WIRE_FRAME_KINDS[tag] } : {};
+        const p2 = view.getUint8(6);
+        if (p2 === 0xFF) {
+            message.pose = WIRE_POSES[view.getUint8(5)];
+        } else {
+            message.p1_pose = WIRE_POSES[view.getUint8(5)];
+            message.p2_pose = WIRE_POSES[p2];
+        }
+        message.frame_id = view.getUint32(7, true);
+        const timestamp = Number(view.getBigInt64(11, true));
+        if (timestamp >= 0) message.timestamp = timestamp;
+        const imageSize = view.getUint32(19, true);
+        // 画像は JPEG のバイト列 (Blob にして表示する)
+        if (imageSize > 0) message.image = new Uint8Array(data, 23, imageSize);
+    } else if (tag === 0x07) {
+        message = { type: "pose_detected", pose: WIRE_POSES[view.getUint8(5)] };
+        const timestamp = Number(view.getBigInt64(6, true));
+        if (timestamp >= 0) message.timestamp = timestamp;
+    } else if (tag === 0x08) {
+        message = { type: "error", ...json(5) };
+    } else if (tag === 0x01) {
+        message = json(5);
+    } else {
+        throw new Error(`unknown message tag ${tag}`);
+    }
+    if (seq) message.seq = seq;
+    return message;
+}
+
+// 確定ポーズを packed の pose_detected (14 バイト) にする。列挙に無いポーズは JSON で送る
+function encodePoseDetected(pose, timestamp) {
+    const code = WIRE_POSES.indexOf(pose);
+    if (code < 0) return JSON.stringify({ pose });
+    const buffer = new ArrayBuffer(14);
+    const view = new DataView(buffer);
+    view.setUint8(0, 0x07);
+    view.setUint8(5, code);
+    view.setBigInt64(6, BigInt(Math.round(timestamp ?? -1)), true);
+    return buffer;
 }
\ No newline at end of file
@@ -20,6 +20,10 @@ const poseColors = {
 };
 
 let ws = null, wsStatusEl = null, useTestEndpoint = false;  // テスト用エンドポイント切り替え
+// ?send=landmarks でページを開くと、ポーズ名の代わりにランドマークを毎フレーム送り、サーバーに分類させる
+const sendLandmarks = new URLSearchParams(window.location.search).get('send') === 'landmarks';
+// ?codec=packed でページを開くと、サーバーとのメッセージを packed（ポーズ 1 バイトの固定幅バイナリ）にする
+const usePacked = new URLSearchParams(window.location.search).get('codec') === 'packed';
 
 
 // MediaPipeの初期化処理
@@ -47,7 +51,9 @@ function connectWS() {
   const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
   const wsUrl = protocol + '//' + window.location.host + endpoint;
 
-  ws = new WebSocket(wsUrl);
+  // 希望順にサブプロトコルを並べる（packed を扱えないサーバーなら JSON になる。ws.protocol で分かる）
+  ws = usePacked ? new WebSocket(wsUrl, [WIRE_SUBPROTOCOL_PACKED, 'gafa.json']) : new WebSocket(wsUrl);
+  ws.binaryType = 'arraybuffer';
   if (!wsStatusEl) wsStatusEl = document.getElementById('ws_status');
   if (wsStatusEl) wsStatusEl.textContent = `WS: connecting... (${wsUrl})`;
   ws.onopen = () => {
@@ -61,7 +67,7 @@ function connectWS() {
   };
   ws.onmessage = (ev) => {
     try {
-      const data = JSON.parse(ev.data);
+      const data = decodeMessage(ev.data);
       if (data.pose) {
         currentPose = data.pose;
       }
@@ -136,6 +142,10 @@ function draw() {
   if (poseLandmarker && video.elt.readyState === 4) {
     const startTimeMs = performance.now();
     poseLandmarker.detectForVideo(video.elt, startTimeMs, (result) => {
+      if (sendLandmarks && ws && ws.readyState === WebSocket.OPEN) {
+        // 量子化バイナリで送る（人物がいなければ 2 バイトの「なし」）。判定はサーバーの pose_logic.py
+        ws.send(encodeLandmarks(result.landmarks?.[0]));
+      }
       if (result.landmarks && result.landmarks.length > 0) {
         // サーバーにある pose_logic.py のロジックをJSに移植
         const pose = classifyPoseFromLandmarks(result.landmarks[0]);
@@ -144,9 +154,11 @@ function draw() {
           currentPose = pose;
           lastPose = pose;
           lastPoseTimestamp = Date.now();
-          if (ws && ws.readyState === WebSocket.OPEN) {
+          if (!sendLandmarks && ws && ws.readyState === WebSocket.OPEN) {
             // サーバーにポーズ情報を送信！
-            ws.send(JSON.stringify({ pose: currentPose }));
+            ws.send(ws.protocol === WIRE_SUBPROTOCOL_PACKED
+              ? encodePoseDetected(currentPose, Date.now())
+              : JSON.stringify({ pose: currentPose }));
           }
         }
       }